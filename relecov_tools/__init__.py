@@ -1,5 +1,11 @@
 """Main relecov package file."""
 
-import pkg_resources
+try:
+    import importlib.metadata as importlib_metadata
+except ImportError:
+    # python < 3.8, slower but the only option there
+    import pkg_resources
 
-__version__ = pkg_resources.get_distribution("relecov_tools").version
+    __version__ = pkg_resources.get_distribution("relecov_tools").version
+else:
+    __version__ = importlib_metadata.version("relecov_tools")
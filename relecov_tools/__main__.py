@@ -7,29 +7,16 @@ from datetime import datetime
 
 # from rich.prompt import Confirm
 import click
-import relecov_tools.config_json
-import relecov_tools.download_manager
-import relecov_tools.log_summary
 import rich.console
 import rich.traceback
 
+# Modules with heavy dependencies (pandas, openpyxl, paramiko, Bio...) are
+# imported inside each command so only the executed command pays for them
 import relecov_tools.config_json
 import relecov_tools.utils
-import relecov_tools.read_lab_metadata
-import relecov_tools.download_manager
-import relecov_tools.json_validation
-import relecov_tools.mail
-import relecov_tools.map_schema
-import relecov_tools.upload_database
-import relecov_tools.read_bioinfo_metadata
-import relecov_tools.metadata_homogeneizer
-import relecov_tools.gisaid_upload
-import relecov_tools.upload_ena_protocol
-import relecov_tools.pipeline_manager
-import relecov_tools.build_schema
-import relecov_tools.dataprocess_wrapper
-import relecov_tools.upload_results
+import relecov_tools.log_summary
 import relecov_tools.base_module
+import relecov_tools.profiler
 
 log = logging.getLogger()
 
@@ -141,8 +128,20 @@ class CustomHelpOrder(click.Group):
     default=None,
     help="Define hexadecimal code. This might overwrite existing files with the same hex-code",
 )
+@click.option(
+    "--profile",
+    is_flag=True,
+    default=False,
+    help="Save time, I/O, memory and calls of the main steps to a json file in the log folder",
+)
+@click.option(
+    "--cprofile",
+    is_flag=True,
+    default=False,
+    help="Also dump cProfile stats next to the profile json. Requires --profile",
+)
 @click.pass_context
-def relecov_tools_cli(ctx, verbose, log_path, debug, hex_code):
+def relecov_tools_cli(ctx, verbose, log_path, debug, hex_code, profile, cprofile):
     if debug:
         # Set the base logger to output everything
         level = logging.DEBUG
@@ -198,6 +197,14 @@ def relecov_tools_cli(ctx, verbose, log_path, debug, hex_code):
     relecov_tools.base_module.BaseModule._current_version = __version__
     ctx.ensure_object(dict)  # Asegura que ctx.obj es un diccionario
     ctx.obj["debug"] = debug  # Guarda el flag de debug
+    if profile:
+        profiler = relecov_tools.profiler.StageProfiler(cli_command, cprofile=cprofile)
+        relecov_tools.base_module.BaseModule._profiler = profiler
+        profile_path = log_filepath.replace(".log", "_profile.json")
+        # Saved once the command finishes, even if it fails
+        ctx.call_on_close(lambda: profiler.save(profile_path))
+    elif cprofile:
+        log.warning("--cprofile is only used together with --profile")
 
 
 # sftp
@@ -241,6 +248,26 @@ def relecov_tools_cli(ctx, verbose, log_path, debug, hex_code):
     default="RELECOV",
     help="Flag: Specify which subfolder to process (default: RELECOV)",
 )
+@click.option(
+    "-w",
+    "--workers",
+    type=int,
+    default=None,
+    help="Number of files downloaded in parallel. Uses transfer_workers in config if empty",
+)
+@click.option(
+    "-W",
+    "--folder_workers",
+    type=int,
+    default=None,
+    help="Number of lab folders processed in parallel. Uses folder_workers in config if empty",
+)
+@click.option(
+    "--sync",
+    is_flag=True,
+    default=False,
+    help="Only download files that are new or changed compared to local batches of the same lab",
+)
 @click.pass_context
 def download(
     ctx,
@@ -251,8 +278,13 @@ def download(
     output_location,
     target_folders,
     subfolder,
+    workers,
+    folder_workers,
+    sync,
 ):
     """Download files located in sftp server."""
+    import relecov_tools.download_manager
+
     debug = ctx.obj.get("debug", False)
     try:
         download_manager = relecov_tools.download_manager.DownloadManager(
@@ -263,6 +295,9 @@ def download(
             output_location,
             target_folders,
             subfolder,
+            workers,
+            folder_workers,
+            sync,
         )
         download_manager.execute_process()
     except Exception as e:
@@ -302,6 +337,8 @@ def read_lab_metadata(ctx, metadata_file, sample_list_file, metadata_out, files_
     """
     Create the json compliant to the relecov schema from the Metadata file.
     """
+    import relecov_tools.read_lab_metadata
+
     debug = ctx.obj.get("debug", False)
     new_metadata = relecov_tools.read_lab_metadata.RelecovMetadata(
         metadata_file, sample_list_file, metadata_out, files_folder
@@ -348,6 +385,8 @@ def validate(
     ctx, json_file, json_schema_file, metadata, out_folder, excel_sheet, registry
 ):
     """Validate json file against schema."""
+    import relecov_tools.json_validation
+
     debug = ctx.obj.get("debug", False)
     validation = relecov_tools.json_validation.SchemaValidation(
         json_file,
@@ -424,6 +463,8 @@ def send_mail(
     """
     Send a sample validation report by mail.
     """
+    import relecov_tools.mail
+
     debug = ctx.obj.get("debug", False)
     config_loader = relecov_tools.config_json.ConfigJson(extra_config=True)
     config = config_loader.get_configuration("mail_sender")
@@ -549,6 +590,8 @@ def send_mail(
 @click.pass_context
 def map(ctx, origin_schema, json_data, destination_schema, schema_file, output):
     """Convert data between phage plus schema to ENA, GISAID, or any other schema"""
+    import relecov_tools.map_schema
+
     debug = ctx.obj.get("debug", False)
     new_schema = relecov_tools.map_schema.MappingSchema(
         origin_schema, json_data, destination_schema, schema_file, output
@@ -595,6 +638,8 @@ def upload_to_ena(
     output_path,
 ):
     """parse data to create xml files to upload to ena"""
+    import relecov_tools.upload_ena_protocol
+
     debug = ctx.obj.get("debug", False)
     upload_ena = relecov_tools.upload_ena_protocol.EnaUpload(
         user=user,
@@ -671,6 +716,8 @@ def upload_to_gisaid(
     gzip,
 ):
     """parsed data to create files to upload to gisaid"""
+    import relecov_tools.gisaid_upload
+
     debug = ctx.obj.get("debug", False)
     upload_gisaid = relecov_tools.gisaid_upload.GisaidUpload(
         user,
@@ -731,6 +778,8 @@ def upload_to_gisaid(
 @click.pass_context
 def update_db(ctx, user, password, json, type, platform, server_url, full_update):
     """upload the information included in json file to the database"""
+    import relecov_tools.upload_database
+
     debug = ctx.obj.get("debug", False)
     update_database_obj = relecov_tools.upload_database.UpdateDatabase(
         user, password, json, type, platform, server_url, full_update
@@ -767,6 +816,8 @@ def read_bioinfo_metadata(ctx, json_file, input_folder, out_dir, software_name,
     """
     Create the json compliant  from the Bioinfo Metadata.
     """
+    import relecov_tools.read_bioinfo_metadata
+
     debug = ctx.obj.get("debug", False)
     new_bioinfo_metadata = relecov_tools.read_bioinfo_metadata.BioinfoMetadata(
         json_file,
@@ -803,6 +854,8 @@ def read_bioinfo_metadata(ctx, json_file, input_folder, out_dir, software_name,
 @click.pass_context
 def metadata_homogeneizer(ctx, institution, directory, output):
     """Parse institution metadata lab to the one used in relecov"""
+    import relecov_tools.metadata_homogeneizer
+
     debug = ctx.obj.get("debug", False)
     new_parse = relecov_tools.metadata_homogeneizer.MetadataHomogeneizer(
         institution, directory, output
@@ -851,6 +904,8 @@ def pipeline_manager(ctx, input, templates_root, output, config, folder_names):
     Create the symbolic links for the samples which are validated to prepare for
     bioinformatics pipeline execution.
     """
+    import relecov_tools.pipeline_manager
+
     debug = ctx.obj.get("debug", False)
     new_launch = relecov_tools.pipeline_manager.PipelineManager(
         input, templates_root, output, config, folder_names
@@ -916,6 +971,8 @@ def build_schema(
     non_interactive,
 ):
     """Generates and updates JSON Schema files from Excel-based database definitions."""
+    import relecov_tools.build_schema
+
     debug = ctx.obj.get("debug", False)
     # Build new schema
     try:
@@ -1037,6 +1094,8 @@ def logs_to_excel(ctx, lab_code, output_folder, files):
 @click.pass_context
 def wrapper(ctx, config_file, output_folder):
     """Executes the modules in config file sequentially"""
+    import relecov_tools.dataprocess_wrapper
+
     debug = ctx.obj.get("debug", False)
     process_wrapper = relecov_tools.dataprocess_wrapper.ProcessWrapper(
         config_file=config_file, output_folder=output_folder
@@ -1067,6 +1126,8 @@ def wrapper(ctx, config_file, output_folder):
 @click.pass_context
 def upload_results(ctx, user, password, batch_id, template_path, project):
     """Upload batch results to sftp server."""
+    import relecov_tools.upload_results
+
     debug = ctx.obj.get("debug", False)
     upload_sftp = relecov_tools.upload_results.UploadSftp(
         user, password, batch_id, template_path, project
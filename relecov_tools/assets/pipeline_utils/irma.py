@@ -273,6 +273,10 @@ def handle_consensus_fasta(files_list, file_tag, output_folder=None):
 
     consensus_data_processed = {}
     missing_consens = []
+    # Hash all consensus files at once, missing ones are reported below
+    consensus_md5 = relecov_tools.utils.calculate_md5_batch(
+        files_list, ignore_errors=True
+    )
     for consensus_file in files_list:
         sequence_names = []
         genome_length = 0
@@ -291,7 +295,7 @@ def handle_consensus_fasta(files_list, file_tag, output_folder=None):
             "genome_length": genome_length,
             "sequence_filepath": os.path.dirname(consensus_file),
             "sequence_filename": sample_key,
-            "sequence_md5": relecov_tools.utils.calculate_md5(consensus_file),
+            "sequence_md5": consensus_md5[consensus_file],
         }
     # Report missing consensus
     conserrs = len(missing_consens)
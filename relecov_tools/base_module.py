@@ -1,3 +1,4 @@
+import functools
 import logging
 import os
 import shutil
@@ -20,6 +21,31 @@ class BaseModule:
     _active_process = False
     _current_version = None
     _cli_command = None
+    # relecov_tools.profiler.StageProfiler, activated via CLI using --profile
+    _profiler = None
+    # Main methods of each module measured when profiling
+    profiled_methods = []
+
+    def __init_subclass__(cls, **kwargs):
+        """Wrap the methods listed in profiled_methods of every module"""
+        super().__init_subclass__(**kwargs)
+        for method_name in cls.__dict__.get("profiled_methods", []):
+            method = getattr(cls, method_name)
+            setattr(cls, method_name, BaseModule.profile_method(cls, method))
+
+    @staticmethod
+    def profile_method(cls, method):
+        """Measure every call to the method when a profiler is active"""
+        stage_name = f"{cls.__name__}.{method.__name__}"
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            if BaseModule._profiler is None:
+                return method(*args, **kwargs)
+            with BaseModule._profiler.stage(stage_name):
+                return method(*args, **kwargs)
+
+        return wrapper
 
     def __init__(self, output_directory: str = None, called_module: str = None):
         """Set logs output path based on the module being executed
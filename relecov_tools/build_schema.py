@@ -10,6 +10,7 @@ import difflib
 import inspect
 
 import relecov_tools.utils
+import relecov_tools.json_schema
 import relecov_tools.assets.schema_utils.jsonschema_draft
 import relecov_tools.assets.schema_utils.metadatalab_template
 from relecov_tools.config_json import ConfigJson
@@ -28,6 +29,14 @@ stderr = rich.console.Console(
 
 
 class SchemaBuilder(BaseModule):
+    profiled_methods = [
+        "__init__",
+        "read_database_definition",
+        "build_new_schema",
+        "create_metadatalab_excel",
+        "handle_build_schema",
+    ]
+
     def __init__(
         self,
         excel_file_path=None,
@@ -1189,7 +1198,9 @@ class SchemaBuilder(BaseModule):
         database_dic = self.read_database_definition()
 
         # Verify current schema used by relecov-tools:
-        base_schema_json = relecov_tools.utils.read_json_file(self.base_schema_path)
+        base_schema_json = relecov_tools.json_schema.load_compiled_schema(
+            self.base_schema_path
+        ).get_schema()
         if not base_schema_json:
             self.log.error("Couldn't find relecov base schema.)")
             stderr.print("[red]Couldn't find relecov base schema. Exiting...)")
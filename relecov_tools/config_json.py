@@ -1,6 +1,8 @@
 #!/usr/bin/env python
+import copy
 import json
 import os
+import threading
 import yaml
 import logging
 
@@ -9,10 +11,42 @@ import relecov_tools.utils
 log = logging.getLogger(__name__)
 
 
+def build_topic_index(topic_data):
+    """Index every key found in the given topic with the value that a depth-first
+    search would return, so get_topic_data does not walk the tree on each call
+
+    Args:
+        topic_data (dict): Content of a configuration topic
+
+    Returns:
+        topic_index (dict): {key: first value found for that key}
+    """
+
+    def index_subtopic(subtopic):
+        found = {}
+        for key, val in subtopic.items():
+            found.setdefault(key, val)
+            if isinstance(val, dict):
+                for sub_key, sub_val in index_subtopic(val).items():
+                    # Nested None values are skipped by the search
+                    if sub_val is not None:
+                        found.setdefault(sub_key, sub_val)
+        return found
+
+    topic_index = index_subtopic(topic_data)
+    # Keys directly under the topic take precedence over nested ones
+    topic_index.update(topic_data)
+    return topic_index
+
+
 # pass test
 class ConfigJson:
     # TODO: Make this path configurable too
     _extra_config_path = os.path.expanduser("~/.relecov_tools/extra_config.json")
+    # Parsed configurations shared by the whole process. Keyed by the path, size
+    # and mtime of the files so changes in them are reloaded
+    _cache = {}
+    _cache_lock = threading.Lock()
 
     def __init__(
         self,
@@ -25,18 +59,62 @@ class ConfigJson:
             json_file (str, optional): config filepath.
             extra_config (bool, optional): Include content from ~/.relecov_tools/extra_config.json.
         """
-        with open(json_file, "r", encoding="utf-8") as fh:
-            self.json_data = json.load(fh)
+        self.json_file = json_file
+        self.extra_config = extra_config
+        self.load_config()
+
+    @staticmethod
+    def file_key(file_path):
+        """Return the (path, size, mtime_ns) key of the file, None if missing"""
+        try:
+            file_stat = os.stat(file_path)
+        except OSError:
+            return None
+        return (os.path.realpath(file_path), file_stat.st_size, file_stat.st_mtime_ns)
+
+    @classmethod
+    def clear_cache(cls):
+        """Forget the parsed configurations so they are read again"""
+        with cls._cache_lock:
+            cls._cache.clear()
+
+    def load_config(self):
+        """Get the configuration content from the process cache, reading the
+        files only if they are not cached or have changed since
+        """
+        cache_key = (
+            ConfigJson.file_key(self.json_file) or self.json_file,
+            self.extra_config and ConfigJson.file_key(ConfigJson._extra_config_path),
+        )
+        with ConfigJson._cache_lock:
+            cached = ConfigJson._cache.get(cache_key)
+        if cached is None:
+            cached = (self.read_config_files(), {})
+            with ConfigJson._cache_lock:
+                ConfigJson._cache[cache_key] = cached
+        # Shared between instances, get_configuration and get_topic_data
+        # return copies so callers cannot modify them
+        self.json_data, self.topic_index = cached
+        self.topic_config = list(self.json_data.keys())
+
+    def read_config_files(self):
+        """Read configuration file and additional config if required
+
+        Returns:
+            json_data (dict): Configuration content
+        """
+        with open(self.json_file, "r", encoding="utf-8") as fh:
+            json_data = json.load(fh)
 
         active_extra_conf = False
-        if extra_config:
+        if self.extra_config:
             if os.path.isfile(ConfigJson._extra_config_path):
                 try:
                     with open(
                         ConfigJson._extra_config_path, "r", encoding="utf-8"
                     ) as add_fh:
                         additional_conf = json.load(add_fh)
-                    self.json_data.update(additional_conf)
+                    json_data.update(additional_conf)
                     active_extra_conf = True
                 except (OSError, json.JSONDecodeError) as e:
                     log.warning(
@@ -53,35 +131,24 @@ class ConfigJson:
             log.debug("Running with default configuration.")
         else:
             log.debug("Loaded additional configuration.")
-        self.topic_config = list(self.json_data.keys())
+        return json_data
 
     def get_configuration(self, topic):
         """Obtain the topic configuration from json data"""
         if topic in self.topic_config:
-            return self.json_data[topic]
+            return copy.deepcopy(self.json_data[topic])
         return None
 
     def get_topic_data(self, topic, found):
         """Obtain from topic any forward items from json data"""
-
-        def get_recursive(subtopic, found):
-            if isinstance(subtopic, dict):
-                for key, val in subtopic.items():
-                    if key == found:
-                        return val
-                    elif isinstance(val, dict):
-                        result = get_recursive(val, found)
-                        if result is not None:
-                            return result
-            else:
-                return None
-
-        if topic not in self.json_data.keys():
+        if not isinstance(self.json_data.get(topic), dict):
             return None
-        if found in self.json_data[topic]:
-            return self.json_data[topic][found]
-        else:
-            return get_recursive(self.json_data[topic], found)
+        topic_index = self.topic_index.get(topic)
+        if topic_index is None:
+            topic_index = build_topic_index(self.json_data[topic])
+            with ConfigJson._cache_lock:
+                self.topic_index[topic] = topic_index
+        return copy.deepcopy(topic_index.get(found))
 
     def include_extra_config(self, config_file, config_name=None, force=False):
         """Include given file content as additional configuration for later usage.
@@ -160,6 +227,9 @@ class ConfigJson:
         relecov_tools.utils.write_json_to_file(
             additional_config, ConfigJson._extra_config_path
         )
+        # Make the new configuration visible to this and later instances
+        ConfigJson.clear_cache()
+        self.load_config()
         log.info("Finished including extra configuration")
         print("Update summary:")
         for state, changes in summary.items():
@@ -194,6 +264,8 @@ class ConfigJson:
                 additional_config, ConfigJson._extra_config_path
             )
             log.info(f"Successfully removed {config_name} from extra config")
+        ConfigJson.clear_cache()
+        self.load_config()
         print(f"Finished clearing extra config: {config_name}")
         return
 
@@ -202,7 +274,7 @@ class ConfigJson:
         if submitting_institution is None:
             log.warning("No submitting institution could be found to update lab_code")
             return
-        institutions_config = self.get_configuration("institutions_config")
+        institutions_config = self.json_data.get("institutions_config")
         if not institutions_config:
             log.warning("No institutions_config found. Could not extract lab_code")
             return
@@ -25,6 +25,15 @@ class ProcessWrapper(BaseModule):
     if you dont want to use that argument e.g.(target_folders:  ) -> (target_folders = None)
     """
 
+    profiled_methods = [
+        "__init__",
+        "exec_download",
+        "exec_read_metadata",
+        "exec_validation",
+        "process_folder",
+        "run_wrapper",
+    ]
+
     def __init__(self, config_file: str = None, output_folder: str = None):
         super().__init__(output_directory=output_folder, called_module="wrapper")
         if not os.path.isdir(str(output_folder)):
@@ -135,6 +144,11 @@ class ProcessWrapper(BaseModule):
 
         def upload_files_from_json(invalid_json, remote_dir):
             """Upload the files in a given json with samples metadata"""
+            # Names of the files already in remote_dir, get_file_list gives full paths
+            ftp_files = {
+                os.path.basename(file)
+                for file in self.download_manager.relecov_sftp.get_file_list(remote_dir)
+            }
             for sample in invalid_json:
                 local_dir = sample.get("sequence_file_path_R1")
                 # files_keys = [key for key in sample.keys() if "_file_" in key]
@@ -142,7 +156,6 @@ class ProcessWrapper(BaseModule):
                     sample.get("sequence_file_R1"),
                     sample.get("sequence_file_R2"),
                 )
-                ftp_files = self.download_manager.relecov_sftp.get_file_list(remote_dir)
                 uploaded_files = []
                 for file in sample_files:
                     if not file or file in ftp_files:
@@ -158,6 +171,7 @@ class ProcessWrapper(BaseModule):
                         self.wrapper_logsum.add_error(sample=sample, entry=err)
                     else:
                         uploaded_files.append(file)
+                        ftp_files.add(file)
             return uploaded_files
 
         local_folder = folder_logs.get("path")
@@ -1,18 +1,25 @@
 #!/usr/bin/env python
 import copy
+import heapq
 import json
 import os
 import yaml
 import warnings
 import rich.console
 import paramiko
+import queue
+import shutil
+import sqlite3
+import tempfile
+import threading
 import relecov_tools.utils
 import relecov_tools.sftp_client
-from datetime import datetime
-from itertools import islice
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 from secrets import token_hex
 from csv import writer as csv_writer, Error as CsvError
-from openpyxl import load_workbook as openpyxl_load_workbook
 from pandas import read_excel, ExcelWriter, concat
 from pandas.errors import ParserError, EmptyDataError
 from relecov_tools.config_json import ConfigJson
@@ -33,7 +40,327 @@ class MetadataError(Exception):
         super().__init__(message)
 
 
+def task_attribute(name):
+    """Create a property whose value is kept per thread while folders are being
+    processed concurrently, falling back to the value set outside of them
+
+    Args:
+        name (str): name of the attribute
+
+    Returns:
+        task_property (property): property to be defined in the class
+    """
+
+    def getter(self):
+        return getattr(self.task_state, name, self.__dict__.get(name))
+
+    def setter(self, value):
+        if getattr(self.task_state, "active", False):
+            setattr(self.task_state, name, value)
+        else:
+            self.__dict__[name] = value
+
+    return property(getter, setter)
+
+
+class TransferScheduler:
+    """Plan the order of the transfers from the remote file sizes: largest first
+    within each lab and round-robin across labs, so a single big lab does not
+    delay the rest. Also limits the number of concurrent transfers per lab and
+    globally and estimates when the downloads of each lab will be finished.
+    """
+
+    def __init__(self, max_transfers, max_lab_transfers, stream_speed):
+        """
+        Args:
+            max_transfers (int): Maximum number of concurrent transfers
+            max_lab_transfers (int): Maximum number of concurrent transfers per lab
+            stream_speed (float): Expected speed of each transfer in Mbytes/s
+        """
+        self.max_transfers = max(int(max_transfers), 1)
+        self.max_lab_transfers = max(int(max_lab_transfers), 1)
+        self.stream_speed = float(stream_speed) * 1048576
+        self.global_slots = threading.BoundedSemaphore(self.max_transfers)
+        self.lab_slots = defaultdict(
+            lambda: threading.BoundedSemaphore(self.max_lab_transfers)
+        )
+        self.slots_lock = threading.Lock()
+        self.file_sizes = {}
+
+    @staticmethod
+    def get_lab(folder):
+        """Labs are the first level folders in remote sftp"""
+        return folder.split("/")[0]
+
+    @staticmethod
+    def round_robin(lab_queues):
+        """Take one element of each lab queue in turns until all are empty"""
+        ordered = []
+        queues = [list(items) for items in lab_queues if items]
+        while queues:
+            ordered.extend(items.pop(0) for items in queues)
+            queues = [items for items in queues if items]
+        return ordered
+
+    def order_files(self, folder, file_list):
+        """Sort the files of a folder by remote size, largest first"""
+        sizes = self.file_sizes.get(folder, {})
+        return sorted(file_list, key=lambda fi: sizes.get(fi, 0), reverse=True)
+
+    def plan(self, folder_sizes, priority_labs=()):
+        """Order the folders to download and estimate the completion time of
+        each lab by simulating the transfers with the configured limits
+
+        Args:
+            folder_sizes (dict(str:dict(str:int))): remote size of each file in
+            each folder
+            priority_labs (list(str), optional): labs processed before the rest,
+            such as the ones deferred in a previous run
+
+        Returns:
+            folder_order (list(str)): folders in the order they should be processed
+            lab_plans (dict(str:dict)): planned folders, bytes and estimated
+            completion time for each lab
+        """
+        self.file_sizes = folder_sizes
+        lab_folders = defaultdict(list)
+        for folder, sizes in folder_sizes.items():
+            lab_folders[self.get_lab(folder)].append(folder)
+        lab_bytes = {
+            lab: sum(sum(folder_sizes[fo].values()) for fo in folders)
+            for lab, folders in lab_folders.items()
+        }
+        labs = sorted(
+            lab_folders,
+            key=lambda lab: (lab not in priority_labs, -lab_bytes[lab]),
+        )
+        for lab in labs:
+            lab_folders[lab].sort(
+                key=lambda fo: sum(folder_sizes[fo].values()), reverse=True
+            )
+        folder_order = self.round_robin(lab_folders[lab] for lab in labs)
+        lab_files = [
+            [
+                (lab, folder_sizes[fo][fi])
+                for fo in lab_folders[lab]
+                for fi in self.order_files(fo, folder_sizes[fo])
+            ]
+            for lab in labs
+        ]
+        finish_seconds = self.simulate(self.round_robin(lab_files))
+        start = datetime.now()
+        lab_plans = {}
+        for lab in labs:
+            completion = start + timedelta(seconds=finish_seconds.get(lab, 0))
+            lab_plans[lab] = {
+                "position": folder_order.index(lab_folders[lab][0]) + 1,
+                "folders": lab_folders[lab],
+                "total_bytes": lab_bytes[lab],
+                "estimated_completion": completion.strftime("%Y-%m-%d %H:%M:%S"),
+            }
+        return folder_order, lab_plans
+
+    def simulate(self, transfers):
+        """Simulate the given transfers in order with the configured limits
+
+        Args:
+            transfers (list(tuple(str, int))): lab and size of each transfer
+
+        Returns:
+            finish_seconds (dict(str:float)): seconds until each lab is finished
+        """
+        pending = list(transfers)
+        running = []
+        lab_running = defaultdict(int)
+        finish_seconds = {}
+        now = 0.0
+        while pending or running:
+            idx = 0
+            while len(running) < self.max_transfers and idx < len(pending):
+                lab, size = pending[idx]
+                if lab_running[lab] >= self.max_lab_transfers:
+                    idx += 1
+                    continue
+                pending.pop(idx)
+                lab_running[lab] += 1
+                heapq.heappush(running, (now + size / self.stream_speed, lab))
+            now, lab = heapq.heappop(running)
+            lab_running[lab] -= 1
+            finish_seconds[lab] = now
+        return finish_seconds
+
+    @contextmanager
+    def transfer_slot(self, folder):
+        """Wait until a new transfer is allowed for the lab of the folder"""
+        with self.slots_lock:
+            lab_slot = self.lab_slots[self.get_lab(folder)]
+        with lab_slot, self.global_slots:
+            yield
+
+
+class DiskAdmission:
+    """Admit downloads only while the projected usage of the disk where files
+    are stored stays under a watermark. Space of admitted folders is reserved
+    until they are finished so concurrent folders do not overcommit the disk.
+    """
+
+    def __init__(self, storage_path, watermark, compression_headroom):
+        """
+        Args:
+            storage_path (str): path where the files are downloaded
+            watermark (float): maximum fraction of the disk that can be used
+            compression_headroom (float): extra space needed to compress
+            uncompressed files, as a fraction of their size
+        """
+        self.storage_path = storage_path
+        self.watermark = float(watermark)
+        self.compression_headroom = float(compression_headroom)
+        self.reserved = {}
+        self.condition = threading.Condition()
+
+    def required_bytes(self, file_sizes):
+        """Bytes needed to download the given files and compress them if needed
+
+        Args:
+            file_sizes (dict(str:int)): remote size of each file
+
+        Returns:
+            required (int): projected bytes written in disk
+        """
+        required = 0
+        for file, size in file_sizes.items():
+            if file.endswith(".gz") or file.endswith(".bam"):
+                required += size
+            else:
+                required += int(size * (1 + self.compression_headroom))
+        return required
+
+    def fits(self, required):
+        """Check if the required bytes fit under the watermark along with the
+        ones already reserved"""
+        usage = shutil.disk_usage(self.storage_path)
+        projected = usage.used + sum(self.reserved.values()) + required
+        return projected <= usage.total * self.watermark
+
+    def admit(self, key, required):
+        """Reserve disk space for a download. If it does not fit, wait while
+        other downloads are in progress, as their reservations are released
+        once finished and usually overestimate the space they end up using
+
+        Args:
+            key (str): name of the download, used to release it later
+            required (int): bytes to reserve
+
+        Returns:
+            bool: True if admitted, False if it should be deferred
+        """
+        with self.condition:
+            while not self.fits(required):
+                if not self.reserved:
+                    return False
+                self.condition.wait()
+            self.reserved[key] = required
+            return True
+
+    def release(self, key):
+        """Release the space reserved for a finished download"""
+        with self.condition:
+            self.reserved.pop(key, None)
+            self.condition.notify_all()
+
+
+class ChecksumCatalog:
+    """Catalog of every file verified by the download module with its md5, size
+    and location, saved in a SQLite database. Used to find local copies of files
+    that are uploaded again in a new batch instead of transferring them.
+    The database is opened on first use, as its folder may not exist yet.
+    """
+
+    def __init__(self, catalog_path):
+        self.catalog_path = catalog_path
+        self.lock = threading.Lock()
+        self.connection = None
+
+    def connect(self):
+        """Open the catalog database, creating its folder and table if needed.
+        Must be called while holding the lock.
+        """
+        if self.connection is None:
+            os.makedirs(os.path.dirname(self.catalog_path), exist_ok=True)
+            self.connection = sqlite3.connect(
+                self.catalog_path, timeout=30, check_same_thread=False
+            )
+            with self.connection:
+                self.connection.execute(
+                    "CREATE TABLE IF NOT EXISTS catalog (md5 TEXT, size INTEGER, "
+                    "mtime_ns INTEGER, path TEXT, PRIMARY KEY (md5, path))"
+                )
+        return self.connection
+
+    def add_file(self, file_path, md5):
+        """Include a verified local file in the catalog"""
+        file_stat = os.stat(file_path)
+        with self.lock, self.connect():
+            self.connection.execute(
+                "INSERT OR REPLACE INTO catalog VALUES (?, ?, ?, ?)",
+                (md5, file_stat.st_size, file_stat.st_mtime_ns, file_path),
+            )
+        return
+
+    def find_copy(self, md5, size):
+        """Return the path of an unmodified local file with the given md5 and
+        size. Entries for files that were removed or changed are discarded.
+
+        Args:
+            md5 (str): md5 hexdigest of the wanted content
+            size (int): size of the wanted content in bytes
+
+        Returns:
+            file_path (str): path to a local copy. None if there is no copy
+        """
+        with self.lock:
+            rows = (
+                self.connect()
+                .execute(
+                    "SELECT path, mtime_ns FROM catalog WHERE md5 = ? AND size = ?",
+                    (md5, size),
+                )
+                .fetchall()
+            )
+        for file_path, mtime_ns in rows:
+            try:
+                file_stat = os.stat(file_path)
+                if file_stat.st_size == size and file_stat.st_mtime_ns == mtime_ns:
+                    return file_path
+            except OSError:
+                pass
+            with self.lock, self.connection:
+                self.connection.execute(
+                    "DELETE FROM catalog WHERE md5 = ? AND path = ?", (md5, file_path)
+                )
+        return None
+
+
 class DownloadManager(BaseModule):
+    # Folder being processed and sftp session used, independent for each task
+    current_folder = task_attribute("current_folder")
+    relecov_sftp = task_attribute("relecov_sftp")
+    profiled_methods = [
+        "__init__",
+        "select_target_folders",
+        "merge_subfolders",
+        "prevalidate_folders",
+        "download",
+        "download_folder",
+        "fetch_and_process_files",
+        "hash_local_files",
+        "verify_md5_checksum",
+        "compress_and_update",
+        "create_files_with_metadata_info",
+        "clean_remote_folders",
+        "execute_process",
+    ]
+
     def __init__(
         self,
         user=None,
@@ -43,8 +370,12 @@ class DownloadManager(BaseModule):
         output_location=None,
         target_folders=None,
         subfolder=None,
+        workers=None,
+        folder_workers=None,
+        sync=False,
     ):
         """Initializes the sftp object"""
+        self.task_state = threading.local()
         super().__init__(output_directory=output_location, called_module="download")
         self.log.info("Initiating download process")
         config_json = ConfigJson(extra_config=True)
@@ -108,6 +439,45 @@ class DownloadManager(BaseModule):
                 self.log.error("Output location does not exist, aborting")
                 stderr.print("[red] Output location does not exist, aborting")
                 raise FileNotFoundError(f"Output dir does not exist {output_location}")
+        if workers is None:
+            workers = config_json.get_topic_data("sftp_handle", "transfer_workers")
+        # Number of files transferred in parallel, each one over its own channel
+        self.workers = max(int(workers or 1), 1)
+        if folder_workers is None:
+            folder_workers = config_json.get_topic_data("sftp_handle", "folder_workers")
+        # Number of folders processed in parallel, each one with its own session
+        self.folder_workers = max(int(folder_workers or 1), 1)
+        # Reuse files already downloaded in previous batches of the same lab
+        self.sync = sync
+        self.transfer_journal_folder = (
+            config_json.get_topic_data("sftp_handle", "transfer_journal_folder")
+            or "transfer_journals"
+        )
+        self.catalog = ChecksumCatalog(
+            os.path.join(
+                self.platform_storage_folder,
+                config_json.get_topic_data("sftp_handle", "checksum_catalog_file")
+                or "checksum_catalog.db",
+            )
+        )
+        self.scheduler = TransferScheduler(
+            config_json.get_topic_data("sftp_handle", "max_transfers")
+            or self.workers * self.folder_workers,
+            config_json.get_topic_data("sftp_handle", "max_lab_transfers")
+            or self.workers,
+            config_json.get_topic_data("sftp_handle", "estimated_stream_speed") or 10,
+        )
+        self.disk_admission = DiskAdmission(
+            self.platform_storage_folder,
+            config_json.get_topic_data("sftp_handle", "disk_usage_watermark") or 0.9,
+            config_json.get_topic_data("sftp_handle", "compression_headroom") or 0.5,
+        )
+        # Folders not downloaded due to lack of disk space in this run
+        self.deferred_folders = []
+        self.deferred_downloads_file = (
+            config_json.get_topic_data("sftp_handle", "deferred_downloads_file")
+            or "deferred_downloads.json"
+        )
         if sftp_user is None:
             sftp_user = relecov_tools.utils.prompt_text(msg="Enter the user id")
         if isinstance(self.target_folders, str):
@@ -129,11 +499,27 @@ class DownloadManager(BaseModule):
         self.samples_json_fields = config_json.get_topic_data(
             "lab_metadata", "samples_json_fields"
         )
+        self.compute_fastq_stats = (
+            str(
+                config_json.get_topic_data("sftp_handle", "compute_fastq_stats")
+            ).lower()
+            == "true"
+        )
         # initialize the sftp client
         self.relecov_sftp = relecov_tools.sftp_client.SftpRelecov(
             conf_file, sftp_user, sftp_passwd
         )
         self.finished_folders = {}
+        # md5 hashes computed while downloading or verifying, keyed by local path
+        self.local_hashes = {}
+        # Results of relecov_tools.utils.verify_file() keyed by local path
+        self.file_checks = {}
+        # Local paths already compressed while downloading the rest of files
+        self.precompressed = set()
+        self.transfer_journals = {}
+        self.journals_lock = threading.Lock()
+        # Results of prevalidate_folder() for folders waiting to be downloaded
+        self.prevalidated = {}
         self.set_batch_id(datetime.today().strftime("%Y%m%d%H%M%S"))
         self.defer_cleanup = False
 
@@ -158,7 +544,15 @@ class DownloadManager(BaseModule):
         self.log.info("Created the folder to download files %s", local_folder_path)
         return local_folder_path
 
-    def get_remote_folder_files(self, folder, local_folder, file_list):
+    def get_remote_folder_files(
+        self,
+        folder,
+        local_folder,
+        file_list,
+        exist_ok=True,
+        on_fetched=None,
+        hash_dict=None,
+    ):
         """Create the subfolder with the present date and fetch all files from
         the remote sftp server
 
@@ -166,33 +560,367 @@ class DownloadManager(BaseModule):
             folder (str): name of remote folder to be downloaded
             local_folder (str): name of local folder to store downloaded files
             file_list (list(str)): list of files in remote folder to be downloaded
+            exist_ok (bool): Skip download if the file was completely downloaded
+            before according to the transfer journal of the local folder
+            on_fetched (callable, optional): Called with each file name as soon
+            as its download finishes
+            hash_dict (dict(str:str), optional): md5 hashes from remote md5sum
+            file. Files already in the checksum catalog are not transferred.
 
         Returns:
             fetched_files(list(str)): list of successfully downloaded files
         """
 
-        fetched_files = list()
         self.log.info("Trying to fetch files in remote server")
-        stderr.print(f"Fetching {len(file_list)} files from {folder}")
-        for file in file_list:
+        journal = self.get_transfer_journal(local_folder)
+        # Session of the current task, pool threads do not share its state
+        relecov_sftp = self.relecov_sftp
+        try:
+            remote_attrs = {
+                attr.filename: attr for attr in relecov_sftp.listdir_attr(folder)
+            }
+        except (FileNotFoundError, OSError) as e:
+            self.log.warning("Could not get attributes of files in %s: %s", folder, e)
+            remote_attrs = {}
+
+        def sync_file(file):
+            """Check if the file is already synced with its remote version"""
+            output_file = os.path.join(local_folder, os.path.basename(file))
+            remote_attr = remote_attrs.get(os.path.basename(file))
+            entry = journal.synced_entry(output_file, remote_attr)
+            if entry is None and self.sync and remote_attr is not None:
+                entry = self.reuse_synced_copy(local_folder, file, remote_attr)
+            if entry is None and hash_dict and remote_attr is not None:
+                entry = self.reuse_catalog_copy(
+                    local_folder, file, remote_attr, hash_dict
+                )
+            if entry is None:
+                return False
+            if entry.get("md5"):
+                self.local_hashes[output_file] = entry["md5"]
+            if on_fetched is not None:
+                on_fetched(os.path.basename(file))
+            return True
+
+        def fetch_file(file):
+            """Download a single file, trying up to 3 times. Runs in pool
+            threads, where task attributes such as current_folder are not set
+            """
             file_to_fetch = os.path.join(folder, os.path.basename(file))
             output_file = os.path.join(local_folder, os.path.basename(file))
-            if self.relecov_sftp.get_from_sftp(
-                file_to_fetch, output_file, exist_ok=True
-            ):
-                fetched_files.append(os.path.basename(file))
-            else:
-                # Try to download again n times
-                for _ in range(3):
-                    if self.relecov_sftp.get_from_sftp(file_to_fetch, output_file):
-                        fetched_files.append(os.path.basename(file))
-                        break
-                else:
-                    self.log.warning(
-                        "Couldn't fetch %s from %s after 3 tries", file, folder
+            if not exist_ok:
+                journal.remove_entry(output_file)
+                self.file_checks.pop(output_file, None)
+            # Hash the content during the transfer to avoid reading it again
+            for _ in range(3):
+                with self.scheduler.transfer_slot(folder):
+                    transfer_info = relecov_sftp.get_from_sftp_with_hash(
+                        file_to_fetch, output_file, journal=journal
+                    )
+                if transfer_info:
+                    self.local_hashes[output_file] = transfer_info["md5"]
+                    relecov_tools.utils.get_hash_cache().store(
+                        output_file, transfer_info["md5"]
                     )
+                    if on_fetched is not None:
+                        on_fetched(os.path.basename(file))
+                    return os.path.basename(file)
+            self.log.warning("Couldn't fetch %s from %s after 3 tries", file, folder)
+            return None
+
+        if exist_ok:
+            synced_files = [file for file in file_list if sync_file(file)]
+        else:
+            synced_files = []
+        if synced_files:
+            log_text = "%s files in %s were already available locally, skipped"
+            self.log.info(log_text % (len(synced_files), folder))
+            stderr.print(log_text % (len(synced_files), folder))
+        files_to_fetch = [file for file in file_list if file not in synced_files]
+        stderr.print(f"Fetching {len(files_to_fetch)} files from {folder}")
+        n_workers = min(
+            self.workers, self.scheduler.max_lab_transfers, len(files_to_fetch)
+        )
+        if n_workers > 1:
+            relecov_sftp.open_channel_pool(n_workers)
+            try:
+                with ThreadPoolExecutor(max_workers=n_workers) as executor:
+                    results = list(executor.map(fetch_file, files_to_fetch))
+            finally:
+                relecov_sftp.close_channel_pool()
+        else:
+            results = [fetch_file(file) for file in files_to_fetch]
+        fetched = set(file for file in results if file is not None)
+        fetched_files = [
+            os.path.basename(file)
+            for file in file_list
+            if file in synced_files or os.path.basename(file) in fetched
+        ]
+        return fetched_files
+
+    def reuse_synced_copy(self, local_folder, file, remote_attr):
+        """Search for the file in the previous batches of the same lab using its
+        transfer journal and link it into local_folder if that copy is synced
+        with the remote file. If the file was compressed after its download, the
+        compressed copy is linked and the file is handled as already compressed
+
+        Args:
+            local_folder (str): folder where the file should be downloaded
+            file (str): name of the remote file
+            remote_attr (SFTPAttributes): current attributes of the remote file
+
+        Returns:
+            entry (dict): journal entry of the reused file. None if not found
+        """
+        f_name = os.path.basename(file)
+        output_file = os.path.join(local_folder, f_name)
+        journal = self.get_transfer_journal(local_folder)
+        entry, source_file = journal.synced_copy(output_file, remote_attr)
+        if entry is None or entry.get("local_path") == output_file:
+            return None
+        compressed = source_file == entry.get("final_path")
+        target_file = output_file + ".gz" if compressed else output_file
+        if not self.link_local_copy(source_file, target_file):
+            return None
+        self.log.info("Reusing local copy of %s from %s", f_name, source_file)
+        if not compressed:
+            journal.update_entry(output_file)
+            return journal.synced_entry(output_file, remote_attr)
+        journal.update_entry(output_file, final_path=target_file)
+        # The downloaded file does not exist anymore, only its compressed copy
+        self.local_hashes[target_file] = entry["final_md5"]
+        self.file_checks[output_file] = {
+            "md5": entry["md5"],
+            "gzip_valid": None,
+            "reads": None,
+            "bases": None,
+        }
+        self.precompressed.add(output_file)
+        return journal.get_entry(output_file)
+
+    def reuse_catalog_copy(self, local_folder, file, remote_attr, hash_dict):
+        """Link a local copy of the file from the checksum catalog if its md5
+        in remote md5sum and its remote size match one of the cataloged files
+
+        Args:
+            local_folder (str): folder where the file should be downloaded
+            file (str): name of the remote file
+            remote_attr (SFTPAttributes): current attributes of the remote file
+            hash_dict (dict(str:str)): md5 hashes from remote md5sum file
+
+        Returns:
+            entry (dict): journal entry of the reused file. None if not found
+        """
+        f_name = os.path.basename(file)
+        md5 = hash_dict.get(f_name)
+        if not md5:
+            return None
+        output_file = os.path.join(local_folder, f_name)
+        try:
+            source_file = self.catalog.find_copy(md5, remote_attr.st_size)
+        except (OSError, sqlite3.Error) as e:
+            self.log.warning("Could not read checksum catalog: %s", e)
+            return None
+        if source_file is None or source_file == output_file:
+            return None
+        if not self.link_local_copy(source_file, output_file):
+            return None
+        self.log.info("Reusing local copy of %s from %s", f_name, source_file)
+        journal = self.get_transfer_journal(local_folder)
+        journal.set_entry(
+            output_file,
+            remote_path=file,
+            remote_size=remote_attr.st_size,
+            remote_mtime=remote_attr.st_mtime,
+            committed=remote_attr.st_size,
+        )
+        journal.mark_complete(output_file, md5)
+        lab = self.current_folder
+        with self.logsum.lock:
+            self.logsum.feed_key(key=lab)
+            lab_logs = self.logsum.logs[lab]
+            lab_logs["reused_files"] = lab_logs.get("reused_files", 0) + 1
+            lab_logs["saved_bytes"] = (
+                lab_logs.get("saved_bytes", 0) + remote_attr.st_size
+            )
+        return journal.synced_entry(output_file, remote_attr)
+
+    def link_local_copy(self, source_file, output_file):
+        """Hardlink source_file as output_file, copy it if linking fails
+
+        Returns:
+            linked (bool): True if output_file was created
+        """
+        try:
+            if os.path.exists(output_file):
+                os.remove(output_file)
+            try:
+                os.link(source_file, output_file)
+            except OSError:
+                shutil.copy2(source_file, output_file)
+        except OSError as e:
+            self.log.warning("Could not reuse %s: %s", source_file, e)
+            return False
+        return True
+
+    def fetch_and_process_files(self, folder, local_folder, file_list, hash_dict):
+        """Download the files in a folder while the ones already downloaded are
+        verified and compressed in a separate pool, so network and cpu work
+        overlap. Later steps reuse these results instead of repeating them.
+
+        Args:
+            folder (str): name of remote folder to be downloaded
+            local_folder (str): name of local folder to store downloaded files
+            file_list (list(str)): list of files in remote folder to be downloaded
+            hash_dict (dict(str:str)): md5 hashes from remote md5sum file, if any
+
+        Returns:
+            fetched_files(list(str)): list of successfully downloaded files
+        """
+        # Limit the number of downloaded files waiting to be processed
+        pending_slots = threading.BoundedSemaphore(self.workers * 2)
+
+        def release_slot(future):
+            pending_slots.release()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+
+            def submit_file(file):
+                pending_slots.acquire()
+                future = executor.submit(
+                    self.process_fetched_file, local_folder, file, hash_dict
+                )
+                future.add_done_callback(release_slot)
+
+            fetched_files = self.get_remote_folder_files(
+                folder,
+                local_folder,
+                file_list,
+                on_fetched=submit_file,
+                hash_dict=hash_dict,
+            )
         return fetched_files
 
+    def process_fetched_file(self, local_folder, file, hash_dict):
+        """Verify a downloaded file and compress it if needed, keeping the
+        uncompressed file until compress_and_update() is called for it.
+        Files with md5 mismatches are not compressed as they will be downloaded
+        again.
+
+        Args:
+            local_folder (str): folder where the file was downloaded
+            file (str): name of the downloaded file
+            hash_dict (dict(str:str)): md5 hashes from remote md5sum file, if any
+        """
+        f_path = os.path.join(local_folder, file)
+        if f_path in self.precompressed:
+            return
+        try:
+            checks = self.verify_local_files(local_folder, [file])[file]
+            if not file.endswith(tuple(self.allowed_file_ext)):
+                return
+            if file.endswith(".gz") or file.endswith(".bam"):
+                return
+            if hash_dict and file in hash_dict and hash_dict[file] != checks["md5"]:
+                return
+            threads = max((os.cpu_count() or 1) // self.workers, 1)
+            if relecov_tools.utils.compress_file(f_path, threads):
+                self.verify_local_files(local_folder, [file + ".gz"])
+                self.precompressed.add(f_path)
+        except OSError as e:
+            # Any failure here is repeated and reported by the following steps
+            self.log.debug("Could not process %s while downloading: %s", f_path, e)
+        return
+
+    def get_transfer_journal(self, local_folder):
+        """Return the transfer journal of the lab of the given local folder, which
+        keeps the progress of each download so interrupted ones can be resumed,
+        also in later runs. It is kept in platform_storage_folder, outside of
+        the batch folders delivered to the next steps
+
+        Args:
+            local_folder (str): folder where files are being downloaded
+
+        Returns:
+            journal (TransferJournal): journal of the lab
+        """
+        lab = os.path.basename(os.path.dirname(os.path.normpath(local_folder)))
+        journal_path = os.path.join(
+            self.platform_storage_folder, self.transfer_journal_folder, lab + ".jsonl"
+        )
+        with self.journals_lock:
+            if journal_path not in self.transfer_journals:
+                self.transfer_journals[journal_path] = (
+                    relecov_tools.sftp_client.TransferJournal(journal_path)
+                )
+            return self.transfer_journals[journal_path]
+
+    def get_local_md5(self, file_path):
+        """Return the md5 hash of a local file, reusing the one computed during
+        its download or verification if available instead of reading it again
+
+        Args:
+            file_path (str): path to the local file
+
+        Returns:
+            md5_hash (str): md5 hexdigest of the file
+        """
+        if file_path in self.local_hashes:
+            return self.local_hashes[file_path]
+        return relecov_tools.utils.calculate_md5(file_path)
+
+    def hash_local_files(self, path_list):
+        """Calculate in parallel the md5 hash of the given local files that were
+        not hashed yet, so get_local_md5() does not need to read them
+
+        Args:
+            path_list (list(str)): paths to the local files
+        """
+        missing = [path for path in path_list if path not in self.local_hashes]
+        self.local_hashes.update(
+            relecov_tools.utils.calculate_md5_batch(missing, max_workers=self.workers)
+        )
+        return
+
+    def verify_local_files(self, local_folder, file_list):
+        """Verify the given files reading each of them only once: compute md5
+        hash if it was not obtained during download, check gzip integrity and
+        count reads and bases in fastq files if compute_fastq_stats is enabled.
+        Files verified before are not read again.
+
+        Args:
+            local_folder (str): folder where the files were downloaded
+            file_list (list(str)): names of the files to verify
+
+        Returns:
+            file_checks (dict(str:dict)): verify_file() results for each file name
+        """
+        path_list = [os.path.join(local_folder, fi) for fi in file_list]
+        results = {
+            path: self.file_checks[path]
+            for path in path_list
+            if path in self.file_checks
+        }
+        path_list = [path for path in path_list if path not in results]
+        file_options = {}
+        for path in path_list:
+            fastq_file = path.endswith((".fastq", ".fq", ".fastq.gz", ".fq.gz"))
+            file_options[path] = {
+                "md5": path not in self.local_hashes,
+                "fastq_stats": self.compute_fastq_stats and fastq_file,
+            }
+        new_results = relecov_tools.utils.verify_files(
+            path_list, max_workers=self.workers, file_options=file_options
+        )
+        for path, checks in new_results.items():
+            if checks["md5"] is not None:
+                self.local_hashes[path] = checks["md5"]
+            else:
+                checks["md5"] = self.local_hashes[path]
+            self.file_checks[path] = checks
+        results.update(new_results)
+        return {os.path.basename(path): checks for path, checks in results.items()}
+
     def find_remote_md5sum(self, folder, pattern="md5sum"):
         """Search for a pattern in remote folder, by default is md5sum
 
@@ -223,13 +951,16 @@ class DownloadManager(BaseModule):
             error_text = "md5sum file could not be read, md5 hashes won't be validated"
             self.include_warning(error_text)
             return fetched_files, False
+        self.hash_local_files(
+            [os.path.join(local_folder, fi) for fi in hash_dict if fi in fetched_files]
+        )
         # check md5 checksum for each file
         for f_name in hash_dict.keys():
             if f_name not in fetched_files:
                 # Skip those files in md5sum that were not downloaded by any reason
                 continue
             f_path = os.path.join(local_folder, f_name)
-            if hash_dict[f_name] == relecov_tools.utils.calculate_md5(f_path):
+            if hash_dict[f_name] == self.get_local_md5(f_path):
                 successful_files.append(f_name)
                 self.log.info("Successful file download for %s", f_name)
             else:
@@ -238,7 +969,7 @@ class DownloadManager(BaseModule):
         return successful_files, required_retransmition
 
     def create_files_with_metadata_info(
-        self, local_folder, samples_dict, md5_dict, metadata_file
+        self, local_folder, samples_dict, md5_dict, metadata_file, stats_dict=None
     ):
         """Copy metadata file from folder, extend samples_dict with md5hash for
         each file. Then create a Json file with this dict
@@ -248,6 +979,7 @@ class DownloadManager(BaseModule):
             samples_dict (dict{str:str}): same structure as validate_remote_files()
             md5_dict (dict(str:str)): Zipped dict of files_list and md5hash_list
             metadata_file (str): Name of the downloaded metadata file to rename it
+            stats_dict (dict(str:dict), optional): reads and bases of each file
         """
         samples_to_delete = []
         lab_code = local_folder.split("/")[-2]
@@ -272,6 +1004,13 @@ class DownloadManager(BaseModule):
                 values["sequence_file_R2_md5"] = md5_dict.get(
                     values["sequence_file_R2"]
                 )
+            if stats_dict:
+                for read in ["R1", "R2"]:
+                    file_stats = stats_dict.get(values.get(f"sequence_file_{read}"))
+                    if not file_stats or file_stats.get("reads") is None:
+                        continue
+                    values[f"sequence_file_{read}_reads"] = file_stats["reads"]
+                    values[f"sequence_file_{read}_bases"] = file_stats["bases"]
             values["batch_id"] = self.batch_id
         if samples_to_delete:
             data = {k: v for k, v in data.items() if k not in samples_to_delete}
@@ -335,33 +1074,30 @@ class DownloadManager(BaseModule):
             MetadataError: If the header in the excel is different from config
 
         Returns:
-            ws_metadata_lab: openpyxl's workbook metadata sheet of the excel file
-            metadata_header: column names of the header
+            metadata_rows: Typed values of the rows below the header
+            metadata_header: Position of each column of the header in the rows
             header_row: row where the header is located in the sheet
         """
         warnings.simplefilter(action="ignore", category=UserWarning)
-        wb_file = openpyxl_load_workbook(meta_f_path, data_only=True)
-        ws_metadata_lab = wb_file[self.metadata_processing.get("excel_sheet")]
-        # find out the index for file names
         header_flag = self.metadata_processing.get("header_flag")
         try:
-            header_row = [
-                i + 1 for i, x in enumerate(ws_metadata_lab.values) if header_flag in x
-            ][0]
-        except IndexError:
-            error_text = "Header could not be found for excel file %s"
-            raise MetadataError(str(error_text % os.path.basename(meta_f_path)))
-        for cell in ws_metadata_lab[header_row]:
-            if cell.value is not None:
-                cell.value = cell.value.strip()
-        metadata_header = [
-            x.value for x in ws_metadata_lab[header_row] if x.value is not None
-        ]
+            metadata_header, metadata_rows, header_row = (
+                relecov_tools.utils.read_excel_sheet(
+                    meta_f_path,
+                    self.metadata_processing.get("excel_sheet"),
+                    header_flag,
+                )
+            )
+        except KeyError as e:
+            # Missing sheet or header
+            error_text = "Header could not be found for excel file %s: %s"
+            raise MetadataError(error_text % (os.path.basename(meta_f_path), e))
         meta_column_list = self.metadata_lab_heading
-        if meta_column_list != metadata_header[1:]:
+        header_names = list(metadata_header)
+        if meta_column_list != header_names[1:]:
             diffs = [
                 x
-                for x in set(metadata_header[1:] + meta_column_list)
+                for x in set(header_names[1:] + meta_column_list)
                 if x not in meta_column_list or x not in metadata_header
             ]
             self.log.error(
@@ -373,7 +1109,7 @@ class DownloadManager(BaseModule):
             stderr.print("[red]Differences: ", diffs)
             raise MetadataError(f"Metadata header different from config: {diffs}")
         if return_data:
-            return ws_metadata_lab, metadata_header, header_row
+            return metadata_rows, metadata_header, header_row
         else:
             return True
 
@@ -395,14 +1131,14 @@ class DownloadManager(BaseModule):
             stderr.print("[red] METADATA_LAB.xlsx do not exist in" + local_folder)
             return False
         sample_file_dict = {}
-        metadata_ws, meta_header, header_row = self.read_metadata_file(meta_f_path)
+        metadata_rows, meta_header, header_row = self.read_metadata_file(meta_f_path)
         # TODO Include these columns in config
-        index_sampleID = meta_header.index("Sample ID given for sequencing")
-        index_layout = meta_header.index("Library Layout")
-        index_fastq_r1 = meta_header.index("Sequence file R1")
-        index_fastq_r2 = meta_header.index("Sequence file R2")
+        index_sampleID = meta_header["Sample ID given for sequencing"]
+        index_layout = meta_header["Library Layout"]
+        index_fastq_r1 = meta_header["Sequence file R1"]
+        index_fastq_r2 = meta_header["Sequence file R2"]
         counter = header_row
-        for row in islice(metadata_ws.values, header_row, metadata_ws.max_row):
+        for row in metadata_rows:
             counter += 1
             if row[index_sampleID] is not None:
                 row_complete = True
@@ -615,21 +1351,23 @@ class DownloadManager(BaseModule):
             files_to_remove = all_files
         else:
             files_to_remove = files
+        paths_to_remove = []
         for file in files_to_remove:
             if skip_seqs and file.endswith(tuple(self.allowed_file_ext)):
                 continue
             matched_path = file_paths.get(os.path.basename(file))
             if matched_path:
-                try:
-                    self.relecov_sftp.remove_file(matched_path)
-                except (IOError, PermissionError) as e:
-                    self.log.error(f"Could not delete remote file {matched_path}: {e}")
-                    stderr.print(
-                        f"[red]Could not delete remote file {matched_path}. Error: {e}"
-                    )
+                paths_to_remove.append(matched_path)
             else:
                 self.log.warning(f"File not found before deletion: {file}")
                 stderr.print(f"[red]File not found before deletion: {file}")
+        # All files are removed at once with pipelined requests
+        errors = self.relecov_sftp.remove_files(paths_to_remove)
+        for matched_path, e in errors.items():
+            self.log.error(f"Could not delete remote file {matched_path}: {e}")
+            stderr.print(
+                f"[red]Could not delete remote file {matched_path}. Error: {e}"
+            )
         return
 
     def rename_remote_folder(self, remote_folder):
@@ -663,32 +1401,49 @@ class DownloadManager(BaseModule):
         Args:
             remote_folder (str): path to folder in remote repository
         """
+        self.clean_remote_folders([remote_folder])
+        return
 
-        def remove_client_dir(remote_folder, top_level):
-            # Never remove a folder in the top level
-            if len(remote_folder.replace("./", "").split("/")) >= top_level:
-                self.log.info("Trying to remove %s", remote_folder)
-                try:
-                    self.relecov_sftp.remove_dir(remote_folder)
-                    self.log.info("Successfully removed %s", remote_folder)
-                except (OSError, PermissionError) as e:
+    def clean_remote_folders(self, remote_folders):
+        """Delete several folders from remote sftp if they are empty, renaming
+        them otherwise. Folders in the same depth are removed at once with
+        pipelined requests, deepest first.
+
+        Args:
+            remote_folders (list(str)): paths to folders in remote repository
+        """
+        if self.subfolder:
+            top_level = 3
+        else:
+            top_level = 2
+        depths = {}
+        for remote_folder in dict.fromkeys(remote_folders):
+            depth = len(remote_folder.replace("./", "").split("/"))
+            depths.setdefault(depth, []).append(remote_folder)
+        for depth in sorted(depths, reverse=True):
+            folders_to_remove = []
+            for remote_folder in depths[depth]:
+                if self.relecov_sftp.get_file_list(remote_folder):
+                    self.rename_remote_folder(remote_folder)
+                    log_text = f"Remote folder {remote_folder} not empty. Not removed."
+                    self.log.warning(log_text)
+                # Never remove a folder in the top level
+                elif depth >= top_level:
+                    self.log.info("Trying to remove %s", remote_folder)
+                    folders_to_remove.append(remote_folder)
+                else:
+                    self.log.info(
+                        "%s is a top-level folder. Not removed", remote_folder
+                    )
+            errors = self.relecov_sftp.remove_files(folders_to_remove, directories=True)
+            for remote_folder in folders_to_remove:
+                if remote_folder in errors:
+                    e = errors[remote_folder]
                     log_text = f"Could not delete remote {remote_folder}. Error: {e}"
                     self.log.error(log_text)
                     stderr.print(log_text)
-            else:
-                self.log.info("%s is a top-level folder. Not removed", remote_folder)
-
-        remote_folder_files = self.relecov_sftp.get_file_list(remote_folder)
-        if remote_folder_files:
-            self.rename_remote_folder(remote_folder)
-            log_text = f"Remote folder {remote_folder} not empty. Not removed."
-            self.log.warning(log_text)
-        else:
-            if self.subfolder:
-                top_level = 3
-            else:
-                top_level = 2
-            remove_client_dir(remote_folder, top_level)
+                else:
+                    self.log.info("Successfully removed %s", remote_folder)
         return
 
     def move_processing_fastqs(self, folders_with_metadata):
@@ -702,23 +1457,32 @@ class DownloadManager(BaseModule):
         """
         self.log.info("Moving remote files to each temporal processing folder")
         stderr.print("[blue]Moving remote files to each temporal processing folder")
+        folder_moves = {}
         for folder, files in folders_with_metadata.items():
-            self.current_folder = folder.split("/")[0]
-            successful_files = []
-            unique_files = list(set(files))
-            for file in unique_files:
+            folder_moves[folder] = {}
+            for file in list(set(files)):
                 if not file.endswith(tuple(self.allowed_file_ext)):
                     continue
-
                 file_dest = os.path.join(folder, os.path.basename(file))
-                if file_dest in successful_files:
-                    continue
-                try:
-                    self.relecov_sftp.rename_file(file, file_dest)
-                    successful_files.append(file_dest)
-                except OSError as e:
+                folder_moves[folder].setdefault(file_dest, file)
+        # Files from every folder are moved at once with pipelined requests
+        errors = self.relecov_sftp.rename_files(
+            [
+                (file, dest)
+                for moves in folder_moves.values()
+                for dest, file in moves.items()
+            ]
+        )
+        for folder, moves in folder_moves.items():
+            self.current_folder = folder.split("/")[0]
+            successful_files = []
+            for file_dest, file in moves.items():
+                if file in errors:
+                    e = errors[file]
                     self.log.error(f"Error moving file {file} to {file_dest}: {e}")
                     stderr.print(f"[red]Error moving file {file} to {file_dest}: {e}")
+                else:
+                    successful_files.append(file_dest)
             folders_with_metadata[folder] = successful_files
         return folders_with_metadata
 
@@ -891,15 +1655,19 @@ class DownloadManager(BaseModule):
             os.remove(merged_excel_path)
             return
 
-        def pre_validate_folder(folder, folder_files):
+        def pre_validate_folder(folder):
             """Check if remote folder has sequencing files and a valid metadata file"""
-            if not any(file.endswith(tuple(exts)) for file in folder_files):
+            self.current_folder = folder
+            if not any(file.endswith(tuple(exts)) for file in target_folders[folder]):
                 error_text = "Remote folder %s skipped. No sequencing files found."
                 self.include_error(error_text % folder)
                 return
+            # Folders are fetched concurrently, each one in its own directory
+            fetch_folder = tempfile.mkdtemp(dir=output_location)
             try:
-                downloaded_metadata = self.get_metadata_file(folder, output_location)
+                downloaded_metadata = self.get_metadata_file(folder, fetch_folder)
             except (FileNotFoundError, OSError, PermissionError, MetadataError) as err:
+                shutil.rmtree(fetch_folder, ignore_errors=True)
                 error_text = "Remote folder %s skipped. Reason: %s"
                 self.include_error(error_text % (folder, err))
                 return
@@ -907,7 +1675,7 @@ class DownloadManager(BaseModule):
                 self.read_metadata_file(downloaded_metadata, return_data=False)
             except (MetadataError, KeyError) as excel_error:
                 error_text = f"Folder {self.current_folder} skipped: %s"
-                os.remove(downloaded_metadata)
+                shutil.rmtree(fetch_folder, ignore_errors=True)
                 self.include_error(error_text % excel_error)
                 return
             return downloaded_metadata
@@ -917,19 +1685,25 @@ class DownloadManager(BaseModule):
         merged_df = merged_excel_path = last_main_folder = excel_name = None
         self.log.info("Setting %s remote folders...", str(len(target_folders.keys())))
         stderr.print(f"[blue]Setting {len(target_folders.keys())} remote folders...")
+        folders_to_merge = []
         for folder in sorted(target_folders.keys()):
             if "invalid_samples" in folder:
                 self.log.warning("Skipped invalid_samples folder %s", folder)
                 continue
+            folders_to_merge.append(folder)
+        # Metadata from every folder is fetched and checked before merging any
+        os.makedirs(output_location, exist_ok=True)
+        prevalidated = self.run_prefetch(pre_validate_folder, folders_to_merge)
+        for folder, downloaded_metadata in zip(folders_to_merge, prevalidated):
             self.current_folder = folder
             # Include the folder in the final process log summary
-            downloaded_metadata = pre_validate_folder(folder, target_folders[folder])
             if not downloaded_metadata:
                 continue
             # Create a temporal name to avoid duplicated filenames
             meta_filename = "_".join([folder.split("/")[-1], "metadata_temp.xlsx"])
             local_meta = os.path.join(output_location, meta_filename)
             os.rename(downloaded_metadata, local_meta)
+            shutil.rmtree(os.path.dirname(downloaded_metadata), ignore_errors=True)
 
             # Taking the main folder for each lab as reference for merge and logs
             main_folder = folder.split("/")[0]
@@ -1001,6 +1775,8 @@ class DownloadManager(BaseModule):
         Returns:
             folders_to_process (dict(str:list)): Dictionary with folders and their files
         """
+        # Take a single snapshot of the remote folders, reused in every listing
+        self.relecov_sftp.build_remote_tree(".")
         root_directory_list = self.relecov_sftp.list_remote_folders(".", recursive=True)
         clean_root_list = [folder.replace("./", "") for folder in root_directory_list]
         if not root_directory_list:
@@ -1071,9 +1847,23 @@ class DownloadManager(BaseModule):
             fetched_files(list(str)): files list including the new compressed files
         """
         compressed_files = list()
-        for file in files_to_compress:
+        # Compress several files at once sharing the available cpus between them
+        n_files = max(min(self.workers, len(files_to_compress)), 1)
+        threads = max((os.cpu_count() or 1) // n_files, 1)
+
+        def compress(f_path):
+            if f_path in self.precompressed:
+                return True
+            return relecov_tools.utils.compress_file(f_path, threads)
+
+        with ThreadPoolExecutor(max_workers=n_files) as executor:
+            results = executor.map(
+                compress,
+                [os.path.join(local_folder, file) for file in files_to_compress],
+            )
+            results = list(results)
+        for file, compressed in zip(files_to_compress, results):
             f_path = os.path.join(local_folder, file)
-            compressed = relecov_tools.utils.compress_file(f_path)
             if not compressed:
                 error_text = "Could not compress file %s, file not found" % str(file)
                 self.include_error(error_text, f_path)
@@ -1082,7 +1872,11 @@ class DownloadManager(BaseModule):
             compressed_files.append(file)
             try:
                 os.remove(f_path)
-            except (FileNotFoundError, PermissionError) as e:
+            except FileNotFoundError:
+                # Only the compressed copy was reused from a previous batch
+                if f_path not in self.precompressed:
+                    self.log.warning(f"Could not delete file {f_path}: not found")
+            except PermissionError as e:
                 self.log.warning(f"Could not delete file: {e}")
         fetched_files = [
             (fi + ".gz" if fi in compressed_files else fi) for fi in fetched_files
@@ -1127,7 +1921,8 @@ class DownloadManager(BaseModule):
 
     def download(self, target_folders):
         """Manages all the different functions to download files, verify their
-        integrity and create initial json with filepaths and md5 hashes
+        integrity and create initial json with filepaths and md5 hashes.
+        Folders are processed concurrently if folder_workers is greater than 1
 
         Args:
             target_folders (dict): dictionary
@@ -1138,169 +1933,457 @@ class DownloadManager(BaseModule):
         except OSError as e:
             self.log.error("You do not have permissions to create folder %s", e)
             raise
-        folders_to_download = target_folders
-        for folder in folders_to_download.keys():
-            self.current_folder = folder.split("/")[0]
-            # Close previously open connection to avoid timeouts
+        # Only folders passing validation are taken into account in the plan
+        self.prevalidated = self.prevalidate_folders(target_folders)
+        valid_folders = {
+            folder: [
+                fi for vals in checks["valid_filedict"].values() for fi in vals.values()
+            ]
+            for folder, checks in self.prevalidated.items()
+        }
+        folders_to_download = self.plan_transfers(valid_folders)
+        n_workers = min(self.folder_workers, len(folders_to_download))
+        if n_workers <= 1:
+            for folder in folders_to_download:
+                self.admit_and_download(folder)
+            self.save_deferred_labs()
+            return
+        self.log.info("Processing %s folders in parallel", n_workers)
+        # Pool of sftp sessions, one for each folder being processed
+        session_pool = queue.Queue()
+        for _ in range(n_workers):
+            session = self.relecov_sftp.new_session()
+            session.open_connection()
+            session_pool.put(session)
+
+        def download_task(folder):
+            session = session_pool.get()
+            self.task_state.active = True
+            self.relecov_sftp = session
             try:
-                self.relecov_sftp.close_connection()
-            except paramiko.SSHException:
+                self.admit_and_download(folder)
+            finally:
+                self.task_state.__dict__.clear()
+                session_pool.put(session)
+
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            list(executor.map(download_task, folders_to_download))
+        while not session_pool.empty():
+            try:
+                session_pool.get().close_connection()
+            except (paramiko.SSHException, AttributeError):
                 pass
-            # Check if the connection has been closed due to time limit
-            self.relecov_sftp.open_connection()
-            self.log.info("Processing folder %s", folder)
-            stderr.print("[blue]Processing folder " + folder)
-            # Validate that the files are the ones described in metadata.
+        self.save_deferred_labs()
+        return
+
+    def admit_and_download(self, folder):
+        """Download a folder only if the projected disk usage stays under the
+        configured watermark, deferring it to the next run otherwise
+
+        Args:
+            folder (str): name of the remote folder to be processed
+        """
+        folder_sizes = self.scheduler.file_sizes.get(folder, {})
+        required = self.disk_admission.required_bytes(folder_sizes)
+        if not self.disk_admission.admit(folder, required):
+            self.defer_folder(folder, required)
+            return
+        try:
+            self.download_folder(folder)
+        finally:
+            self.disk_admission.release(folder)
+        return
+
+    def defer_folder(self, folder, required):
+        """Skip a folder that does not fit in disk. It is recorded in the log
+        summary and saved so its lab is processed first in the next run
+
+        Args:
+            folder (str): name of the remote folder deferred
+            required (int): bytes needed to download the folder
+        """
+        self.current_folder = self.scheduler.get_lab(folder)
+        log_text = "Folder %s deferred: %s Mbytes needed exceed the disk usage limit"
+        log_args = (folder, round(required / 1048576, 2))
+        self.log.warning(log_text % log_args)
+        stderr.print(f"[gold1]{log_text % log_args}")
+        self.include_warning(log_text % log_args)
+        with self.logsum.lock:
+            lab_logs = self.logsum.logs[self.current_folder]
+            lab_logs.setdefault("deferred_folders", []).append(folder)
+        self.deferred_folders.append(folder)
+        # Remove metadata and md5sum files fetched during validation
+        folder_checks = self.prevalidated.pop(folder, None)
+        if folder_checks is not None:
+            relecov_tools.utils.delete_local_folder(folder_checks["local_folder"])
+        return
+
+    def get_deferred_path(self):
+        """Path of the file with the labs deferred in the last run"""
+        return os.path.join(self.platform_storage_folder, self.deferred_downloads_file)
+
+    def load_deferred_labs(self):
+        """Read the labs deferred in the previous run, if any
+
+        Returns:
+            deferred_labs (list(str)): labs with folders deferred in last run
+        """
+        deferred_path = self.get_deferred_path()
+        if not os.path.isfile(deferred_path):
+            return []
+        try:
+            with open(deferred_path, "r") as fh:
+                return list(json.load(fh).keys())
+        except (OSError, ValueError) as e:
+            self.log.warning("Could not read deferred downloads: %s", e)
+            return []
+
+    def save_deferred_labs(self):
+        """Save the folders deferred in this run grouped by lab, replacing the
+        ones from the previous run"""
+        deferred_labs = defaultdict(list)
+        for folder in self.deferred_folders:
+            deferred_labs[self.scheduler.get_lab(folder)].append(folder)
+        deferred_path = self.get_deferred_path()
+        try:
+            if deferred_labs:
+                with open(deferred_path, "w") as fh:
+                    json.dump(deferred_labs, fh, indent=4)
+            elif os.path.isfile(deferred_path):
+                os.remove(deferred_path)
+        except OSError as e:
+            self.log.warning("Could not save deferred downloads: %s", e)
+        return
+
+    def run_prefetch(self, folder_task, folders):
+        """Run a light task for every folder concurrently, such as fetching its
+        metadata, over a pool of sftp channels from the current session
+
+        Args:
+            folder_task (function): function receiving the name of a folder
+            folders (list(str)): folders to be processed
 
-            local_folder = self.create_local_folder(folder)
+        Returns:
+            results (list): value returned by folder_task for each folder, same order
+        """
+        n_workers = min(self.workers, len(folders))
+        if n_workers <= 1:
+            return [folder_task(folder) for folder in folders]
+
+        def prefetch_task(folder):
+            self.task_state.active = True
             try:
-                valid_filedict, meta_file = self.validate_remote_files(
-                    folder, local_folder
-                )
-            except (FileNotFoundError, IOError, PermissionError, MetadataError) as fail:
-                self.log.error("%s, skipped", fail)
-                stderr.print(f"[red]{fail}, skipped")
-                self.include_error(fail)
-                continue
-            # Get the files in each folder
-            files_to_download = [
-                fi for vals in valid_filedict.values() for fi in vals.values()
-            ]
-            fetched_files = self.get_remote_folder_files(
-                folder, local_folder, files_to_download
+                return folder_task(folder)
+            finally:
+                self.task_state.__dict__.clear()
+
+        relecov_sftp = self.relecov_sftp
+        relecov_sftp.open_channel_pool(n_workers)
+        try:
+            with ThreadPoolExecutor(max_workers=n_workers) as executor:
+                return list(executor.map(prefetch_task, folders))
+        finally:
+            relecov_sftp.close_channel_pool()
+
+    def prevalidate_folder(self, folder):
+        """Fetch the metadata and md5sum files of a remote folder and check that
+        the files described in metadata are found in it, without downloading
+        any sequencing file
+
+        Args:
+            folder (str): name of the remote folder to be validated
+
+        Returns:
+            folder_checks (dict): local folder, valid files for each sample, metadata
+            file, md5sum file and its hashes. None if the folder is not valid
+        """
+        self.current_folder = folder.split("/")[0]
+        local_folder = self.create_local_folder(folder)
+        try:
+            valid_filedict, meta_file = self.validate_remote_files(folder, local_folder)
+        except (FileNotFoundError, IOError, PermissionError, MetadataError) as fail:
+            self.log.error("%s, skipped", fail)
+            stderr.print(f"[red]{fail}, skipped")
+            self.include_error(fail)
+            return None
+        remote_md5sum = self.find_remote_md5sum(folder)
+        if remote_md5sum:
+            # Get the md5checksum to validate integrity of files after download
+            fetched_md5 = os.path.join(local_folder, os.path.basename(remote_md5sum))
+            self.relecov_sftp.get_from_sftp(file=remote_md5sum, destination=fetched_md5)
+            hash_dict = relecov_tools.utils.read_md5_checksum(
+                fetched_md5, self.avoidable_characters
             )
-            if not fetched_files:
-                error_text = "No files could be downloaded in folder %s" % str(folder)
-                stderr.print(f"{error_text}")
-                self.include_error(error_text)
-                continue
-            self.log.info("Finished download for folder: %s", folder)
-            stderr.print(f"Finished download for folder {folder}")
-            remote_md5sum = self.find_remote_md5sum(folder)
-            if remote_md5sum:
-                # Get the md5checksum to validate integrity of files after download
-                fetched_md5 = os.path.join(
-                    local_folder, os.path.basename(remote_md5sum)
-                )
-                self.relecov_sftp.get_from_sftp(
-                    file=remote_md5sum, destination=fetched_md5
+        else:
+            fetched_md5 = None
+            hash_dict = {}
+        return {
+            "local_folder": local_folder,
+            "valid_filedict": valid_filedict,
+            "meta_file": meta_file,
+            "remote_md5sum": remote_md5sum,
+            "fetched_md5": fetched_md5,
+            "hash_dict": hash_dict,
+        }
+
+    def prevalidate_folders(self, target_folders):
+        """Validate every target folder concurrently before any transfer starts,
+        so invalid folders are reported at the beginning of the process
+
+        Args:
+            target_folders (dict(str:list)): Dictionary with folders and their files
+
+        Returns:
+            valid_folders (dict(str:dict)): prevalidate_folder() result for each
+            valid folder
+        """
+        folders = list(target_folders.keys())
+        self.log.info("Validating %s folders before download", len(folders))
+        stderr.print(f"[blue]Validating {len(folders)} folders before download...")
+        results = self.run_prefetch(self.prevalidate_folder, folders)
+        valid_folders = {
+            folder: checks
+            for folder, checks in zip(folders, results)
+            if checks is not None
+        }
+        rejected = [folder for folder in folders if folder not in valid_folders]
+        if rejected:
+            log_text = "%s folders rejected before download: %s"
+            self.log.warning(log_text % (len(rejected), rejected))
+            stderr.print(f"[gold1]{log_text % (len(rejected), rejected)}")
+        return valid_folders
+
+    def plan_transfers(self, target_folders):
+        """Order the folders to download with the transfer scheduler using the
+        remote sizes of their files and include the plan in the log summary
+
+        Args:
+            target_folders (dict(str:list)): Dictionary with folders and their files
+
+        Returns:
+            folder_order (list(str)): folders in the order they will be processed
+        """
+        folder_sizes = {}
+        for folder, files in target_folders.items():
+            try:
+                attrs = self.relecov_sftp.listdir_attr(folder)
+            except (FileNotFoundError, OSError) as e:
+                self.log.warning("Could not get file sizes in %s: %s", folder, e)
+                attrs = []
+            remote_sizes = {attr.filename: attr.st_size or 0 for attr in attrs}
+            folder_sizes[folder] = {fi: remote_sizes.get(fi, 0) for fi in files}
+        # Labs deferred in the previous run due to lack of disk space go first
+        folder_order, lab_plans = self.scheduler.plan(
+            folder_sizes, priority_labs=self.load_deferred_labs()
+        )
+        for lab, lab_plan in lab_plans.items():
+            self.logsum.feed_key(key=lab)
+            with self.logsum.lock:
+                self.logsum.logs[lab]["transfer_plan"] = lab_plan
+        if lab_plans:
+            last_lab = max(
+                lab_plans.values(), key=lambda plan: plan["estimated_completion"]
+            )
+            log_text = "Planned order: %s. Estimated completion time: %s"
+            log_args = (folder_order, last_lab["estimated_completion"])
+            self.log.info(log_text % log_args)
+            stderr.print(f"[blue]{log_text % log_args}")
+        return folder_order
+
+    def download_folder(self, folder):
+        """Download, verify and process all the files in a single remote folder
+
+        Args:
+            folder (str): name of the remote folder to be processed
+        """
+        self.current_folder = folder.split("/")[0]
+        # Reuse the session of this task, only reconnecting if it was lost.
+        # Failed operations are retried with a new connection by the client
+        self.relecov_sftp.ensure_connection()
+        self.log.info("Processing folder %s", folder)
+        stderr.print("[blue]Processing folder " + folder)
+        # Validate that the files are the ones described in metadata, usually
+        # done for every folder before any download starts
+        folder_checks = self.prevalidated.pop(folder, None)
+        if folder_checks is None:
+            folder_checks = self.prevalidate_folder(folder)
+            if folder_checks is None:
+                return
+        local_folder = folder_checks["local_folder"]
+        valid_filedict = folder_checks["valid_filedict"]
+        meta_file = folder_checks["meta_file"]
+        remote_md5sum = folder_checks["remote_md5sum"]
+        fetched_md5 = folder_checks["fetched_md5"]
+        hash_dict = folder_checks["hash_dict"]
+        # Get the files in each folder, largest first
+        files_to_download = self.scheduler.order_files(
+            folder, [fi for vals in valid_filedict.values() for fi in vals.values()]
+        )
+        # Files are verified and compressed while the rest are downloaded
+        fetched_files = self.fetch_and_process_files(
+            folder, local_folder, files_to_download, hash_dict
+        )
+        if not fetched_files:
+            error_text = "No files could be downloaded in folder %s" % str(folder)
+            stderr.print(f"{error_text}")
+            self.include_error(error_text)
+            return
+        self.log.info("Finished download for folder: %s", folder)
+        stderr.print(f"Finished download for folder {folder}")
+        # Hash, gzip check and fastq stats in a single read of each file
+        self.verify_local_files(local_folder, fetched_files)
+        if remote_md5sum:
+            successful_files, corrupted = self.verify_md5_checksum(
+                local_folder, fetched_files, fetched_md5
+            )
+            # try to download the files again to discard errors during download
+            if corrupted:
+                self.log.info("Found md5 mismatches, downloading again.")
+                stderr.print("[gold1]Found md5 mismatches, downloading again...")
+                self.get_remote_folder_files(
+                    folder, local_folder, corrupted, exist_ok=False
                 )
-                successful_files, corrupted = self.verify_md5_checksum(
-                    local_folder, fetched_files, fetched_md5
+                self.verify_local_files(local_folder, corrupted)
+                saved_files, corrupted = self.verify_md5_checksum(
+                    local_folder, corrupted, fetched_md5
                 )
-                # try to download the files again to discard errors during download
+                if saved_files:
+                    successful_files.extend(saved_files)
                 if corrupted:
-                    self.log.info("Found md5 mismatches, downloading again.")
-                    stderr.print("[gold1]Found md5 mismatches, downloading again...")
-                    self.get_remote_folder_files(folder, local_folder, corrupted)
-                    saved_files, corrupted = self.verify_md5_checksum(
-                        local_folder, corrupted, fetched_md5
-                    )
-                    if saved_files:
-                        successful_files.extend(saved_files)
-                    if corrupted:
-                        error_text = "Found corrupted files: %s. Removed"
-                        stderr.print(f"[red]{error_text % (str(corrupted))}")
-                        self.include_warning(error_text % (str(corrupted)))
-                        if self.abort_if_md5_mismatch:
-                            error_text = "Stop processing %s due to corrupted files."
-                            stderr.print(f"[red]{error_text % folder}")
-                            self.include_error(error_text % "folder")
-                            relecov_tools.utils.delete_local_folder(local_folder)
-                            continue
-                hash_dict = relecov_tools.utils.read_md5_checksum(
-                    fetched_md5, self.avoidable_characters
-                )
-                self.log.info("Finished md5 check for folder: %s", folder)
-                stderr.print(f"[blue]Finished md5 verification for folder {folder}")
-            else:
-                corrupted = []
-                error_text = "No single md5sum file could be found in %s" % folder
-                stderr.print(f"[red]{error_text}")
-                self.include_warning(error_text)
-
-            to_remove = set()
-            for sample_id, files in list(valid_filedict.items()):
-                if any(
-                    files.get(key) in corrupted
-                    for key in ["sequence_file_R1", "sequence_file_R2"]
-                ):
-                    to_remove.update(files.values())
+                    error_text = "Found corrupted files: %s. Removed"
+                    stderr.print(f"[red]{error_text % (str(corrupted))}")
+                    self.include_warning(error_text % (str(corrupted)))
+                    if self.abort_if_md5_mismatch:
+                        error_text = "Stop processing %s due to corrupted files."
+                        stderr.print(f"[red]{error_text % folder}")
+                        self.include_error(error_text % "folder")
+                        relecov_tools.utils.delete_local_folder(local_folder)
+                        return
+            self.log.info("Finished md5 check for folder: %s", folder)
+            stderr.print(f"[blue]Finished md5 verification for folder {folder}")
+        else:
+            corrupted = []
+            error_text = "No single md5sum file could be found in %s" % folder
+            stderr.print(f"[red]{error_text}")
+            self.include_warning(error_text)
 
-            # Delete corrupted files before proceeding
-            for file_name in to_remove:
-                path = os.path.join(local_folder, file_name)
-                try:
-                    os.remove(path)
-                    self.log.info(
-                        "File %s was removed because it was corrupted", file_name
-                    )
-                    corrupted.append(file_name)
-                except (FileNotFoundError, PermissionError, OSError) as e:
-                    error_text = "Could not remove corrupted file %s: %s"
-                    self.log.error(error_text % (path, e))
-                    stderr.print(f"[red]{error_text % (path, e)}")
-
-            seqs_fetchlist = [
-                fi for fi in fetched_files if fi.endswith(tuple(self.allowed_file_ext))
-            ]
-            seqs_fetchlist = [fi for fi in seqs_fetchlist if fi not in corrupted]
-            # Checking for uncompressed files
-            files_to_compress = [
-                fi
-                for fi in seqs_fetchlist
-                if not fi.endswith(".gz") and not fi.endswith(".bam")
-            ]
-            if files_to_compress:
-                comp_files = str(len(files_to_compress))
-                self.log.info("Found %s uncompressed files, compressing...", comp_files)
-                stderr.print(f"Found {comp_files} uncompressed files, compressing...")
-                clean_fetchlist = self.compress_and_update(
-                    seqs_fetchlist, files_to_compress, local_folder
-                )
-            else:
-                clean_fetchlist = seqs_fetchlist
-            clean_pathlist = [os.path.join(local_folder, fi) for fi in clean_fetchlist]
-
-            for file in clean_fetchlist:
-                full_f_path = os.path.join(local_folder, file)
-                if not relecov_tools.utils.check_gzip_integrity(full_f_path):
-                    corrupted.append(file)
-
-            not_md5sum = []
-            if remote_md5sum:
-                # Get hashes from provided md5sum, create them for those not provided
-                files_md5_dict = {}
-                for path in clean_pathlist:
-                    f_name = os.path.basename(path)
-                    if f_name in corrupted:
-                        clean_fetchlist.remove(f_name)
-                    elif f_name in successful_files:
-                        files_md5_dict[f_name] = hash_dict[f_name]
-                    else:
-                        if not str(f_name).rstrip(".gz") in files_to_compress:
-                            error_text = "File %s not found in md5sum. Creating hash"
-                            self.log.warning(error_text % f_name)
-                            not_md5sum.append(f_name)
-                        else:
-                            self.log.info(
-                                "File %s was compressed, creating md5hash", f_name
-                            )
-                        files_md5_dict[f_name] = relecov_tools.utils.calculate_md5(path)
-            else:
-                md5_hashes = [
-                    relecov_tools.utils.calculate_md5(path) for path in clean_pathlist
-                ]
-                files_md5_dict = dict(zip(clean_fetchlist, md5_hashes))
-            files_md5_dict = {
-                x: y for x, y in files_md5_dict.items() if x not in corrupted
-            }
-            processed_filedict = self.process_filedict(
-                valid_filedict, clean_fetchlist, corrupted=corrupted, md5miss=not_md5sum
+        to_remove = set()
+        for sample_id, files in list(valid_filedict.items()):
+            if any(
+                files.get(key) in corrupted
+                for key in ["sequence_file_R1", "sequence_file_R2"]
+            ):
+                to_remove.update(files.values())
+
+        # Delete corrupted files before proceeding
+        for file_name in to_remove:
+            path = os.path.join(local_folder, file_name)
+            try:
+                if path in self.precompressed:
+                    self.precompressed.discard(path)
+                    os.remove(path + ".gz")
+                os.remove(path)
+                self.log.info("File %s was removed because it was corrupted", file_name)
+                corrupted.append(file_name)
+            except (FileNotFoundError, PermissionError, OSError) as e:
+                error_text = "Could not remove corrupted file %s: %s"
+                self.log.error(error_text % (path, e))
+                stderr.print(f"[red]{error_text % (path, e)}")
+
+        seqs_fetchlist = [
+            fi for fi in fetched_files if fi.endswith(tuple(self.allowed_file_ext))
+        ]
+        seqs_fetchlist = [fi for fi in seqs_fetchlist if fi not in corrupted]
+        # Checking for uncompressed files
+        files_to_compress = [
+            fi
+            for fi in seqs_fetchlist
+            if not fi.endswith(".gz") and not fi.endswith(".bam")
+        ]
+        if files_to_compress:
+            comp_files = str(len(files_to_compress))
+            self.log.info("Found %s uncompressed files, compressing...", comp_files)
+            stderr.print(f"Found {comp_files} uncompressed files, compressing...")
+            clean_fetchlist = self.compress_and_update(
+                seqs_fetchlist, files_to_compress, local_folder
             )
-            self.create_files_with_metadata_info(
-                local_folder, processed_filedict, files_md5_dict, meta_file
+        else:
+            clean_fetchlist = seqs_fetchlist
+        clean_pathlist = [os.path.join(local_folder, fi) for fi in clean_fetchlist]
+        # Only files created during compression have not been verified yet
+        self.verify_local_files(local_folder, clean_fetchlist)
+        for file, path in zip(clean_fetchlist, clean_pathlist):
+            if self.file_checks[path]["gzip_valid"] is not True:
+                corrupted.append(file)
+
+        not_md5sum = []
+        if remote_md5sum:
+            # Get hashes from provided md5sum, create them for those not provided
+            files_md5_dict = {}
+            self.hash_local_files(
+                [
+                    path
+                    for path in clean_pathlist
+                    if os.path.basename(path) not in corrupted
+                    and os.path.basename(path) not in successful_files
+                ]
             )
+            for path in clean_pathlist:
+                f_name = os.path.basename(path)
+                if f_name in corrupted:
+                    clean_fetchlist.remove(f_name)
+                elif f_name in successful_files:
+                    files_md5_dict[f_name] = hash_dict[f_name]
+                else:
+                    if not str(f_name).rstrip(".gz") in files_to_compress:
+                        error_text = "File %s not found in md5sum. Creating hash"
+                        self.log.warning(error_text % f_name)
+                        not_md5sum.append(f_name)
+                    else:
+                        self.log.info(
+                            "File %s was compressed, creating md5hash", f_name
+                        )
+                    files_md5_dict[f_name] = self.get_local_md5(path)
+        else:
+            self.hash_local_files(clean_pathlist)
+            md5_hashes = [self.get_local_md5(path) for path in clean_pathlist]
+            files_md5_dict = dict(zip(clean_fetchlist, md5_hashes))
+        files_md5_dict = {x: y for x, y in files_md5_dict.items() if x not in corrupted}
+        # Compressed copies replace the downloaded files in the lab journal
+        journal = self.get_transfer_journal(local_folder)
+        for f_name in files_to_compress:
+            gz_name = f_name + ".gz"
+            if gz_name not in files_md5_dict:
+                continue
+            try:
+                journal.mark_compressed(
+                    os.path.join(local_folder, f_name),
+                    os.path.join(local_folder, gz_name),
+                    files_md5_dict[gz_name],
+                )
+            except OSError as e:
+                self.log.warning("Could not record %s in journal: %s", gz_name, e)
+        # Keep verified files in the catalog to reuse them in future batches
+        for f_name, md5 in files_md5_dict.items():
+            try:
+                self.catalog.add_file(os.path.join(local_folder, f_name), md5)
+            except (OSError, sqlite3.Error) as e:
+                self.log.warning("Could not add %s to checksum catalog: %s", f_name, e)
+        processed_filedict = self.process_filedict(
+            valid_filedict, clean_fetchlist, corrupted=corrupted, md5miss=not_md5sum
+        )
+        files_stats_dict = {
+            os.path.basename(path): self.file_checks[path] for path in clean_pathlist
+        }
+        self.create_files_with_metadata_info(
+            local_folder,
+            processed_filedict,
+            files_md5_dict,
+            meta_file,
+            stats_dict=files_stats_dict if self.compute_fastq_stats else None,
+        )
+        # Other tasks may be updating logs of the same lab
+        with self.logsum.lock:
             if self.logsum.logs.get(self.current_folder):
                 self.logsum.logs[self.current_folder].update({"path": local_folder})
                 try:
@@ -1318,10 +2401,10 @@ class DownloadManager(BaseModule):
                     self.log.error(
                         "Could not create logsum for %s: %s" % (folder, str(e))
                     )
-            self.log.info(f"Finished processing {folder}")
-            stderr.print(f"[green]Finished processing {folder}")
-            self.finished_folders[folder] = list(files_md5_dict.keys())
-            self.finished_folders[folder].append(meta_file)
+        self.log.info(f"Finished processing {folder}")
+        stderr.print(f"[green]Finished processing {folder}")
+        self.finished_folders[folder] = list(files_md5_dict.keys())
+        self.finished_folders[folder].append(meta_file)
         return
 
     def include_new_key(self, sample=None):
@@ -1402,11 +2485,15 @@ class DownloadManager(BaseModule):
             folders_to_clean = copy.deepcopy(self.finished_folders)
             for folder, downloaded_files in folders_to_clean.items():
                 self.delete_remote_files(folder, files=downloaded_files)
-                self.clean_remote_folder(folder)
+            self.clean_remote_folders(list(folders_to_clean.keys()))
+            for folder in folders_to_clean:
                 self.log.info(f"Delete process finished in remote {folder}")
 
+            # Deferred folders are kept as they are for the next run
             invalid_folders = [
-                key for key in target_folders if key not in folders_to_clean
+                key
+                for key in target_folders
+                if key not in folders_to_clean and key not in self.deferred_folders
             ]
             for folder in invalid_folders:
                 self.rename_remote_folder(folder)
@@ -1,5 +1,10 @@
 #!/usr/bin/env python
+import copy
+import json
 import logging
+import os
+import re
+import threading
 from collections import OrderedDict
 
 log = logging.getLogger(__name__)
@@ -39,3 +44,136 @@ class PhagePlusSchema:
     def get_schema_properties(self):
         """Return the properties defined in the schema"""
         return self.properties
+
+
+class CompiledSchema:
+    """Lookup tables derived once from a json schema so that per-sample work
+    only needs dict lookups instead of walking the schema properties.
+
+    The schema dict and the tables are shared by every module in the process
+    and must be treated as read-only. Use get_schema() to get a copy that can
+    be modified.
+    """
+
+    # Enum values with ontology look like "Value [ONTOLOGY:CODE]"
+    ONTOLOGY_PATTERN = re.compile(r" \[\w+:.*\]$")
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.properties = schema.get("properties", {})
+        self.required = set(schema.get("required", []))
+        self.label_to_property = {}
+        self.property_to_label = {}
+        self.missing_labels = []
+        self.types = {}
+        self.formats = {}
+        self.enums = {}
+        self.enum_ontologies = {}
+        self.ontology_to_property = {}
+        self.classifications = {}
+        for prop, values in self.properties.items():
+            if "label" in values:
+                self.label_to_property[values["label"]] = prop
+                self.property_to_label[prop] = values["label"]
+            else:
+                self.missing_labels.append(prop)
+            self.types[prop] = values.get("type", "string")
+            if "format" in values:
+                self.formats[prop] = values["format"]
+            if values.get("ontology"):
+                self.ontology_to_property[values["ontology"]] = prop
+            if "classification" in values:
+                self.classifications.setdefault(values["classification"], []).append(
+                    prop
+                )
+            if "enum" in values:
+                self.enums[prop] = values["enum"]
+                self.enum_ontologies.update(self.map_enum_ontologies(prop, values))
+        self.date_fields = {
+            prop for prop, fmt in self.formats.items() if fmt in ("date", "date-time")
+        }
+        # Draft versions the schema was already checked against
+        self.valid_drafts = set()
+
+    @classmethod
+    def map_enum_ontologies(cls, prop, values):
+        """Map enum values without ontology to the ones defined in the schema,
+        only for properties whose enum includes ontologies
+
+        Returns:
+            enum_ontologies (dict): {prop: {value: "value [ONTOLOGY:CODE]"}}
+        """
+        if not any(
+            isinstance(enum, str) and cls.ONTOLOGY_PATTERN.search(enum)
+            for enum in values["enum"]
+        ):
+            return {}
+        enum_map = {}
+        for enum in values["enum"]:
+            go_match = re.search(r"(.+) \[\w+:.*", enum)
+            if go_match:
+                enum_map[go_match.group(1)] = enum
+            else:
+                enum_map[enum] = enum
+        return {prop: enum_map}
+
+    def get_schema(self):
+        """Return a copy of the schema dict that callers can modify"""
+        return copy.deepcopy(self.schema)
+
+    def get_type(self, prop, default="string"):
+        """Return the json type of the given property"""
+        return self.types.get(prop, default)
+
+    def get_label(self, prop, default=None):
+        """Return the label of the given property"""
+        return self.property_to_label.get(prop, default)
+
+    def get_property(self, label, default=None):
+        """Return the property with the given label"""
+        return self.label_to_property.get(label, default)
+
+    def check_draft(self, draft_version="2020-12"):
+        """Validate the schema against the json schema draft meta-schema. Only
+        successful checks are remembered, as this is the costliest part of
+        loading a schema.
+
+        Args:
+            draft_version (str): Json schema draft version. Defaults to 2020-12.
+        """
+        if draft_version in self.valid_drafts:
+            return
+        import relecov_tools.assets.schema_utils.jsonschema_draft as jsonschema_draft
+
+        validator_class = jsonschema_draft.SCHEMA_VALIDATORS.get(draft_version)
+        try:
+            validator_class.check_schema(self.schema)
+        except Exception:
+            # Report the errors and ask whether to proceed as usual
+            jsonschema_draft.check_schema_draft(self.schema, draft_version)
+            return
+        self.valid_drafts.add(draft_version)
+
+
+_compiled_schemas = {}
+_compiled_schemas_lock = threading.Lock()
+
+
+def load_compiled_schema(schema_path):
+    """Return the CompiledSchema of the given file. It is built once per process
+    and rebuilt only if the file changes.
+
+    Args:
+        schema_path (str): Path to the json schema file
+
+    Returns:
+        compiled_schema (CompiledSchema): Compiled schema shared by the process
+    """
+    schema_path = os.path.realpath(schema_path)
+    file_stat = os.stat(schema_path)
+    process_key = (schema_path, file_stat.st_size, file_stat.st_mtime_ns)
+    with _compiled_schemas_lock:
+        if process_key not in _compiled_schemas:
+            with open(schema_path, "r", encoding="utf-8") as fh:
+                _compiled_schemas[process_key] = CompiledSchema(json.load(fh))
+        return _compiled_schemas[process_key]
@@ -7,7 +7,7 @@ import openpyxl
 from datetime import datetime
 
 import relecov_tools.utils
-import relecov_tools.assets.schema_utils.jsonschema_draft
+import relecov_tools.json_schema
 import relecov_tools.assets.schema_utils.custom_validators
 from relecov_tools.config_json import ConfigJson
 from relecov_tools.base_module import BaseModule
@@ -22,6 +22,14 @@ stderr = rich.console.Console(
 
 
 class SchemaValidation(BaseModule):
+    profiled_methods = [
+        "__init__",
+        "validate_instances",
+        "create_invalid_metadata",
+        "create_validated_json",
+        "validate",
+    ]
+
     def __init__(
         self,
         json_data_file=None,
@@ -41,7 +49,10 @@ class SchemaValidation(BaseModule):
                 os.path.dirname(os.path.realpath(__file__)), "schema", schema_name
             )
 
-        self.json_schema = relecov_tools.utils.read_json_file(json_schema_file)
+        self.compiled_schema = relecov_tools.json_schema.load_compiled_schema(
+            json_schema_file
+        )
+        self.json_schema = self.compiled_schema.schema
 
         if json_data_file is None:
             json_data_file = relecov_tools.utils.prompt_path(
@@ -141,9 +152,7 @@ class SchemaValidation(BaseModule):
 
     def validate_schema(self):
         """Validate json schema against draft"""
-        relecov_tools.assets.schema_utils.jsonschema_draft.check_schema_draft(
-            self.json_schema, "2020-12"
-        )
+        self.compiled_schema.check_draft("2020-12")
 
     def get_sample_id_field(self):
         """Find the name of the field used to track the samples in the given schema"""
@@ -168,7 +177,7 @@ class SchemaValidation(BaseModule):
         validator = Draft202012Validator(
             self.json_schema, format_checker=FormatChecker()
         )
-        schema_props = self.json_schema["properties"]
+        property_labels = self.compiled_schema.property_to_label
 
         validated_json_data = []
         invalid_json = []
@@ -234,7 +243,7 @@ class SchemaValidation(BaseModule):
 
                     # Try to get the human-readable label from the schema
                     try:
-                        err_field_label = schema_props[error_field]["label"]
+                        err_field_label = property_labels[error_field]
                     except KeyError:
                         self.log.error(f"Could not extract label for {error_field}")
                         err_field_label = error_field
@@ -324,46 +333,27 @@ class SchemaValidation(BaseModule):
             self.log.error(logtxt)
             raise
         tag = "Sample ID given for sequencing"
-        # Check if mandatory colum ($tag) is defined in metadata.
+        # Check if mandatory colum ($tag) is defined in the header of metadata.
         try:
-            id_col = next(
-                idx
-                for idx, cell in enumerate(ws_sheet[1])
+            header_row, id_col = next(
+                (row[0].row, idx)
+                for row in ws_sheet.iter_rows()
+                for idx, cell in enumerate(row)
                 if cell.value is not None and tag in str(cell.value)
             )
         except StopIteration:
-            self.log.error(
-                f"Column with tag '{tag}' not found in the second row of the Excel sheet."
-            )
+            self.log.error(f"Column with tag '{tag}' not found in the Excel sheet.")
             stderr.print(f"[red] Column with tag '{tag}' not found. Cannot continue.")
             raise
-        row_to_del = []
-        row_iterator = ws_sheet.iter_rows(min_row=2, max_row=ws_sheet.max_row)
-        consec_empty_rows = 0
-        for row in row_iterator:
-            # if no data in 10 consecutive rows, break loop
-            if not any(row[x].value for x in range(10)):
-                row_to_del.append(row[0].row)
-                consec_empty_rows += 1
-            if consec_empty_rows > 10:
-                break
-            consec_empty_rows = 0
-            if str(row[id_col].value) not in sample_list:
-                row_to_del.append(row[0].row)
+        # Keep the header block and the rows of invalid samples only
+        sample_list = set(sample_list)
+        row_to_del = [
+            row[0].row
+            for row in ws_sheet.iter_rows(min_row=header_row + 1)
+            if str(row[id_col].value) not in sample_list
+        ]
         stderr.print("Collected rows to create the excel file")
-        if len(row_to_del) > 0:
-            row_to_del.sort(reverse=True)
-            for idx in row_to_del:
-                try:
-                    ws_sheet.delete_rows(idx)
-                except TypeError as e:
-                    self.log.error(
-                        "Unable to delete row %s from metadata file because of",
-                        idx,
-                        e,
-                    )
-                    stderr.print(f"[red] Unable to delete row {idx} becuase of {e}")
-                    sys.exit(1)
+        relecov_tools.utils.delete_excel_rows(ws_sheet, row_to_del)
         os.makedirs(out_folder, exist_ok=True)
         new_name = "invalid_" + os.path.basename(metadata)
         m_file = os.path.join(out_folder, new_name)
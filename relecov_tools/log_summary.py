@@ -5,8 +5,8 @@ import os
 import inspect
 import copy
 import re
+import threading
 
-import openpyxl
 from rich.console import Console
 from datetime import datetime
 from collections import OrderedDict
@@ -56,6 +56,8 @@ class LogSum:
         else:
             self.path = None
         self.logs = {}
+        # Logs can be updated from several threads processing different keys
+        self.lock = threading.RLock()
         return
 
     def feed_key(self, key=None, sample=None, path=None):
@@ -97,28 +99,29 @@ class LogSum:
             sample (str, optional): Name of a sample within key if the log is for it
             one sample instead of the whole key/folder. Defaults to None.
         """
-        feed_dict = OrderedDict({"valid": True, "errors": [], "warnings": []})
-        # Removing strange characters
-        current_key = str(key).replace("./", "")
-        entry, sample = (str(entry), str(sample))
-        if current_key not in self.logs.keys():
-            self.logs[current_key] = copy.deepcopy(feed_dict)
-            self.logs[current_key]["samples"] = OrderedDict()
-        if self.path:
-            self.logs[current_key].update({"path": str(self.path)})
-        if path is not None:
-            self.logs[current_key].update({"path": str(path)})
-        if log_type is None:
-            if sample != "None" and sample not in self.logs[current_key]["samples"]:
-                self.logs[current_key]["samples"][sample] = copy.deepcopy(feed_dict)
+        with self.lock:
+            feed_dict = OrderedDict({"valid": True, "errors": [], "warnings": []})
+            # Removing strange characters
+            current_key = str(key).replace("./", "")
+            entry, sample = (str(entry), str(sample))
+            if current_key not in self.logs.keys():
+                self.logs[current_key] = copy.deepcopy(feed_dict)
+                self.logs[current_key]["samples"] = OrderedDict()
+            if self.path:
+                self.logs[current_key].update({"path": str(self.path)})
+            if path is not None:
+                self.logs[current_key].update({"path": str(path)})
+            if log_type is None:
+                if sample != "None" and sample not in self.logs[current_key]["samples"]:
+                    self.logs[current_key]["samples"][sample] = copy.deepcopy(feed_dict)
+                return
+            if sample == "None":
+                self.logs[current_key][log_type].append(entry)
+            else:
+                if sample not in self.logs[current_key]["samples"].keys():
+                    self.logs[current_key]["samples"][sample] = copy.deepcopy(feed_dict)
+                self.logs[current_key]["samples"][sample][log_type].append(entry)
             return
-        if sample == "None":
-            self.logs[current_key][log_type].append(entry)
-        else:
-            if sample not in self.logs[current_key]["samples"].keys():
-                self.logs[current_key]["samples"][sample] = copy.deepcopy(feed_dict)
-            self.logs[current_key]["samples"][sample][log_type].append(entry)
-        return
 
     def prepare_final_logs(self, logs):
         """Sets valid field to false if any errors were found for each key/sample
@@ -202,6 +205,7 @@ class LogSum:
         def feed_logs_to_excel(logs, excel_outpath):
             """Feed the data from logs into an excel file, creating different
             sheets depending on the provided list from configuration file"""
+            import openpyxl
 
             workbook = openpyxl.Workbook()
             # TODO: Include these fields in configuration.json
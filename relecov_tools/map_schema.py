@@ -2,8 +2,6 @@
 from collections import OrderedDict
 from datetime import datetime
 import json
-import jsonschema
-from jsonschema import Draft202012Validator
 from relecov_tools.config_json import ConfigJson
 import rich.console
 import os
@@ -11,6 +9,7 @@ import sys
 
 # import jsonschema
 import relecov_tools.utils
+import relecov_tools.json_schema
 from relecov_tools.base_module import BaseModule
 
 stderr = rich.console.Console(
@@ -22,6 +21,12 @@ stderr = rich.console.Console(
 
 
 class MappingSchema(BaseModule):
+    profiled_methods = [
+        "__init__",
+        "mapping_json_data",
+        "map_to_data_to_new_schema",
+    ]
+
     def __init__(
         self,
         relecov_schema=None,
@@ -46,16 +51,9 @@ class MappingSchema(BaseModule):
                     "[red] Relecov schema " + relecov_schema + " does not exist"
                 )
                 exit(1)
-        rel_schema_json = relecov_tools.utils.read_json_file(relecov_schema)
-        try:
-            Draft202012Validator.check_schema(rel_schema_json)
-        except jsonschema.ValidationError:
-            self.log.error("Relecov schema does not fulfill Draft 202012 Validation ")
-            stderr.print(
-                "[red] Relecov schema does not fulfill Draft 202012 Validation"
-            )
-            sys.exit(1)
-        self.relecov_schema = rel_schema_json
+        rel_schema = relecov_tools.json_schema.load_compiled_schema(relecov_schema)
+        rel_schema.check_draft("2020-12")
+        self.relecov_schema = rel_schema.get_schema()
 
         if json_file is None:
             json_file = relecov_tools.utils.prompt_path(
@@ -90,15 +88,9 @@ class MappingSchema(BaseModule):
                     self.metadata_file,
                 )
                 sys.exit(1)
-            with open(self.schema_file, "r") as fh:
-                json_schema = json.load(fh)
-            try:
-                Draft202012Validator.check_schema(json_schema)
-            except jsonschema.ValidationError:
-                stderr.print(
-                    "[red] Json schema does not fulfill Draft 202012 Validation"
-                )
-                sys.exit(1)
+            relecov_tools.json_schema.load_compiled_schema(
+                self.schema_file
+            ).check_draft("2020-12")
         elif self.destination_schema == "ENA":
             self.schema_file = os.path.join(
                 os.path.dirname(os.path.realpath(__file__)),
@@ -114,14 +106,15 @@ class MappingSchema(BaseModule):
         else:
             stderr.print("[red] Invalid option for mapping to schena")
             sys.exit(1)
-        with open(self.schema_file, "r") as fh:
-            self.mapped_to_schema = json.load(fh)
+        self.mapped_to_schema = relecov_tools.json_schema.load_compiled_schema(
+            self.schema_file
+        ).get_schema()
 
-        self.ontology = {}
-        for key, values in self.relecov_schema["properties"].items():
-            if values["ontology"] == "0":
-                continue
-            self.ontology[values["ontology"]] = key
+        self.ontology = {
+            ontology: prop
+            for ontology, prop in rel_schema.ontology_to_property.items()
+            if ontology != "0"
+        }
         self.output_folder = output_folder
 
         if os.path.exists(os.path.join(output_folder, "mapping_errors.log")):
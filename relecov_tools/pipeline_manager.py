@@ -19,6 +19,13 @@ stderr = rich.console.Console(
 
 
 class PipelineManager(BaseModule):
+    profiled_methods = [
+        "__init__",
+        "join_valid_items",
+        "process_samples",
+        "pipeline_exc",
+    ]
+
     def __init__(
         self,
         input_folder=None,
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+import cProfile
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Not available in windows, peak RSS is not reported there
+    resource = None
+
+log = logging.getLogger(__name__)
+
+
+def read_io_counters():
+    """Bytes read and written by the current process. /proc/self/io counts every
+    read and write call, resource only counts blocks going to storage
+
+    Returns:
+        io_counters (dict(str:int)): read_bytes and write_bytes
+    """
+    try:
+        with open("/proc/self/io", "r") as fh:
+            counters = dict(line.split(": ") for line in fh.read().splitlines())
+        return {
+            "read_bytes": int(counters["rchar"]),
+            "write_bytes": int(counters["wchar"]),
+        }
+    except (OSError, KeyError, ValueError):
+        if resource is None:
+            return {"read_bytes": 0, "write_bytes": 0}
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return {
+            "read_bytes": usage.ru_inblock * 512,
+            "write_bytes": usage.ru_oublock * 512,
+        }
+
+
+def get_peak_rss():
+    """Maximum resident set size of the current process so far, in bytes"""
+    if resource is None:
+        return 0
+    # ru_maxrss is given in kilobytes in linux and in bytes in macOS
+    rss_unit = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * rss_unit
+
+
+def get_current_rss():
+    """Current resident set size of the process in bytes, 0 if /proc is not
+    available"""
+    try:
+        with open("/proc/self/statm", "r") as fh:
+            resident_pages = int(fh.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return 0
+    return resident_pages * os.sysconf("SC_PAGE_SIZE")
+
+
+class StageProfiler:
+    """Collect the resources used by the main steps of a command: calls, wall
+    and cpu time, bytes read and written and growth of the RSS. Optionally runs
+    cProfile over the whole command.
+
+    Values are inclusive, a step includes the steps it calls. Cpu time, I/O
+    bytes and RSS are measured for the whole process, so steps running in
+    parallel threads also account for the work done by the others. Peak RSS is
+    only reported for the whole command, as the process peak cannot be split
+    between steps.
+    """
+
+    def __init__(self, command=None, cprofile=False):
+        self.command = command
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.start_counters = self.snapshot()
+        if cprofile:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+        else:
+            self.cprofile = None
+
+    @staticmethod
+    def snapshot():
+        counters = {"wall_time": time.perf_counter(), "cpu_time": time.process_time()}
+        counters.update(read_io_counters())
+        return counters
+
+    @contextmanager
+    def stage(self, name):
+        """Measure the code run inside the context as the given step
+
+        Args:
+            name (str): name of the step, e.g. DownloadManager.download
+        """
+        start = self.snapshot()
+        start_rss = get_current_rss()
+        try:
+            yield
+        finally:
+            end = self.snapshot()
+            rss_delta = get_current_rss() - start_rss
+            with self.lock:
+                stats = self.stages.setdefault(
+                    name,
+                    {
+                        "calls": 0,
+                        "wall_time": 0.0,
+                        "cpu_time": 0.0,
+                        "read_bytes": 0,
+                        "write_bytes": 0,
+                        "max_rss_delta": 0,
+                    },
+                )
+                stats["calls"] += 1
+                for key, value in start.items():
+                    stats[key] += end[key] - value
+                # Largest growth of the RSS between the start and end of a call
+                stats["max_rss_delta"] = max(stats["max_rss_delta"], rss_delta)
+
+    def summary(self):
+        """Resources used by the whole command and by each step
+
+        Returns:
+            summary (dict): command, totals and stats of each step
+        """
+        end = self.snapshot()
+        total = {key: end[key] - value for key, value in self.start_counters.items()}
+        total["peak_rss"] = get_peak_rss()
+        with self.lock:
+            stages = {name: dict(stats) for name, stats in self.stages.items()}
+        return {"command": self.command, "total": total, "stages": stages}
+
+    def save(self, profile_path):
+        """Write the summary as json and, when cProfile is active, its stats in
+        a .prof file with the same name, which can be loaded with pstats
+
+        Args:
+            profile_path (str): path of the json file
+
+        Returns:
+            profile_path (str): path of the json file
+        """
+        summary = self.summary()
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            cprofile_path = os.path.splitext(profile_path)[0] + ".prof"
+            self.cprofile.dump_stats(cprofile_path)
+            summary["cprofile"] = cprofile_path
+        with open(profile_path, "w", encoding="utf-8") as fh:
+            fh.write(json.dumps(summary, indent=4))
+        log.info("Profile saved in %s", profile_path)
+        return profile_path
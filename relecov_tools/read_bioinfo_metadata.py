@@ -10,6 +10,7 @@ from rich.prompt import Prompt
 
 import pandas as pd
 import relecov_tools.utils
+import relecov_tools.json_schema
 from relecov_tools.config_json import ConfigJson
 from relecov_tools.base_module import BaseModule
 
@@ -69,6 +70,16 @@ class BioinfoReportLog:
 
 # TODO: Add method to validate bioinfo_config.json file requirements.
 class BioinfoMetadata(BaseModule):
+    profiled_methods = [
+        "__init__",
+        "scann_directory",
+        "add_bioinfo_results_metadata",
+        "get_multiqc_software_versions",
+        "add_bioinfo_files_path",
+        "save_merged_files",
+        "create_bioinfo_file",
+    ]
+
     def __init__(
         self,
         readlabmeta_json_file=None,
@@ -143,7 +154,9 @@ class BioinfoMetadata(BaseModule):
         self.schema_path = os.path.join(
             os.path.dirname(__file__), "schema", "relecov_schema.json"
         )
-        self.bioinfo_schema = relecov_tools.utils.load_schema(self.schema_path)
+        self.bioinfo_schema = relecov_tools.json_schema.load_compiled_schema(
+            self.schema_path
+        )
 
         if self.software_name in available_software:
             self.software_config = bioinfo_config.get_configuration(self.software_name)
@@ -255,11 +268,7 @@ class BioinfoMetadata(BaseModule):
                 for field, value in mapping_fields.items():
                     try:
                         raw_val = map_data[sample_name][value]
-                        expected_type = (
-                            self.bioinfo_schema["properties"]
-                            .get(field, {})
-                            .get("type", "string")
-                        )
+                        expected_type = self.bioinfo_schema.get_type(field)
                         row[field] = relecov_tools.utils.cast_value_to_schema_type(
                             raw_val, expected_type
                         )
@@ -278,11 +287,7 @@ class BioinfoMetadata(BaseModule):
                     for json_field, software_key in value_dict.items():
                         try:
                             raw_val = map_data[software_key][field]
-                            expected_type = (
-                                self.bioinfo_schema["properties"]
-                                .get(json_field, {})
-                                .get("type", "string")
-                            )
+                            expected_type = self.bioinfo_schema.get_type(json_field)
 
                             row[json_field] = (
                                 relecov_tools.utils.cast_value_to_schema_type(
@@ -1,10 +1,10 @@
 #!/usr/bin/env python
-import json
 import rich.console
 import os
 import re
 from datetime import datetime as dtime
 import relecov_tools.utils
+import relecov_tools.json_schema
 from relecov_tools.config_json import ConfigJson
 from relecov_tools.base_module import BaseModule
 
@@ -17,6 +17,14 @@ stderr = rich.console.Console(
 
 
 class RelecovMetadata(BaseModule):
+    profiled_methods = [
+        "__init__",
+        "read_metadata_file",
+        "adding_fields",
+        "adding_ontology_to_enum",
+        "create_metadata_json",
+    ]
+
     def __init__(
         self,
         metadata_file=None,
@@ -83,29 +91,23 @@ class RelecovMetadata(BaseModule):
             output_location=self.output_folder, unique_key=self.lab_code, path=out_path
         )
 
-        with open(relecov_sch_path, "r") as fh:
-            self.relecov_sch_json = json.load(fh)
-
+        self.relecov_schema = relecov_tools.json_schema.load_compiled_schema(
+            relecov_sch_path
+        )
+        self.relecov_sch_json = self.relecov_schema.schema
         try:
-            relecov_tools.assets.schema_utils.jsonschema_draft.check_schema_draft(
-                self.relecov_sch_json, "2020-12"
-            )
+            self.relecov_schema.check_draft("2020-12")
         except Exception as e:
             self.log.error("JSON schema is not valid: %s", str(e))
             stderr.print(f"[red]Error: JSON schema is not valid.\n{str(e)}")
             raise
 
-        self.label_prop_dict = {}
-
-        for prop, values in self.relecov_sch_json["properties"].items():
-            try:
-                self.label_prop_dict[values["label"]] = prop
-            except KeyError:
-                self.log.warning("Property %s does not have 'label' attribute", prop)
-                stderr.print(
-                    "[orange]Property " + prop + " does not have 'label' attribute"
-                )
-                continue
+        self.label_prop_dict = self.relecov_schema.label_to_property
+        for prop in self.relecov_schema.missing_labels:
+            self.log.warning("Property %s does not have 'label' attribute", prop)
+            stderr.print(
+                "[orange]Property " + prop + " does not have 'label' attribute"
+            )
         self.date = dtime.now().strftime("%Y%m%d%H%M%S")
         self.json_req_files = config_json.get_topic_data(
             "lab_metadata", "lab_metadata_req_json"
@@ -132,11 +134,10 @@ class RelecovMetadata(BaseModule):
 
         def safely_calculate_md5(file):
             """Check file md5, but return Not Provided if file does not exist"""
-            self.log.info("Generating md5 hash for %s...", str(file))
-            try:
-                return relecov_tools.utils.calculate_md5(file)
-            except IOError:
+            md5_value = new_md5_dict.get(file)
+            if md5_value is None:
                 return "Not Provided [SNOMED:434941000124101]"
+            return md5_value
 
         # The files are and md5file are supposed to be located together
         dir_path = self.files_folder
@@ -154,6 +155,19 @@ class RelecovMetadata(BaseModule):
             md5_dict = {}
             self.log.warning("No md5sum file found.")
             self.log.warning("Generating new md5 hashes. This might take a while...")
+        # Hash all the files missing in md5sum at once
+        missing_md5 = [
+            os.path.join(dir_path, sample.get(file_key))
+            for sample in clean_metadata_rows
+            for file_key in ["sequence_file_R1", "sequence_file_R2"]
+            if sample.get(file_key) and not md5_dict.get(sample.get(file_key))
+        ]
+        missing_md5 = [file for file in missing_md5 if os.path.exists(file)]
+        if missing_md5:
+            self.log.info("Generating md5 hash for %s files...", len(missing_md5))
+        new_md5_dict = relecov_tools.utils.calculate_md5_batch(
+            missing_md5, ignore_errors=True
+        )
         j_data = {}
         no_fastq_error = "No R1 fastq file was given for sample %s in metadata"
         for sample in clean_metadata_rows:
@@ -201,7 +215,7 @@ class RelecovMetadata(BaseModule):
                     files_dict["sequence_file_R2_md5"] = r2_md5
                 else:
                     files_dict["sequence_file_R2_md5"] = safely_calculate_md5(
-                        os.path.join(dir_path, r1_file)
+                        os.path.join(dir_path, r2_file)
                     )
             j_data[sample_id] = files_dict
         if not any(val for val in j_data.values()):
@@ -303,29 +317,13 @@ class RelecovMetadata(BaseModule):
         which have an enum property value, replace the value for the one
         that is defined in the schema.
         """
-        enum_dict = {}
-        for prop, values in self.relecov_sch_json["properties"].items():
-            enum_values = values.get("enum", [])
-            ontologies_present = any(
-                isinstance(enum, str) and re.search(r" \[\w+:.*\]$", enum)
-                for enum in enum_values
-            )
-            if not ontologies_present:
-                continue
-            if "enum" in values:
-                enum_dict[prop] = {}
-                for enum in values["enum"]:
-                    go_match = re.search(r"(.+) \[\w+:.*", enum)
-                    if go_match:
-                        enum_dict[prop][go_match.group(1)] = enum
-                    else:
-                        enum_dict[prop][enum] = enum
+        enum_dict = self.relecov_schema.enum_ontologies
         ontology_errors = {}
         for idx in range(len(m_data)):
             for key, e_values in enum_dict.items():
                 if key in m_data[idx]:
                     current_value = m_data[idx][key]
-                    if re.search(r" \[\w+:.*\]$", current_value):
+                    if self.relecov_schema.ONTOLOGY_PATTERN.search(current_value):
                         continue  # If already has ontology, do nothing.
                     if current_value in e_values:
                         m_data[idx][key] = e_values[current_value]
@@ -350,7 +348,7 @@ class RelecovMetadata(BaseModule):
     def process_from_json(self, m_data, json_fields):
         """Find the labels that are missing in the file to match the given schema."""
         map_field = json_fields["map_field"]
-        col_name = self.relecov_sch_json["properties"].get(map_field).get("label")
+        col_name = self.relecov_schema.get_label(map_field)
         json_data = json_fields["j_data"]
         for idx in range(len(m_data)):
             sample_id = str(m_data[idx].get("sequencing_sample_id"))
@@ -400,9 +398,7 @@ class RelecovMetadata(BaseModule):
             ".fa": "FASTA",
         }
 
-        file_format_enum = (
-            self.relecov_sch_json["properties"].get("file_format", {}).get("enum", [])
-        )
+        file_format_enum = self.relecov_schema.enums.get("file_format", [])
         keyword_to_enum = {}
 
         for item in file_format_enum:
@@ -503,10 +499,19 @@ class RelecovMetadata(BaseModule):
             ws_metadata_lab, heading_row_number = relecov_tools.utils.read_excel_file(
                 self.metadata_file, alt_sheet, header_flag, leave_empty=False
             )
+        # Convert each column at once, skipping the ones that are not metadata
+        columns = {}
+        if ws_metadata_lab:
+            for key in ws_metadata_lab[0].keys():
+                if header_flag in key:
+                    continue
+                columns[key] = self.convert_metadata_column(
+                    key, [row[key] for row in ws_metadata_lab]
+                )
         valid_metadata_rows = []
-        included_sample_ids = []
+        included_sample_ids = set()
         row_number = heading_row_number
-        for row in ws_metadata_lab:
+        for idx, row in enumerate(ws_metadata_lab):
             row_number += 1
             property_row = {}
             try:
@@ -524,66 +529,86 @@ class RelecovMetadata(BaseModule):
                 self.logsum.add_warning(entry=log_text)
                 stderr.print(f"[red]{log_text}")
                 continue
-            included_sample_ids.append(sample_id)
-            for key in row.keys():
-                if header_flag in key:
-                    continue
-                value = row[key]
+            included_sample_ids.add(sample_id)
+            for key, (schema_key, converted) in columns.items():
+                value, issue, log_text = converted[idx]
                 # Omitting empty or not provided values
-                if value is None or "not provided" in str(value).lower():
+                if issue == "not_provided":
                     log_text = f"{key} not provided for sample {sample_id}"
                     self.logsum.add_warning(sample=sample_id, entry=log_text)
                     continue
-                # Get JSON schema type
-                schema_key = self.label_prop_dict.get(key, key)
-                schema_type = (
-                    self.relecov_sch_json["properties"]
-                    .get(schema_key, {})
-                    .get("type", "string")
-                )
-                # Conversion of values according to expected type
-                try:
-                    value = relecov_tools.utils.cast_value_to_schema_type(
-                        value, schema_type
-                    )
-                except (ValueError, TypeError) as e:
-                    log_text = f"Type conversion error for {key} (expected {schema_type}): {value}. {str(e)}"
+                if issue == "type_error":
                     self.logsum.add_error(sample=sample_id, entry=log_text)
                     stderr.print(f"[red]{log_text}")
                     continue
-                if "date" in key.lower():
-                    # Check if date is a string. Format YYYY/MM/DD to YYYY-MM-DD
-                    pattern = r"^\d{4}[-/.]\d{2}[-/.]\d{2}"
-                    if isinstance(row[key], dtime):
-                        row[key] = str(row[key].date())
-                    elif re.match(pattern, str(row[key])):
-                        row[key] = str(row[key]).replace("/", "-").replace(".", "-")
-                        row[key] = re.match(pattern, row[key]).group(0)
-                    else:
-                        try:
-                            row[key] = str(int(float(str(row[key]))))
-                            self.log.info(
-                                "Date given as an integer. Understood as a year"
-                            )
-                        except (ValueError, TypeError):
-                            log_text = f"Invalid date format in {key}: {row[key]}"
-                            self.logsum.add_error(sample=sample_id, entry=log_text)
-                            stderr.print(f"[red]{log_text} for sample {sample_id}")
-                            continue
-                elif "sample id" in key.lower():
-                    if isinstance(row[key], float) or isinstance(row[key], int):
-                        row[key] = str(int(row[key]))
-                else:
-                    if isinstance(row[key], float) or isinstance(row[key], int):
-                        row[key] = str(row[key])
-                if "date" not in key.lower() and isinstance(row[key], dtime):
-                    logtxt = f"Non-date field {key} provided as date. Parsed as int"
-                    self.logsum.add_warning(sample=sample_id, entry=logtxt)
-                    row[key] = str(relecov_tools.utils.excel_date_to_num(row[key]))
+                if issue == "invalid_date":
+                    self.logsum.add_error(sample=sample_id, entry=log_text)
+                    stderr.print(f"[red]{log_text} for sample {sample_id}")
+                    continue
+                if issue == "year":
+                    self.log.info("Date given as an integer. Understood as a year")
+                elif issue == "date_as_number":
+                    self.logsum.add_warning(sample=sample_id, entry=log_text)
                 property_row[schema_key] = value
             valid_metadata_rows.append(property_row)
         return valid_metadata_rows
 
+    def convert_metadata_column(self, key, values):
+        """Convert the values of a metadata column to the type of its schema
+        property. Each distinct value is only converted once, as columns usually
+        repeat a few values (dates, enums, Not Provided...) across many samples.
+
+        Args:
+            key (str): Label of the column in the metadata excel
+            values (list): Values of the column, one per row
+
+        Returns:
+            schema_key (str): Property of the column in the schema
+            converted (list(tuple)): (value, issue, log_text) for each row. Issue
+            is None when the value is valid, "not_provided", "type_error" and
+            "invalid_date" when it must be skipped, and "year" or "date_as_number"
+            when it was converted with a warning
+        """
+        schema_key = self.label_prop_dict.get(key, key)
+        schema_type = self.relecov_schema.get_type(schema_key)
+        is_date = "date" in key.lower()
+        date_pattern = re.compile(r"^\d{4}[-/.]\d{2}[-/.]\d{2}")
+
+        def convert(value):
+            if value is None or "not provided" in str(value).lower():
+                return (None, "not_provided", None)
+            try:
+                cast_value = relecov_tools.utils.cast_value_to_schema_type(
+                    value, schema_type
+                )
+            except (ValueError, TypeError) as e:
+                log_text = f"Type conversion error for {key} (expected {schema_type}): {value}. {str(e)}"
+                return (None, "type_error", log_text)
+            if not is_date:
+                if isinstance(value, dtime):
+                    logtxt = f"Non-date field {key} provided as date. Parsed as int"
+                    return (cast_value, "date_as_number", logtxt)
+                return (cast_value, None, None)
+            # Dates must be datetimes, start with YYYY-MM-DD or be a year
+            if isinstance(value, dtime) or date_pattern.match(str(value)):
+                return (cast_value, None, None)
+            try:
+                int(float(str(value)))
+                return (cast_value, "year", None)
+            except (ValueError, TypeError):
+                log_text = f"Invalid date format in {key}: {value}"
+                return (None, "invalid_date", log_text)
+
+        conversions = {}
+        converted = []
+        for value in values:
+            # 1, 1.0 and True are equal keys in a dict but not the same value
+            value_key = (type(value), value)
+            if value_key not in conversions:
+                conversions[value_key] = convert(value)
+            converted.append(conversions[value_key])
+        return schema_key, converted
+
     def create_metadata_json(self):
         stderr.print("[blue]Reading Lab Metadata Excel File")
         valid_metadata_rows = self.read_metadata_file()
@@ -1,10 +1,28 @@
+import errno
+import hashlib
+import json
 import logging
 import os
 import paramiko
+import queue
 import rich.console
 import stat
 import sys
+import threading
 import time
+import zlib
+from contextlib import contextmanager
+from paramiko.sftp import (
+    CMD_CLOSE,
+    CMD_HANDLE,
+    CMD_NAME,
+    CMD_OPENDIR,
+    CMD_READDIR,
+    CMD_REMOVE,
+    CMD_RENAME,
+    CMD_RMDIR,
+    CMD_STATUS,
+)
 from relecov_tools.config_json import ConfigJson
 import relecov_tools.utils
 
@@ -17,6 +35,273 @@ stderr = rich.console.Console(
 )
 
 
+class TransferJournal:
+    """Keep track of the files downloaded for a lab: remote path, remote size and
+    mtime, local path and the bytes already committed to disk for each one, so an
+    interrupted transfer can be resumed instead of starting again from byte zero,
+    also from a later run downloading into a new folder.
+    Completed entries also record the md5, size and mtime of the local file, so
+    the journal works as a manifest of the lab files for incremental syncs.
+    Entries are keyed by file name. Each change is appended to the journal file
+    as a json line instead of rewriting the whole file.
+    """
+
+    # Rewrite the journal once it has this many lines per entry
+    compact_ratio = 4
+
+    def __init__(self, journal_path):
+        self.journal_path = journal_path
+        self.lock = threading.Lock()
+        self.entries = {}
+        os.makedirs(os.path.dirname(os.path.abspath(journal_path)), exist_ok=True)
+        n_lines, valid = self.load() if os.path.isfile(journal_path) else (0, True)
+        if not valid or n_lines > self.compact_ratio * max(len(self.entries), 1):
+            self.compact()
+
+    def load(self):
+        """Replay the records of the journal file
+
+        Returns:
+            n_lines (int): number of lines in the journal file
+            valid (bool): False if any line could not be read, which happens if
+            the process was killed while writing it
+        """
+        n_lines = 0
+        valid = True
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as fh:
+                for line in fh:
+                    n_lines += 1
+                    try:
+                        record = json.loads(line)
+                        self.apply(record["file"], record["op"], record["fields"])
+                    except (ValueError, KeyError, TypeError):
+                        valid = False
+        except (OSError, UnicodeDecodeError) as e:
+            log.warning("Could not read transfer journal %s: %s", self.journal_path, e)
+            valid = False
+        return n_lines, valid
+
+    def apply(self, name, op, fields):
+        """Apply a change to the entry of the given file name"""
+        if op == "remove":
+            self.entries.pop(name, None)
+        elif op == "set":
+            self.entries[name] = dict(fields)
+        else:
+            self.entries.setdefault(name, {}).update(fields)
+        return
+
+    def write(self, name, op, fields=None):
+        """Apply a change and append it to the journal file"""
+        fields = fields or {}
+        with self.lock:
+            self.apply(name, op, fields)
+            record = {"file": name, "op": op, "fields": fields}
+            with open(self.journal_path, "a", encoding="utf-8") as fh:
+                fh.write(json.dumps(record, sort_keys=True) + "\n")
+        return
+
+    def compact(self):
+        """Rewrite the journal with a single record for each entry"""
+        with self.lock:
+            temp_path = self.journal_path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as fh:
+                for name, entry in self.entries.items():
+                    record = {"file": name, "op": "set", "fields": entry}
+                    fh.write(json.dumps(record, sort_keys=True) + "\n")
+            os.replace(temp_path, self.journal_path)
+        return
+
+    def get_entry(self, local_path):
+        """Return a copy of the entry for the given file name. None if not found"""
+        with self.lock:
+            entry = self.entries.get(os.path.basename(local_path))
+            return dict(entry) if entry is not None else None
+
+    def update_entry(self, local_path, **fields):
+        """Update the fields of the entry for the given local file"""
+        fields["local_path"] = local_path
+        self.write(os.path.basename(local_path), "update", fields)
+        return
+
+    def set_entry(self, local_path, **fields):
+        """Replace the entry for the given local file with the given fields"""
+        fields["local_path"] = local_path
+        self.write(os.path.basename(local_path), "set", fields)
+        return
+
+    def remove_entry(self, local_path):
+        """Forget the given local file, next transfer will start from scratch"""
+        if self.get_entry(local_path) is not None:
+            self.write(os.path.basename(local_path), "remove")
+        return
+
+    def resume_offset(self, local_path, remote_path, remote_attr):
+        """Register a new transfer and return the offset it can be resumed from.
+        Only resume if the remote file did not change and the local one has at
+        least the committed bytes. Incomplete files left by a previous run in
+        another folder are moved to local_path to be resumed.
+
+        Args:
+            local_path (str): local path of the file being downloaded
+            remote_path (str): path of the file in remote sftp
+            remote_attr (SFTPAttributes): current attributes of the remote file
+
+        Returns:
+            committed (int): number of bytes already in the local file
+        """
+        entry = self.get_entry(local_path) or {}
+        committed = 0
+        if (
+            entry.get("remote_size") == remote_attr.st_size
+            and entry.get("remote_mtime") == remote_attr.st_mtime
+        ):
+            partial_path = entry.get("local_path", local_path)
+            if partial_path != local_path and not entry.get("complete"):
+                try:
+                    if os.path.isfile(partial_path) and not os.path.exists(local_path):
+                        os.replace(partial_path, local_path)
+                        log.info(
+                            "Moved partial download %s to %s", partial_path, local_path
+                        )
+                        partial_path = local_path
+                except OSError as e:
+                    log.warning(
+                        "Could not reuse partial download %s: %s", partial_path, e
+                    )
+            if partial_path == local_path and os.path.isfile(local_path):
+                committed = min(entry.get("committed", 0), os.path.getsize(local_path))
+        self.set_entry(
+            local_path,
+            remote_path=remote_path,
+            remote_size=remote_attr.st_size,
+            remote_mtime=remote_attr.st_mtime,
+            committed=committed,
+            complete=False,
+        )
+        return committed
+
+    def mark_complete(self, local_path, md5):
+        """Record a finished download with the md5, size and mtime of local file"""
+        local_stat = os.stat(local_path)
+        self.update_entry(
+            local_path,
+            complete=True,
+            md5=md5,
+            local_size=local_stat.st_size,
+            local_mtime=local_stat.st_mtime,
+        )
+        return
+
+    def mark_compressed(self, local_path, final_path, final_md5):
+        """Record the compressed copy that replaced a downloaded file, so the
+        file can still be synced once the downloaded one is removed
+
+        Args:
+            local_path (str): local path of the downloaded file
+            final_path (str): local path of its compressed copy
+            final_md5 (str): md5 hexdigest of the compressed copy
+        """
+        final_stat = os.stat(final_path)
+        self.update_entry(
+            local_path,
+            final_path=final_path,
+            final_md5=final_md5,
+            final_size=final_stat.st_size,
+            final_mtime=final_stat.st_mtime,
+        )
+        return
+
+    @staticmethod
+    def is_unchanged(file_path, size, mtime=None):
+        """Check if a local file still has the given size and mtime"""
+        try:
+            file_stat = os.stat(file_path)
+        except OSError:
+            return False
+        if file_stat.st_size != size:
+            return False
+        return mtime is None or file_stat.st_mtime == mtime
+
+    def remote_changed(self, entry, remote_attr=None):
+        """Check if the remote file changed since the entry was recorded"""
+        return remote_attr is not None and (
+            entry.get("remote_size") != remote_attr.st_size
+            or entry.get("remote_mtime") != remote_attr.st_mtime
+        )
+
+    def synced_entry(self, local_path, remote_attr=None):
+        """Return the entry of the local file if it was completely downloaded, it
+        was not modified afterwards and the remote file did not change since then
+
+        Args:
+            local_path (str): local path of the downloaded file
+            remote_attr (SFTPAttributes, optional): current attributes of the
+            remote file. Remote changes are not checked if not given.
+
+        Returns:
+            entry (dict): journal entry for the file. None if it is not synced
+        """
+        entry = self.get_entry(local_path)
+        if not entry or not entry.get("complete"):
+            return None
+        if entry.get("local_path", local_path) != local_path:
+            return None
+        if self.remote_changed(entry, remote_attr):
+            return None
+        local_size = entry.get("local_size", entry["remote_size"])
+        if not self.is_unchanged(local_path, local_size, entry.get("local_mtime")):
+            return None
+        return entry
+
+    def synced_copy(self, local_path, remote_attr=None):
+        """Return the entry of a file downloaded in any folder and the path of a
+        copy still synced with the remote file: the downloaded file itself or,
+        once it was compressed and removed, its compressed copy
+
+        Args:
+            local_path (str): local path of the file, only its name is used
+            remote_attr (SFTPAttributes, optional): current attributes of the
+            remote file. Remote changes are not checked if not given.
+
+        Returns:
+            entry (dict): journal entry for the file. None if there is no copy
+            copy_path (str): path of the synced copy. None if there is no copy
+        """
+        entry = self.get_entry(local_path)
+        if not entry or not entry.get("complete"):
+            return None, None
+        if self.remote_changed(entry, remote_attr):
+            return None, None
+        downloaded = entry.get("local_path", local_path)
+        local_size = entry.get("local_size", entry["remote_size"])
+        if self.is_unchanged(downloaded, local_size, entry.get("local_mtime")):
+            return entry, downloaded
+        final_path = entry.get("final_path")
+        if final_path and self.is_unchanged(
+            final_path, entry.get("final_size"), entry.get("final_mtime")
+        ):
+            return entry, final_path
+        return None, None
+
+    def is_complete(self, local_path, remote_attr=None):
+        """Check if the local file was completely downloaded and is still synced"""
+        return self.synced_entry(local_path, remote_attr) is not None
+
+
+class ResponseCollector:
+    """Receive the responses of sftp requests sent without waiting for them, in
+    the same way paramiko SFTPFile does for prefetched reads
+    """
+
+    def __init__(self):
+        self.responses = {}
+
+    def _async_response(self, t, msg, num):
+        self.responses[num] = (t, msg)
+
+
 class SftpRelecov:
     """Class to handle SFTP connection with remote server. It uses paramiko library to establish
     the connection. The class can be used to upload and download files from the remote server.
@@ -31,6 +316,23 @@ class SftpRelecov:
     }
     """
 
+    # Size of the blocks read from remote files during hashed transfers
+    transfer_chunk_size = 1048576  # 1 Mbyte
+    # Bytes written between two updates of the transfer journal
+    journal_commit_interval = 67108864  # 64 Mbytes
+    # Maximum number of outstanding requests in pipelined operations
+    pipeline_window = 64
+    # Private paramiko methods used to pipeline requests. If a paramiko version
+    # lacks any of them the public sequential calls are used instead
+    pipeline_methods = (
+        "_async_request",
+        "_read_response",
+        "_convert_status",
+        "_adjust_cwd",
+    )
+    # Seconds between keepalive messages sent over idle connections
+    keepalive_interval = 30
+
     def __init__(self, conf_file=None, username=None, password=None):
         if conf_file is None:
             config_json = ConfigJson()
@@ -58,6 +360,14 @@ class SftpRelecov:
         self.password = password
         self.client = paramiko.SSHClient()
         self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        # Increased on every (re)connection, used to discard outdated channels
+        self.connection_generation = 0
+        self.connection_lock = threading.Lock()
+        self.channel_pool = None
+        # In-memory snapshot of the remote folders: {folder: {name: SFTPAttributes}}
+        self.remote_tree = None
+        self.remote_tree_root = None
+        self.tree_lock = threading.RLock()
 
     def reconnect_if_fail(n_times, sleep_time):
         def decorator(func):
@@ -65,15 +375,19 @@ class SftpRelecov:
                 more_sleep_time = 0
                 retries = 0
                 while retries < n_times:
+                    generation = self.connection_generation
                     try:
                         return func(self, *args, **kwargs)
+                    except FileNotFoundError:
+                        # Missing remote paths are not a connection problem
+                        raise
                     except Exception:
                         retries += 1
                         log.info("Connection lost. Trying to reconnect...")
                         time.sleep(more_sleep_time)
                         # Try extending sleep time before reconnecting in each step
                         more_sleep_time = more_sleep_time + sleep_time
-                        self.open_connection()
+                        self.reconnect(generation)
                 else:
                     log.error("Could not reconnect to remote client")
                 return func(self, *args, **kwargs)
@@ -100,8 +414,376 @@ class SftpRelecov:
             log.error("Could not establish SFTP connection: %s", e)
             stderr.print("[red]Could not establish SFTP connection")
             return False
+        # Keep idle connections alive while other folders are processed
+        self.client.get_transport().set_keepalive(self.keepalive_interval)
+        self.connection_generation += 1
         return True
 
+    def is_connected(self):
+        """Check if the connection and its sftp channel are still open"""
+        transport = self.client.get_transport()
+        sftp = getattr(self, "sftp", None)
+        return bool(
+            transport is not None
+            and transport.is_active()
+            and sftp is not None
+            and not sftp.get_channel().closed
+        )
+
+    def ensure_connection(self):
+        """Open the connection only if it was not opened yet or it was lost
+
+        Returns:
+            bool: True if the connection is open
+        """
+        with self.connection_lock:
+            if self.is_connected():
+                return True
+            return self.open_connection()
+
+    def new_session(self):
+        """Create a new client for the same server and credentials, with its own
+        connection but sharing the remote snapshot of this one
+
+        Returns:
+            session (SftpRelecov): new client, connection is not opened yet
+        """
+        session = SftpRelecov.__new__(SftpRelecov)
+        session.sftp_server = self.sftp_server
+        session.sftp_port = self.sftp_port
+        session.user_name = self.user_name
+        session.password = self.password
+        session.client = paramiko.SSHClient()
+        session.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        session.connection_generation = 0
+        session.connection_lock = threading.Lock()
+        session.channel_pool = None
+        with self.tree_lock:
+            session.remote_tree = self.remote_tree
+            session.remote_tree_root = self.remote_tree_root
+        session.tree_lock = self.tree_lock
+        return session
+
+    def reconnect(self, generation):
+        """Open the connection again unless another thread already did it after
+        the given generation failed
+
+        Args:
+            generation (int): connection_generation used by the failed operation
+        """
+        with self.connection_lock:
+            if generation != self.connection_generation:
+                return True
+            return self.open_connection()
+
+    def open_channel_pool(self, size):
+        """Open a pool of sftp channels over the active connection so several
+        transfers can run in parallel, each one with its own channel window
+
+        Args:
+            size (int): number of channels in the pool
+        """
+        self.close_channel_pool()
+        log.info("Opening a pool of %s SFTP channels", size)
+        self.channel_pool = queue.Queue()
+        for _ in range(size):
+            self.channel_pool.put((self.connection_generation, None))
+        return
+
+    def close_channel_pool(self):
+        """Close every channel in the pool, if any"""
+        if self.channel_pool is None:
+            return
+        while not self.channel_pool.empty():
+            _, channel = self.channel_pool.get()
+            if channel is not None:
+                try:
+                    channel.close()
+                except Exception as e:
+                    log.warning("Could not close pooled sftp channel: %s", e)
+        self.channel_pool = None
+        return
+
+    @contextmanager
+    def pooled_channel(self):
+        """Borrow a sftp channel from the pool, or the main one if no pool is
+        open. Channels from a previous connection are replaced by new ones"""
+        pool = self.channel_pool
+        if pool is None:
+            yield self.sftp
+            return
+        generation, channel = pool.get()
+        try:
+            if channel is None or generation != self.connection_generation:
+                if channel is not None:
+                    channel.close()
+                channel = None
+                generation = self.connection_generation
+                channel = self.client.open_sftp()
+            yield channel
+        except (FileNotFoundError, PermissionError):
+            raise
+        except Exception:
+            # Do not give a channel back in an unknown state
+            if channel is not None:
+                channel.close()
+            channel = None
+            raise
+        finally:
+            pool.put((generation, channel))
+
+    @staticmethod
+    def can_pipeline(sftp):
+        """Check if the installed paramiko provides the private methods needed
+        to send pipelined requests over the given channel
+        """
+        return all(
+            hasattr(sftp, method) for method in SftpRelecov.pipeline_methods
+        ) and hasattr(paramiko.SFTPAttributes, "_from_msg")
+
+    @staticmethod
+    def sequential_requests(function, args_list):
+        """Call the function once for each set of arguments, waiting for each
+        response. Used when requests cannot be pipelined.
+
+        Args:
+            function (callable): public paramiko SFTPClient method
+            args_list (list(tuple)): arguments for each call
+
+        Returns:
+            errors (list(Exception)): error raised by each call, None if it was
+            successful
+        """
+        errors = []
+        for args in args_list:
+            try:
+                function(*args)
+                errors.append(None)
+            except (IOError, EOFError) as e:
+                errors.append(e)
+        return errors
+
+    def pipelined_requests(self, sftp, requests):
+        """Send several sftp requests over the same channel without waiting for
+        each response, so a batch of operations costs a few round-trips instead
+        of one per operation. At most pipeline_window requests are outstanding.
+
+        Args:
+            sftp (paramiko.SFTPClient): channel used to send the requests
+            requests (list(tuple)): sftp command and its arguments for each request
+
+        Returns:
+            responses (list(tuple)): (response_type, message, error) for each
+            request in the same order. error is the exception for the returned
+            status, None if it was successful
+        """
+        collector = ResponseCollector()
+        responses = [None] * len(requests)
+        pending = {}
+        next_request = 0
+        while next_request < len(requests) or pending:
+            while next_request < len(requests) and len(pending) < self.pipeline_window:
+                command, *args = requests[next_request]
+                num = sftp._async_request(collector, command, *args)
+                pending[num] = next_request
+                next_request += 1
+            while not any(num in collector.responses for num in pending):
+                sftp._read_response()
+            for num in [num for num in pending if num in collector.responses]:
+                t, msg = collector.responses.pop(num)
+                error = None
+                if t == CMD_STATUS:
+                    try:
+                        sftp._convert_status(msg)
+                    except (IOError, EOFError) as e:
+                        error = e
+                responses[pending.pop(num)] = (t, msg, error)
+        return responses
+
+    def listdir_attr_many(self, folders):
+        """List the content of several remote folders at once with pipelined
+        requests
+
+        Args:
+            folders (list(str)): remote folders to list
+
+        Returns:
+            listings (dict(str:list(SFTPAttributes))): content of each folder
+        """
+        listings = {folder: [] for folder in folders}
+        # Handles are only valid in the channel that opened them
+        with self.pooled_channel() as sftp:
+            if not self.can_pipeline(sftp):
+                for folder in folders:
+                    listings[folder] = sftp.listdir_attr(folder)
+                return listings
+            responses = self.pipelined_requests(
+                sftp, [(CMD_OPENDIR, sftp._adjust_cwd(path)) for path in folders]
+            )
+            handles = {
+                folder: msg.get_binary()
+                for folder, (t, msg, error) in zip(folders, responses)
+                if error is None and t == CMD_HANDLE
+            }
+            try:
+                for folder, (t, _, error) in zip(folders, responses):
+                    if error is not None:
+                        raise error
+                    if t != CMD_HANDLE:
+                        raise paramiko.SFTPError(f"Expected handle listing {folder}")
+                active = list(handles)
+                while active:
+                    responses = self.pipelined_requests(
+                        sftp, [(CMD_READDIR, handles[folder]) for folder in active]
+                    )
+                    still_active = []
+                    for folder, (t, msg, error) in zip(active, responses):
+                        if isinstance(error, EOFError):
+                            # No more entries in folder
+                            continue
+                        if error is not None:
+                            raise error
+                        if t != CMD_NAME:
+                            raise paramiko.SFTPError(
+                                f"Expected name response for {folder}"
+                            )
+                        for _ in range(msg.get_int()):
+                            filename = msg.get_text()
+                            longname = msg.get_text()
+                            attr = paramiko.SFTPAttributes._from_msg(
+                                msg, filename, longname
+                            )
+                            if filename not in (".", ".."):
+                                listings[folder].append(attr)
+                        still_active.append(folder)
+                    active = still_active
+            finally:
+                self.pipelined_requests(
+                    sftp, [(CMD_CLOSE, handle) for handle in handles.values()]
+                )
+        return listings
+
+    @reconnect_if_fail(n_times=3, sleep_time=30)
+    def build_remote_tree(self, root="."):
+        """Walk the remote folders once with listdir_attr and keep an in-memory
+        snapshot of names, sizes, mtimes and modes. Listings within the root are
+        served from this snapshot afterwards, which is kept updated by the
+        rename, remove, make_dir and upload methods of this class.
+
+        Args:
+            root (str, optional): remote folder to walk. Defaults to ".".
+
+        Returns:
+            remote_tree (dict(str:dict(str:SFTPAttributes))): attributes of the
+            content of each remote folder
+        """
+        log.info("Building snapshot of remote folders in %s", root)
+        remote_tree = {}
+        # All the folders in the same depth are listed at once
+        level_folders = [root]
+        while level_folders:
+            listings = self.listdir_attr_many(level_folders)
+            level_folders = []
+            for folder, attributes in listings.items():
+                folder_content = remote_tree[os.path.normpath(folder)] = {}
+                for attribute in attributes:
+                    folder_content[attribute.filename] = attribute
+                    if stat.S_ISDIR(attribute.st_mode):
+                        level_folders.append(os.path.join(folder, attribute.filename))
+        with self.tree_lock:
+            self.remote_tree = remote_tree
+            self.remote_tree_root = os.path.normpath(root)
+        log.info("Remote snapshot includes %s folders", len(remote_tree))
+        return remote_tree
+
+    def clear_remote_tree(self):
+        """Discard the remote snapshot, listings will be requested to the server"""
+        with self.tree_lock:
+            self.remote_tree = None
+            self.remote_tree_root = None
+        return
+
+    def tree_key(self, path):
+        """Return the key of the given remote path in the snapshot, or None if
+        there is no snapshot or the path is outside of it"""
+        if self.remote_tree is None:
+            return None
+        key = os.path.normpath(path)
+        root = self.remote_tree_root
+        if root == ".":
+            covered = not os.path.isabs(key) and not key.startswith("..")
+        else:
+            covered = key == root or key.startswith(root + "/")
+        return key if covered else None
+
+    def listdir_attr(self, folder_name):
+        """List the attributes of a remote folder content, using the snapshot
+        if the folder is within it
+
+        Args:
+            folder_name (str): path of the folder in remote sftp
+
+        Returns:
+            attribute_list (list(SFTPAttributes)): attributes of each element
+        """
+        key = self.tree_key(folder_name)
+        if key is None:
+            with self.pooled_channel() as sftp:
+                return sftp.listdir_attr(folder_name)
+        with self.tree_lock:
+            if key not in self.remote_tree:
+                raise FileNotFoundError(errno.ENOENT, "No such folder", folder_name)
+            return list(self.remote_tree[key].values())
+
+    def update_remote_tree(self, path, attributes=None):
+        """Add or replace an element of the snapshot. Remove it if no attributes
+        are given, including its content if it is a folder
+
+        Args:
+            path (str): path of the element in remote sftp
+            attributes (SFTPAttributes, optional): new attributes of the element
+        """
+        key = self.tree_key(path)
+        if key is None or key == ".":
+            return
+        parent, name = os.path.split(key)
+        parent = parent or "."
+        with self.tree_lock:
+            if attributes is None:
+                self.remote_tree.get(parent, {}).pop(name, None)
+                subtree = [k for k in self.remote_tree if k.startswith(key + "/")]
+                for folder in subtree + [key]:
+                    self.remote_tree.pop(folder, None)
+                return
+            attributes.filename = name
+            self.remote_tree.setdefault(parent, {})[name] = attributes
+            if stat.S_ISDIR(attributes.st_mode):
+                self.remote_tree.setdefault(key, {})
+        return
+
+    def move_in_remote_tree(self, old_path, new_path):
+        """Update the snapshot after renaming a remote file or folder"""
+        old_key, new_key = self.tree_key(old_path), self.tree_key(new_path)
+        if old_key is None and new_key is None:
+            return
+        with self.tree_lock:
+            attributes = None
+            if old_key is not None:
+                old_parent, old_name = os.path.split(old_key)
+                attributes = self.remote_tree.get(old_parent or ".", {}).pop(
+                    old_name, None
+                )
+                subtree = [k for k in self.remote_tree if k.startswith(old_key + "/")]
+                for folder in [old_key] + subtree:
+                    content = self.remote_tree.pop(folder, None)
+                    if content is not None and new_key is not None:
+                        self.remote_tree[new_key + folder[len(old_key) :]] = content
+            if new_key is not None:
+                if attributes is None:
+                    attributes = self.sftp.stat(new_path)
+                self.update_remote_tree(new_path, attributes)
+        return
+
     @reconnect_if_fail(n_times=3, sleep_time=30)
     def list_remote_folders(self, folder_name, recursive=False):
         """Creates a directories list from the given client remote path
@@ -116,7 +798,7 @@ class SftpRelecov:
         log.info("Listing directories in %s", folder_name)
         directory_list = []
         try:
-            content_list = self.sftp.listdir_attr(folder_name)
+            content_list = self.listdir_attr(folder_name)
             subfolders = any(stat.S_ISDIR(item.st_mode) for item in content_list)
         except (FileNotFoundError, OSError) as e:
             log.error("Invalid folder at remote sftp %s", e)
@@ -126,7 +808,7 @@ class SftpRelecov:
 
         def recursive_list(folder_name):
             try:
-                attribute_list = self.sftp.listdir_attr(folder_name)
+                attribute_list = self.listdir_attr(folder_name)
             except (FileNotFoundError, OSError) as e:
                 log.error("Invalid folder at remote sftp %s", e)
                 raise
@@ -152,7 +834,8 @@ class SftpRelecov:
             ]
         except AttributeError:
             return False
-        self.close_connection()
+        if self.tree_key(folder_name) is None:
+            self.close_connection()
         return directory_list
 
     @reconnect_if_fail(n_times=3, sleep_time=30)
@@ -169,7 +852,7 @@ class SftpRelecov:
         log.info("Listing files in %s", folder_name)
         file_list = []
         try:
-            content_list = self.sftp.listdir_attr(folder_name)
+            content_list = self.listdir_attr(folder_name)
             for content in content_list:
                 full_path = os.path.join(folder_name, content.filename)
                 if stat.S_ISDIR(content.st_mode):
@@ -198,12 +881,94 @@ class SftpRelecov:
             return True
         else:
             try:
-                self.sftp.get(file, destination)
+                with self.pooled_channel() as sftp:
+                    sftp.get(file, destination)
                 return True
             except FileNotFoundError as e:
                 log.error("Unable to fetch file %s ", e)
                 return False
 
+    @reconnect_if_fail(n_times=3, sleep_time=30)
+    def get_from_sftp_with_hash(self, file, destination, crc=False, journal=None):
+        """Download a file from remote sftp computing its md5 hash while the
+        chunks arrive, so the local copy does not need to be read again.
+        If a journal is given, the transfer is resumed from the bytes committed
+        in a previous attempt and the file is only marked as complete when its
+        size matches the remote one.
+
+        Args:
+            file (str): path of the file in remote sftp
+            destination (str): local path of the file after download
+            crc (bool): Also compute the CRC32 of the transferred content
+            journal (TransferJournal, optional): journal of the local folder
+
+        Returns:
+            transfer_info (dict): {"md5": hexdigest, "size": bytes, "crc32": int}
+            if download was successful ("crc32" only when requested). False if not
+        """
+        md5_hash = hashlib.md5()
+        crc_value = 0
+        try:
+            with self.pooled_channel() as sftp, sftp.open(file, "rb") as remote_fh:
+                remote_attr = remote_fh.stat()
+                offset = 0
+                if journal is not None:
+                    offset = journal.resume_offset(destination, file, remote_attr)
+                with open(destination, "r+b" if offset else "wb") as local_fh:
+                    if offset:
+                        log.info("Resuming download of %s from byte %s", file, offset)
+                        # Hash the bytes already on disk before fetching the rest
+                        while local_fh.tell() < offset:
+                            chunk = local_fh.read(
+                                min(self.transfer_chunk_size, offset - local_fh.tell())
+                            )
+                            md5_hash.update(chunk)
+                            if crc:
+                                crc_value = zlib.crc32(chunk, crc_value)
+                        local_fh.truncate(offset)
+                        remote_fh.seek(offset)
+                    # Request the rest of the file in advance to keep the channel busy
+                    remote_fh.prefetch(remote_attr.st_size)
+                    size = last_commit = offset
+                    try:
+                        while True:
+                            chunk = remote_fh.read(self.transfer_chunk_size)
+                            if not chunk:
+                                break
+                            local_fh.write(chunk)
+                            md5_hash.update(chunk)
+                            if crc:
+                                crc_value = zlib.crc32(chunk, crc_value)
+                            size += len(chunk)
+                            if (
+                                journal is not None
+                                and size - last_commit >= self.journal_commit_interval
+                            ):
+                                local_fh.flush()
+                                journal.update_entry(destination, committed=size)
+                                last_commit = size
+                    finally:
+                        if journal is not None:
+                            local_fh.flush()
+                            journal.update_entry(destination, committed=size)
+        except FileNotFoundError as e:
+            log.error("Unable to fetch file %s ", e)
+            return False
+        if size != remote_attr.st_size:
+            log.error(
+                "Incomplete download of %s: %s of %s bytes",
+                file,
+                size,
+                remote_attr.st_size,
+            )
+            return False
+        if journal is not None:
+            journal.mark_complete(destination, md5_hash.hexdigest())
+        transfer_info = {"md5": md5_hash.hexdigest(), "size": size}
+        if crc:
+            transfer_info["crc32"] = crc_value
+        return transfer_info
+
     @reconnect_if_fail(n_times=3, sleep_time=30)
     def make_dir(self, folder_name):
         """Create a new directory in remote sftp
@@ -216,6 +981,11 @@ class SftpRelecov:
         """
         try:
             self.sftp.mkdir(folder_name)
+            attributes = paramiko.SFTPAttributes()
+            attributes.st_mode = stat.S_IFDIR | 0o755
+            attributes.st_size = 0
+            attributes.st_mtime = int(time.time())
+            self.update_remote_tree(folder_name, attributes)
             return True
         except FileExistsError:
             log.error("Directory %s already exists", folder_name)
@@ -235,6 +1005,7 @@ class SftpRelecov:
         """
         try:
             self.sftp.rename(old_name, new_name)
+            self.move_in_remote_tree(old_name, new_name)
             return True
         except FileNotFoundError as e:
             error_txt = f"Could not rename {old_name} to {new_name}: {e}"
@@ -242,6 +1013,71 @@ class SftpRelecov:
             stderr.print(f"[red]{error_txt}")
             return False
 
+    @reconnect_if_fail(n_times=3, sleep_time=30)
+    def rename_files(self, renames):
+        """Rename several files in remote sftp with pipelined requests
+
+        Args:
+            renames (list(tuple(str, str))): current and new name of each file
+
+        Returns:
+            errors (dict(str:Exception)): error for each current name that could
+            not be renamed
+        """
+        with self.pooled_channel() as sftp:
+            if self.can_pipeline(sftp):
+                responses = self.pipelined_requests(
+                    sftp,
+                    [
+                        (CMD_RENAME, sftp._adjust_cwd(old), sftp._adjust_cwd(new))
+                        for old, new in renames
+                    ],
+                )
+                request_errors = [error for _, _, error in responses]
+            else:
+                request_errors = self.sequential_requests(sftp.rename, renames)
+        errors = {}
+        for (old_name, new_name), error in zip(renames, request_errors):
+            if error is not None:
+                errors[old_name] = error
+            else:
+                self.move_in_remote_tree(old_name, new_name)
+        return errors
+
+    @reconnect_if_fail(n_times=3, sleep_time=30)
+    def remove_files(self, file_names, directories=False):
+        """Remove several files, or empty directories, from remote sftp with
+        pipelined requests
+
+        Args:
+            file_names (list(str)): paths to be removed
+            directories (bool): The paths are directories. Defaults to False.
+
+        Returns:
+            errors (dict(str:Exception)): error for each path that could not be
+            removed
+        """
+        command = CMD_RMDIR if directories else CMD_REMOVE
+        with self.pooled_channel() as sftp:
+            if self.can_pipeline(sftp):
+                responses = self.pipelined_requests(
+                    sftp, [(command, sftp._adjust_cwd(path)) for path in file_names]
+                )
+                request_errors = [error for _, _, error in responses]
+            else:
+                request_errors = self.sequential_requests(
+                    sftp.rmdir if directories else sftp.remove,
+                    [(path,) for path in file_names],
+                )
+        errors = {}
+        for file_name, error in zip(file_names, request_errors):
+            if error is not None:
+                errors[file_name] = error
+            else:
+                self.update_remote_tree(file_name)
+        log.info("%s paths deleted from remote server", len(file_names) - len(errors))
+        return errors
+
     @reconnect_if_fail(n_times=3, sleep_time=30)
     def remove_file(self, file_name):
         """Remove a file from remote sftp
@@ -254,6 +1090,7 @@ class SftpRelecov:
         """
         try:
             self.sftp.remove(file_name)
+            self.update_remote_tree(file_name)
             log.info("%s Deleted from remote server", file_name)
             return True
         except FileNotFoundError:
@@ -273,6 +1110,7 @@ class SftpRelecov:
         """
         try:
             self.sftp.rmdir(folder_name)
+            self.update_remote_tree(folder_name)
             return True
         except FileNotFoundError:
             log.error("Directory %s not found", folder_name)
@@ -291,7 +1129,8 @@ class SftpRelecov:
             bool: True if file was uploaded, False if it was not
         """
         try:
-            self.sftp.put(local_path, remote_file)
+            attributes = self.sftp.put(local_path, remote_file)
+            self.update_remote_tree(remote_file, attributes)
             return True
         except FileNotFoundError as e:
             log.error("File not found %s", e)
@@ -301,6 +1140,7 @@ class SftpRelecov:
     @reconnect_if_fail(n_times=3, sleep_time=30)
     def close_connection(self):
         log.info("Closing SFTP connection")
+        self.close_channel_pool()
         try:
             self.sftp.close()
         except NameError:
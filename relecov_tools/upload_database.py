@@ -8,6 +8,7 @@ import rich.console
 import time
 
 import relecov_tools.utils
+import relecov_tools.json_schema
 from relecov_tools.config_json import ConfigJson
 from relecov_tools.rest_api import RestApi
 from relecov_tools.base_module import BaseModule
@@ -21,6 +22,13 @@ stderr = rich.console.Console(
 
 
 class UpdateDatabase(BaseModule):
+    profiled_methods = [
+        "__init__",
+        "update_database",
+        "store_data",
+        "update_db",
+    ]
+
     def __init__(
         self,
         user=None,
@@ -66,7 +74,8 @@ class UpdateDatabase(BaseModule):
             "schema",
             self.config_json.get_topic_data("json_schemas", "relecov_schema"),
         )
-        self.schema = relecov_tools.utils.read_json_file(schema)
+        self.compiled_schema = relecov_tools.json_schema.load_compiled_schema(schema)
+        self.schema = self.compiled_schema.schema
         if full_update is True:
             self.full_update = True
             self.server_url = None
@@ -105,11 +114,7 @@ class UpdateDatabase(BaseModule):
 
     def get_schema_ontology_values(self):
         """Read the schema and extract the values of ontology with the label"""
-        ontology_dict = {}
-        for prop, values in self.schema["properties"].items():
-            if "ontology" in values and values["ontology"] != "":
-                ontology_dict[values["ontology"]] = prop
-        return ontology_dict
+        return dict(self.compiled_schema.ontology_to_property)
 
     def map_iskylims_sample_fields_values(self, sample_fields, s_project_fields):
         """Map the values to the properties send to databasee
@@ -29,6 +29,13 @@ stderr = rich.console.Console(
 
 
 class EnaUpload(BaseModule):
+    profiled_methods = [
+        "__init__",
+        "xml_submission",
+        "fastq_submission",
+        "upload",
+    ]
+
     def __init__(
         self,
         user=None,
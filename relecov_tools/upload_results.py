@@ -20,6 +20,13 @@ stderr = Console(
 
 
 class UploadSftp(BaseModule):
+    profiled_methods = [
+        "__init__",
+        "compress_results",
+        "upload_to_sftp",
+        "execute_process",
+    ]
+
     def __init__(
         self,
         user=None,
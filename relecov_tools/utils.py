@@ -7,23 +7,22 @@ import sys
 import glob
 import hashlib
 import logging
-import questionary
 import json
-import openpyxl
 import yaml
 import gzip
 import re
 import shutil
-from itertools import islice, product
-from Bio import SeqIO
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+from collections import OrderedDict
 from rich.console import Console
 from rich.table import Table
 from datetime import datetime
-from tabulate import tabulate
 from secrets import token_hex
-import openpyxl.utils
-import openpyxl.styles
-import pandas as pd
 import semantic_version
 import subprocess
 import importlib.metadata
@@ -67,34 +66,118 @@ def read_json_file(j_file):
     return data
 
 
+_excel_rows_cache = OrderedDict()
+_excel_rows_cache_lock = threading.Lock()
+# Number of parsed excel sheets kept in memory
+EXCEL_CACHE_SIZE = 16
+
+
+def read_excel_rows(f_name, sheet_name):
+    """Read every row of an excel sheet in read-only mode, which streams the
+    file instead of loading the whole workbook. Parsed sheets are kept per
+    (path, size, mtime, sheet) so reading the same file again is free while it
+    does not change.
+
+    Args:
+        f_name (str): Path to the excel file
+        sheet_name (str): Name of the sheet to read
+
+    Raises:
+        KeyError: If the sheet does not exist in the file
+
+    Returns:
+        rows (list(tuple)): Typed cell values of each row. Shared, do not modify
+    """
+    import openpyxl
+
+    file_stat = os.stat(f_name)
+    cache_key = (
+        os.path.realpath(f_name),
+        file_stat.st_size,
+        file_stat.st_mtime_ns,
+        sheet_name,
+    )
+    with _excel_rows_cache_lock:
+        if cache_key in _excel_rows_cache:
+            _excel_rows_cache.move_to_end(cache_key)
+            return _excel_rows_cache[cache_key]
+    wb_file = openpyxl.load_workbook(f_name, read_only=True, data_only=True)
+    try:
+        rows = list(wb_file[sheet_name].iter_rows(values_only=True))
+    finally:
+        wb_file.close()
+    with _excel_rows_cache_lock:
+        _excel_rows_cache[cache_key] = rows
+        while len(_excel_rows_cache) > EXCEL_CACHE_SIZE:
+            _excel_rows_cache.popitem(last=False)
+    return rows
+
+
+def read_excel_sheet(f_name, sheet_name, header_flag, columns=None):
+    """Find the header of an excel sheet and return the rows below it
+
+    Args:
+        f_name (str): Path to the excel file
+        sheet_name (str): Name of the sheet to read
+        header_flag (str): Value of one of the cells in the header row
+        columns (list(str), optional): Only return these columns, in this order.
+        Defaults to all columns.
+
+    Raises:
+        KeyError: If the sheet, the header or any of the columns are not found
+
+    Returns:
+        header_positions (dict(str:int)): Position of each column in the rows
+        rows (list(tuple)): Typed values of the rows below the header, including
+        empty rows
+        heading_row (int): Number of the header row in the sheet, starting with 1
+    """
+    sheet_rows = read_excel_rows(f_name, sheet_name)
+    try:
+        heading_row = next(
+            idx + 1 for idx, row in enumerate(sheet_rows) if header_flag in row
+        )
+    except StopIteration:
+        raise KeyError(f"Header flag '{header_flag}' could not be found in {f_name}")
+    header_positions = {}
+    for idx, value in enumerate(sheet_rows[heading_row - 1]):
+        if value is not None and str(value).strip():
+            header_positions.setdefault(str(value).strip(), idx)
+    # Rows in read-only mode can be shorter than the header
+    width = len(sheet_rows[heading_row - 1])
+    rows = [
+        row if len(row) >= width else row + (None,) * (width - len(row))
+        for row in sheet_rows[heading_row:]
+    ]
+    if columns is not None:
+        missing = [col for col in columns if col not in header_positions]
+        if missing:
+            raise KeyError(f"Columns {missing} could not be found in {f_name}")
+        positions = [header_positions[col] for col in columns]
+        rows = [tuple(row[pos] for pos in positions) for row in rows]
+        header_positions = {col: idx for idx, col in enumerate(columns)}
+    return header_positions, rows, heading_row
+
+
 def read_excel_file(f_name, sheet_name, header_flag, leave_empty=True):
     """Read the input excel file and give the information in a list
     of dictionaries
     """
-    wb_file = openpyxl.load_workbook(f_name, data_only=True)
-    ws_metadata_lab = wb_file[sheet_name]
-    try:
-        heading_row = [
-            idx + 1 for idx, x in enumerate(ws_metadata_lab.values) if header_flag in x
-        ][0]
-    except IndexError:
-        raise KeyError(f"Header flag '{header_flag}' could not be found in {f_name}")
-    heading = [str(i.value).strip() for i in ws_metadata_lab[heading_row] if i.value]
+    heading, rows, heading_row = read_excel_sheet(f_name, sheet_name, header_flag)
     ws_data = []
-    for row in islice(ws_metadata_lab.values, heading_row, ws_metadata_lab.max_row):
-        l_row = list(row)
+    for row in rows:
         # Ignore the empty rows
-        if all(cell is None for cell in l_row):
+        if all(cell is None for cell in row):
             continue
         data_row = {}
-        for idx in range(0, len(heading)):
-            if l_row[idx] is None:
+        for head, idx in heading.items():
+            if row[idx] is None:
                 if leave_empty:
-                    data_row[heading[idx]] = None
+                    data_row[head] = None
                 else:
-                    data_row[heading[idx]] = "Not Provided [SNOMED:434941000124101]"
+                    data_row[head] = "Not Provided [SNOMED:434941000124101]"
             else:
-                data_row[heading[idx]] = l_row[idx]
+                data_row[head] = row[idx]
         ws_data.append(data_row)
 
     return ws_data, heading_row
@@ -153,6 +236,8 @@ def read_csv_file_return_dict(file_name, sep=None, key_position=0):
     the index value of the key position is used as key. If sep is None then
     try to assert a separator automatically depending on file extension.
     """
+    import pandas as pd
+
     if sep is None:
         file_extension = os.path.splitext(file_name)[1]
         extdict = {".csv": ",", ".tsv": "\t", ".tab": "\t"}
@@ -170,6 +255,8 @@ def read_csv_file_return_dict(file_name, sep=None, key_position=0):
 
 def read_fasta_return_SeqIO_instance(file_name):
     """Read fasta and return SeqIO instance"""
+    from Bio import SeqIO
+
     try:
         return SeqIO.read(file_name, "fasta")
     except FileNotFoundError:
@@ -251,9 +338,196 @@ def delete_local_folder(folder):
     return True
 
 
-def calculate_md5(file_name):
-    """Calculate the md5 value for the file name"""
-    return hashlib.md5(open(file_name, "rb").read()).hexdigest()
+class HashCache:
+    """Persistent cache of md5 hashes in a SQLite database. Entries are keyed by
+    the device and inode of the file and are only valid while its size and
+    mtime_ns stay the same, so any modification of the file invalidates them.
+
+    Args:
+        cache_path (str, optional): Path to the SQLite database. If empty the
+        cache is disabled and every file is hashed again.
+    """
+
+    def __init__(self, cache_path=None):
+        self.cache_path = os.path.expanduser(cache_path) if cache_path else None
+        self.lock = threading.Lock()
+        self.connection = None
+        if self.cache_path is None:
+            log.debug("Hash cache disabled")
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            self.connection = sqlite3.connect(
+                self.cache_path, timeout=30, check_same_thread=False
+            )
+            with self.connection:
+                self.connection.execute(
+                    "CREATE TABLE IF NOT EXISTS md5_cache (device INTEGER, "
+                    "inode INTEGER, size INTEGER, mtime_ns INTEGER, path TEXT, "
+                    "md5 TEXT, PRIMARY KEY (device, inode))"
+                )
+        except (OSError, sqlite3.Error) as e:
+            log.debug("Hash cache %s not available: %s", self.cache_path, e)
+            self.connection = None
+
+    @staticmethod
+    def file_key(file_name):
+        """Return the (device, inode, size, mtime_ns) key of the given file"""
+        file_stat = os.stat(file_name)
+        return (
+            file_stat.st_dev,
+            file_stat.st_ino,
+            file_stat.st_size,
+            file_stat.st_mtime_ns,
+        )
+
+    def get(self, file_name, file_key=None):
+        """Return the cached md5 of the file, None if it is not cached or the
+        file changed since it was hashed
+        """
+        if self.connection is None:
+            return None
+        file_key = file_key or HashCache.file_key(file_name)
+        try:
+            with self.lock:
+                row = self.connection.execute(
+                    "SELECT md5 FROM md5_cache WHERE device = ? AND inode = ? "
+                    "AND size = ? AND mtime_ns = ?",
+                    file_key,
+                ).fetchone()
+        except sqlite3.Error as e:
+            log.debug("Could not read hash cache: %s", e)
+            return None
+        return row[0] if row else None
+
+    def store(self, file_name, md5, file_key=None):
+        """Save the md5 of the file. If file_key is given, the hash is only
+        stored if the file did not change since that key was taken
+        """
+        if self.connection is None or md5 is None:
+            return
+        try:
+            current_key = HashCache.file_key(file_name)
+        except OSError:
+            return
+        if file_key is not None and tuple(file_key) != current_key:
+            log.debug("%s changed while being hashed, not cached", file_name)
+            return
+        try:
+            with self.lock, self.connection:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO md5_cache VALUES (?, ?, ?, ?, ?, ?)",
+                    current_key + (os.path.realpath(file_name), md5),
+                )
+        except sqlite3.Error as e:
+            log.debug("Could not write hash cache: %s", e)
+        return
+
+
+_hash_cache = None
+_hash_cache_lock = threading.Lock()
+
+
+def get_hash_cache():
+    """Return the HashCache shared by the whole process, stored in the
+    cache_file of the hash_cache configuration. Disabled if cache_file is empty
+    """
+    # Imported here as config_json imports this module
+    from relecov_tools.config_json import ConfigJson
+
+    global _hash_cache
+    with _hash_cache_lock:
+        if _hash_cache is None:
+            config_json = ConfigJson()
+            cache_file = config_json.get_topic_data("hash_cache", "cache_file")
+            _hash_cache = HashCache(cache_file)
+    return _hash_cache
+
+
+def stream_md5(file_name, chunksize=16777216):
+    """Calculate the md5 value of a file reading it in chunks of fixed size
+
+    Args:
+        file_name (str): path to the given file
+        chunksize (int, optional): bytes read each time. Defaults to 16 Mbytes.
+
+    Returns:
+        md5_value (str): md5 hexdigest of the file
+        read_bytes (int): number of bytes read
+    """
+    md5_hash = hashlib.md5()
+    read_bytes = 0
+    with open(file_name, "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunksize), b""):
+            md5_hash.update(chunk)
+            read_bytes += len(chunk)
+    return md5_hash.hexdigest(), read_bytes
+
+
+def calculate_md5(file_name, return_read_bytes=False):
+    """Calculate the md5 value for the file name. Hashes are saved in the
+    persistent hash cache so unchanged files are not read again
+
+    Args:
+        file_name (str): path to the given file
+        return_read_bytes (bool): Also return the number of bytes read from disk
+
+    Returns:
+        md5_value (str): md5 hexdigest of the file
+        read_bytes (int): only if return_read_bytes. 0 if taken from cache.
+    """
+    hash_cache = get_hash_cache()
+    file_key = HashCache.file_key(file_name)
+    md5_value = hash_cache.get(file_name, file_key)
+    read_bytes = 0
+    if md5_value is None:
+        md5_value, read_bytes = stream_md5(file_name)
+        hash_cache.store(file_name, md5_value, file_key)
+    if return_read_bytes:
+        return md5_value, read_bytes
+    return md5_value
+
+
+def calculate_md5_batch(file_list, max_workers=None, ignore_errors=False):
+    """Calculate the md5 value of several files in a pool of threads. Each file
+    is streamed in fixed size chunks, so memory usage does not depend on its size
+
+    Args:
+        file_list (list(str)): paths to the files
+        max_workers (int, optional): number of threads. Defaults to the
+        ThreadPoolExecutor default.
+        ignore_errors (bool): Return None as md5 of the files that could not be
+        read instead of raising the error. Defaults to False.
+
+    Returns:
+        md5_results (dict(str:str)): md5 hexdigest for each file path
+    """
+
+    def hash_file(file_name):
+        try:
+            return calculate_md5(file_name, return_read_bytes=True)
+        except OSError as e:
+            if not ignore_errors:
+                raise
+            log.warning("Could not calculate md5 for %s: %s", file_name, e)
+            return None, 0
+
+    file_list = list(dict.fromkeys(file_list))
+    if not file_list:
+        return {}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(hash_file, file_list))
+    elapsed = max(time.perf_counter() - start, 1e-6)
+    total_mbytes = sum(read_bytes for _, read_bytes in results) / 1048576
+    log.info(
+        "Hashed %s files, %.1f Mbytes read in %.1fs (%.1f Mbytes/s)",
+        len(file_list),
+        total_mbytes,
+        elapsed,
+        total_mbytes / elapsed,
+    )
+    return {path: md5 for path, (md5, _) in zip(file_list, results)}
 
 
 def write_md5_file(file_name, md5_value):
@@ -266,10 +540,13 @@ def write_md5_file(file_name, md5_value):
 def create_md5_files(local_folder, file_list):
     """Create the md5 files and return their value"""
     md5_results = {}
+    md5_values = calculate_md5_batch(
+        [os.path.join(local_folder, file_name) for file_name in file_list]
+    )
     for file_name in file_list:
         md5_results[file_name] = [
             local_folder,
-            calculate_md5(os.path.join(local_folder, file_name)),
+            md5_values[os.path.join(local_folder, file_name)],
         ]
         md5_file_name = file_name + ".md5"
         write_md5_file(
@@ -292,15 +569,77 @@ def write_json_to_file(data, file_name):
     return True
 
 
-def compress_file(file):
+def write_parallel_gzip(
+    in_fh, out_fh, threads=None, compresslevel=9, blocksize=1048576, filename=""
+):
+    """Compress the content of in_fh into a single gzip member written to out_fh.
+    Input is split in blocks that are deflated independently in a pool of
+    threads, using the last 32Kb of the previous block as dictionary, and
+    written in order. Same approach as pigz, output is a standard gzip file.
+
+    Args:
+        in_fh (file): binary file handle to read uncompressed content from
+        out_fh (file): binary file handle to write the gzip content to
+        threads (int, optional): number of compression threads. Defaults to cpus
+        compresslevel (int, optional): zlib compression level. Defaults to 9.
+        blocksize (int, optional): size of each compressed block in bytes.
+        filename (str, optional): original file name stored in gzip header.
+
+    Returns:
+        isize (int): number of uncompressed bytes
+    """
+    threads = max(int(threads or os.cpu_count() or 1), 1)
+    window = 32768
+
+    def deflate_block(data, zdict, last):
+        if zdict:
+            compressor = zlib.compressobj(
+                compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=zdict
+            )
+        else:
+            compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+        # Sync flush ends each block in a byte boundary so they can be joined
+        flush_mode = zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH
+        return compressor.compress(data) + compressor.flush(flush_mode)
+
+    fname = os.path.basename(filename).encode("latin-1", "replace")
+    flags = b"\x08" if fname else b"\x00"
+    xfl = {1: b"\x04", 9: b"\x02"}.get(compresslevel, b"\x00")
+    out_fh.write(b"\x1f\x8b\x08" + flags + (0).to_bytes(4, "little") + xfl + b"\xff")
+    if fname:
+        out_fh.write(fname + b"\x00")
+    crc = isize = 0
+    pending = []
+    zdict = None
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        block = in_fh.read(blocksize)
+        while True:
+            next_block = in_fh.read(blocksize)
+            last = not next_block
+            crc = zlib.crc32(block, crc)
+            isize += len(block)
+            pending.append(executor.submit(deflate_block, block, zdict, last))
+            zdict = block[-window:]
+            # Keep a bounded number of blocks in memory
+            while len(pending) > threads * 2 or (last and pending):
+                out_fh.write(pending.pop(0).result())
+            if last:
+                break
+            block = next_block
+    out_fh.write(crc.to_bytes(4, "little") + (isize & 0xFFFFFFFF).to_bytes(4, "little"))
+    return isize
+
+
+def compress_file(file, threads=None):
     """compress a given file with gzip, adding .gz extension afterwards
 
     Args:
         file (str): path to the given file
+        threads (int, optional): number of threads used to compress the file
     """
     try:
-        with open(file, "rb") as raw, gzip.open(f"{file}.gz", "wb") as comp:
-            comp.writelines(raw)
+        with open(file, "rb") as raw, open(f"{file}.gz", "wb") as comp:
+            write_parallel_gzip(raw, comp, threads=threads, filename=file)
         return True
     except FileNotFoundError:
         return False
@@ -322,6 +661,118 @@ def check_gzip_integrity(file_path):
     return True
 
 
+def verify_file(file_path, md5=True, gzip_check=None, fastq_stats=False):
+    """Read a file only once to compute its md5 hash, validate the gzip CRC and
+    EOF of every member if it is compressed and optionally count the reads and
+    bases of the decompressed fastq content.
+
+    Args:
+        file_path (str): path to the given file
+        md5 (bool): Compute the md5 hash of the raw file, or take it from the
+        hash cache if the file did not change. Defaults to True.
+        gzip_check (bool, optional): Validate the file as gzip. If None, it is
+        validated if the file starts with the gzip magic number.
+        fastq_stats (bool): Count reads and bases in the fastq content.
+
+    Returns:
+        results (dict): {"md5": str, "gzip_valid": bool, "reads": int, "bases": int}
+        Values are None for the checks that were not performed.
+    """
+    chunksize = 16777216  # 16 Mbytes
+    results = {"md5": None, "gzip_valid": None, "reads": None, "bases": None}
+    file_key = HashCache.file_key(file_path)
+    if md5:
+        results["md5"] = get_hash_cache().get(file_path, file_key)
+    md5_hash = hashlib.md5() if md5 and results["md5"] is None else None
+    decompressor = None
+    # Fastq parsing state: number of lines seen and incomplete last line
+    line_count = bases = 0
+    pending = b""
+
+    def count_fastq(data, final=False):
+        nonlocal line_count, bases, pending
+        lines = (pending + data).split(b"\n")
+        # Keep the incomplete last line for the next chunk
+        pending = lines.pop()
+        if final and pending:
+            lines.append(pending)
+            pending = b""
+        # Sequence lines are the second one in each 4-line fastq record
+        start = (1 - line_count) % 4
+        bases += sum(len(line.rstrip(b"\r")) for line in lines[start::4])
+        line_count += len(lines)
+
+    with open(file_path, "rb") as fh:
+        first_chunk = fh.read(chunksize)
+        if gzip_check is None:
+            gzip_check = first_chunk[:2] == b"\x1f\x8b"
+        if gzip_check:
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            results["gzip_valid"] = True
+        chunk = first_chunk
+        if md5_hash is None and decompressor is None and not fastq_stats:
+            # Nothing left to compute from the file content
+            chunk = b""
+        while chunk:
+            if md5_hash is not None:
+                md5_hash.update(chunk)
+            if decompressor is not None and results["gzip_valid"]:
+                try:
+                    content = decompressor.decompress(chunk)
+                    # Concatenated gzip members, e.g. from parallel compressors
+                    while decompressor.eof and decompressor.unused_data:
+                        leftover = decompressor.unused_data
+                        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                        content += decompressor.decompress(leftover)
+                except zlib.error:
+                    results["gzip_valid"] = False
+                    content = b""
+                if fastq_stats:
+                    count_fastq(content)
+            elif fastq_stats and decompressor is None:
+                count_fastq(chunk)
+            chunk = fh.read(chunksize)
+    if decompressor is not None and results["gzip_valid"]:
+        # EOF not reached: Compressed file is truncated
+        results["gzip_valid"] = decompressor.eof
+    if md5_hash is not None:
+        results["md5"] = md5_hash.hexdigest()
+        get_hash_cache().store(file_path, results["md5"], file_key)
+    if fastq_stats and results["gzip_valid"] is not False:
+        count_fastq(b"", final=True)
+        results["reads"] = line_count // 4
+        results["bases"] = bases
+    return results
+
+
+def verify_files(file_list, max_workers=None, file_options=None, **kwargs):
+    """Run verify_file() over a list of files in a pool of threads. Hashing and
+    decompression release the GIL, so files are processed concurrently.
+
+    Args:
+        file_list (list(str)): paths to the files to verify
+        max_workers (int, optional): number of threads. Defaults to the
+        ThreadPoolExecutor default.
+        file_options (dict(str:dict), optional): verify_file() arguments for
+        specific files, overriding the ones given in kwargs.
+        **kwargs: verify_file() arguments used for every file
+
+    Returns:
+        results (dict(str:dict)): verify_file() results for each file path
+    """
+    file_options = file_options or {}
+
+    def verify(file_path):
+        options = {**kwargs, **file_options.get(file_path, {})}
+        return verify_file(file_path, **options)
+
+    if not file_list:
+        return {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = dict(zip(file_list, executor.map(verify, file_list)))
+    return results
+
+
 def lower_keys(data):
     """Transform all keys to lowercase strings in a dictionary"""
     return {str(key).lower(): v for key, v in data.items()}
@@ -346,43 +797,59 @@ stderr = Console(
 
 
 def prompt_text(msg):
+    import questionary
+
     source = questionary.text(msg).unsafe_ask()
     return source
 
 
 def prompt_password(msg):
+    import questionary
+
     source = questionary.password(msg).unsafe_ask()
     return source
 
 
 def prompt_tmp_dir_path():
+    import questionary
+
     stderr.print("Temporal directory destination to execute service")
     source = questionary.path("Source path").unsafe_ask()
     return source
 
 
 def prompt_selection(msg, choices):
+    import questionary
+
     selection = questionary.select(msg, choices=choices).unsafe_ask()
     return selection
 
 
 def prompt_path(msg):
+    import questionary
+
     source = questionary.path(msg).unsafe_ask()
     return source
 
 
 def prompt_yn_question(msg):
+    import questionary
+
     confirmation = questionary.confirm(msg).unsafe_ask()
     return confirmation
 
 
 def prompt_skip_folder_creation():
+    import questionary
+
     stderr.print("Do you want to skip folder creation? (Y/N)")
     confirmation = questionary.confirm("Skip?", default=False).unsafe_ask()
     return confirmation
 
 
 def prompt_checkbox(msg, choices):
+    import questionary
+
     selected_options = questionary.checkbox(msg, choices=choices).unsafe_ask()
     return selected_options
 
@@ -476,6 +943,8 @@ def print_log_report(
                         table_data.append(
                             [section_name, colored_category, colored_message]
                         )
+    from tabulate import tabulate
+
     print(
         tabulate(
             table_data,
@@ -530,6 +999,35 @@ def prompt_create_outdir(
     return global_path
 
 
+def delete_excel_rows(sheet, row_numbers):
+    """Delete many rows of an openpyxl worksheet in a single pass. The result is
+    the same as calling sheet.delete_rows for each of them, starting from the
+    bottom, but the cells below are shifted once instead of once per row.
+
+    Args:
+        sheet (openpyxl.worksheet): worksheet loaded in normal (not read-only) mode
+        row_numbers (iterable(int)): numbers of the rows to delete, starting with 1
+    """
+    row_numbers = sorted(set(row_numbers))
+    if not row_numbers:
+        return
+    deleted = 0
+    new_row = {}
+    # Number of deleted rows above each remaining row
+    for row in range(1, sheet.max_row + 1):
+        if deleted < len(row_numbers) and row_numbers[deleted] == row:
+            deleted += 1
+            continue
+        new_row[row] = row - deleted
+    new_cells = {}
+    for (row, column), cell in sheet._cells.items():
+        if row in new_row:
+            cell.row = new_row[row]
+            new_cells[(cell.row, column)] = cell
+    sheet._cells = new_cells
+    sheet._current_row = sheet.max_row if new_cells else 0
+
+
 def adjust_sheet_size(sheet, wrap_text=True, col_width=30):
     """Adjust column width and row heights depending on the max number of
     characters in each one.
@@ -540,6 +1038,9 @@ def adjust_sheet_size(sheet, wrap_text=True, col_width=30):
         col_width (int): Minimum columns width value. Also used to define maximum
         number of characters in each cell when wrap_text is True. Defaults to 30.
     """
+    import openpyxl.styles
+    import openpyxl.utils
+
     dims = {}
     for _, row in enumerate(sheet.iter_rows(min_row=2, max_row=sheet.max_row), start=2):
         for cell in row:
@@ -594,7 +1095,7 @@ def get_schema_url():
     return f"{base_url}/{schema_path}"
 
 
-def display_dataframe_to_user(name: str, dataframe: pd.DataFrame):
+def display_dataframe_to_user(name: str, dataframe):
     """
     Display a Pandas DataFrame in a formatted table using Rich.
 
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+"""Measure the startup time of the CLI and check that loading it does not import
+the heavy dependencies only needed by some commands.
+
+Exits with an error if a heavy module is imported or a limit is exceeded, e.g.:
+    python3 tests/benchmark_import_time.py --max_import_time 0.5
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Modules that must only be imported by the commands that use them
+HEAVY_MODULES = [
+    "pandas",
+    "numpy",
+    "openpyxl",
+    "Bio",
+    "paramiko",
+    "bs4",
+    "jsonschema",
+    "pyzipper",
+    "questionary",
+    "jinja2",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5, help="Runs of each command")
+    parser.add_argument(
+        "--max_import_time",
+        type=float,
+        default=None,
+        help="Fail if importing the CLI takes longer than this (seconds)",
+    )
+    parser.add_argument(
+        "--max_help_time",
+        type=float,
+        default=None,
+        help="Fail if relecov-tools --help takes longer than this (seconds)",
+    )
+    parser.add_argument("-o", "--output", type=str, help="Save results to json file")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.runs)
+    for name, seconds in results["times"].items():
+        print(f"{name:<20}{seconds:>10.3f} s")
+    print(f"{'heavy modules':<20}{', '.join(results['heavy_modules']) or 'none':>10}")
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(results, fh, indent=4)
+        print(f"Results saved to {args.output}")
+
+    errors = []
+    if results["heavy_modules"]:
+        errors.append(f"CLI imports heavy modules: {results['heavy_modules']}")
+    limits = {"import": args.max_import_time, "help": args.max_help_time}
+    for name, limit in limits.items():
+        if limit is not None and results["times"][name] > limit:
+            errors.append(f"{name} took {results['times'][name]:.3f}s > {limit}s")
+    if errors:
+        sys.exit("\n".join(errors))
+
+
+def time_python(code, runs):
+    """Median wall time of running the given code in a new interpreter
+
+    Args:
+        code (str): python code given to python -c
+        runs (int): number of runs
+
+    Returns:
+        seconds (float): median of the runs
+    """
+    env = dict(os.environ, PYTHONPATH=REPO_DIR)
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-c", code],
+            env=env,
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def run_benchmark(runs=5):
+    """Time the interpreter alone, importing the CLI and printing its help, and
+    list the heavy modules loaded by the import
+
+    Returns:
+        results (dict): parameters, median seconds and heavy modules imported
+    """
+    check_code = (
+        "import sys, json, relecov_tools.__main__; "
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    )
+    env = dict(os.environ, PYTHONPATH=REPO_DIR)
+    heavy_modules = json.loads(
+        subprocess.run(
+            [sys.executable, "-c", check_code],
+            env=env,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+    )
+    help_code = (
+        "import sys; sys.argv = ['relecov-tools', '--help']; "
+        "from relecov_tools.__main__ import run_relecov_tools; run_relecov_tools()"
+    )
+    return {
+        "python": sys.version.split()[0],
+        "runs": runs,
+        "times": {
+            "interpreter": time_python("pass", runs),
+            "import": time_python("import relecov_tools.__main__", runs),
+            "help": time_python(help_code, runs),
+        },
+        "heavy_modules": heavy_modules,
+    }
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+#!/usr/bin/env python
+"""Benchmark every CLI stage, from download to update-db, over a synthetic
+dataset served by a local sftp server.
+
+Each stage runs in its own process and the report records wall time, cpu
+time, peak RSS and I/O bytes per stage, together with the commit and the
+dataset parameters, so that reports from different commits can be compared
+with --baseline. update-db only runs when a platform server url is given.
+
+Example:
+    python3 tests/benchmark_pipeline.py --labs 4 --batches 5 --samples 50 -o report.json
+    python3 tests/benchmark_pipeline.py --labs 4 --batches 5 --samples 50 --baseline report.json
+"""
+import os
+import sys
+import glob
+import json
+import time
+import atexit
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from generate_dataset import generate_dataset  # noqa: E402
+from sftp_server import LocalSftpServer  # noqa: E402
+from relecov_tools.profiler import read_io_counters  # noqa: E402
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCHEMA_FILE = os.path.join(REPO_DIR, "relecov_tools", "schema", "relecov_schema.json")
+STAGES = [
+    "download",
+    "read-lab-metadata",
+    "validate",
+    "map",
+    "read-bioinfo-metadata",
+    "update-db",
+]
+STAGE_STATS_FLAG = "--stage_stats"
+
+
+def main():
+    # Internal mode used to run a single CLI stage in a child process
+    if len(sys.argv) > 2 and sys.argv[1] == STAGE_STATS_FLAG:
+        run_stage_in_process(sys.argv[2], sys.argv[3:])
+        return
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--labs", type=int, default=2, help="Number of labs")
+    parser.add_argument("--batches", type=int, default=1, help="Batches per lab")
+    parser.add_argument("--samples", type=int, default=10, help="Samples per batch")
+    parser.add_argument("--reads", type=int, default=100, help="Reads per FASTQ")
+    parser.add_argument(
+        "--software",
+        choices=["viralrecon", "irma"],
+        default="viralrecon",
+        help="Pipeline used to generate the analysis results",
+    )
+    parser.add_argument(
+        "--registry_size", type=int, default=100, help="Samples in the ID registry"
+    )
+    parser.add_argument("--seed", type=int, default=1, help="Random seed")
+    parser.add_argument("--workers", type=int, default=None, help="Download workers")
+    parser.add_argument(
+        "--latency", type=float, default=0, help="Round trip time of the sftp link"
+    )
+    parser.add_argument("--server_url", help="Platform url to run update-db against")
+    parser.add_argument("--db_user", help="User to login in the platform")
+    parser.add_argument("--db_password", help="Password to login in the platform")
+    parser.add_argument("-w", "--work_dir", help="Keep dataset and outputs here")
+    parser.add_argument("-b", "--baseline", help="Report of a previous run to compare")
+    parser.add_argument("-o", "--output", type=str, help="Save report to json file")
+    args = parser.parse_args()
+
+    report = run_benchmark(**vars(args))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r") as fh:
+            baseline = json.load(fh)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=4)
+        print(f"Report saved to {args.output}")
+
+
+def run_stage_in_process(stats_file, cli_args):
+    """Run relecov-tools with the given arguments, saving the I/O counters of
+    this process when it exits
+    """
+
+    def save_io_counters():
+        with open(stats_file, "w") as fh:
+            json.dump(read_io_counters(), fh)
+
+    atexit.register(save_io_counters)
+    sys.argv = ["relecov-tools"] + cli_args
+    from relecov_tools.__main__ import run_relecov_tools
+
+    run_relecov_tools()
+
+
+def run_stage(stage, cli_args, work_dir):
+    """Run a CLI stage in a child process and measure its resources
+
+    Args:
+        stage (str): name of the stage, used to name its log files
+        cli_args (list(str)): arguments given to relecov-tools
+        work_dir (str): folder where stats and output of the stage are saved
+
+    Returns:
+        stats (dict): returncode, wall and cpu seconds, peak rss and io bytes
+    """
+    run_dir = tempfile.mkdtemp(prefix=stage + "_", dir=work_dir)
+    stats_file = os.path.join(run_dir, "io_stats.json")
+    command = [sys.executable, os.path.abspath(__file__), STAGE_STATS_FLAG, stats_file]
+    command += ["-l", run_dir] + cli_args
+    # Benchmark the checked out code even if another version is installed
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        x for x in [REPO_DIR, env.get("PYTHONPATH")] if x
+    )
+    start = time.perf_counter()
+    with open(os.path.join(run_dir, "output.log"), "w") as out_fh:
+        # Some modules write files in the working directory
+        proc = subprocess.Popen(
+            command,
+            cwd=run_dir,
+            env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=out_fh,
+            stderr=out_fh,
+        )
+        _, status, usage = os.wait4(proc.pid, 0)
+    wall_time = time.perf_counter() - start
+    if os.WIFEXITED(status):
+        proc.returncode = os.WEXITSTATUS(status)
+    else:
+        proc.returncode = -os.WTERMSIG(status)
+    # ru_maxrss is given in kilobytes in linux and in bytes in macOS
+    rss_unit = 1 if sys.platform == "darwin" else 1024
+    stats = {
+        "returncode": proc.returncode,
+        "wall_time": wall_time,
+        "cpu_time": usage.ru_utime + usage.ru_stime,
+        "peak_rss": usage.ru_maxrss * rss_unit,
+        "read_bytes": 0,
+        "write_bytes": 0,
+        "log": os.path.join(run_dir, "output.log"),
+    }
+    if os.path.isfile(stats_file):
+        with open(stats_file, "r") as fh:
+            stats.update(json.load(fh))
+    return stats
+
+
+def newest_file(folder, pattern):
+    """Most recent file in the folder matching the glob pattern, or None"""
+    files = glob.glob(os.path.join(folder, pattern))
+    return max(files, key=os.path.getmtime) if files else None
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_DIR, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(
+    labs=2,
+    batches=1,
+    samples=10,
+    reads=100,
+    software="viralrecon",
+    registry_size=100,
+    seed=1,
+    workers=None,
+    latency=0,
+    server_url=None,
+    db_user=None,
+    db_password=None,
+    work_dir=None,
+    baseline=None,
+    output=None,
+):
+    """Generate the dataset and run every stage over each downloaded batch
+
+    Returns:
+        report (dict): environment, parameters and resources used by each stage
+    """
+    keep_dir = work_dir is not None
+    if keep_dir:
+        os.makedirs(work_dir, exist_ok=True)
+    else:
+        work_dir = tempfile.mkdtemp(prefix="relecov_pipeline_benchmark_")
+    work_dir = os.path.realpath(work_dir)
+    print(f"Generating synthetic dataset in {work_dir}")
+    dataset = generate_dataset(
+        os.path.join(work_dir, "dataset"),
+        labs=labs,
+        batches=batches,
+        samples=samples,
+        reads=reads,
+        software=software,
+        registry_size=registry_size,
+        seed=seed,
+    )
+    report = {
+        "commit": get_commit(),
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": dict(
+            dataset["parameters"],
+            workers=workers,
+            latency=latency,
+            total_samples=dataset["total_samples"],
+            total_bytes=dataset["total_bytes"],
+        ),
+        "stages": {},
+    }
+    runs = {stage: [] for stage in STAGES}
+    stage_dir = os.path.join(work_dir, "stages")
+    os.makedirs(stage_dir, exist_ok=True)
+    try:
+        local_dir = os.path.join(work_dir, "local")
+        os.makedirs(local_dir, exist_ok=True)
+        with LocalSftpServer(dataset["remote_folder"], latency=latency) as server:
+            conf_file = os.path.join(work_dir, "download_conf.json")
+            # The same file is read as yaml by download and as json by the client
+            with open(conf_file, "w") as fh:
+                json.dump(
+                    {
+                        "sftp_server": server.host,
+                        "sftp_port": server.port,
+                        "sftp_user": "benchmark",
+                        "sftp_passwd": "benchmark",
+                        "target_folders": None,
+                        "platform_storage_folder": local_dir,
+                    },
+                    fh,
+                )
+            download_args = ["download", "-f", conf_file, "-d", "download_only"]
+            download_args += ["-o", local_dir, "-s", "RELECOV"]
+            if workers:
+                download_args += ["-w", str(workers)]
+            print("Running download")
+            runs["download"].append(run_stage("download", download_args, stage_dir))
+        analysis_folders = {
+            sample: batch["analysis_folder"]
+            for batch in dataset["batches"]
+            for sample in batch["samples"]
+        }
+        for samples_file in sorted(
+            glob.glob(os.path.join(local_dir, "*", "*", "samples_data_*.json"))
+        ):
+            run_batch_stages(
+                os.path.dirname(samples_file),
+                samples_file,
+                analysis_folders,
+                dataset,
+                runs,
+                stage_dir,
+                server_url,
+                db_user,
+                db_password,
+            )
+    finally:
+        if not keep_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    for stage, stage_runs in runs.items():
+        if not stage_runs:
+            continue
+        report["stages"][stage] = {
+            "runs": len(stage_runs),
+            "failed": sum(1 for x in stage_runs if x["returncode"] != 0),
+            "wall_time": sum(x["wall_time"] for x in stage_runs),
+            "cpu_time": sum(x["cpu_time"] for x in stage_runs),
+            "peak_rss": max(x["peak_rss"] for x in stage_runs),
+            "read_bytes": sum(x["read_bytes"] for x in stage_runs),
+            "write_bytes": sum(x["write_bytes"] for x in stage_runs),
+        }
+        if keep_dir:
+            report["stages"][stage]["logs"] = [x["log"] for x in stage_runs]
+    return report
+
+
+def run_batch_stages(
+    batch_folder,
+    samples_file,
+    analysis_folders,
+    dataset,
+    runs,
+    stage_dir,
+    server_url,
+    db_user,
+    db_password,
+):
+    """Run the metadata stages over a downloaded batch, each one using the
+    output of the previous stage. Stops at the first stage without output
+    """
+    lab = os.path.basename(os.path.dirname(batch_folder))
+    print(f"Running metadata stages over {lab}/{os.path.basename(batch_folder)}")
+    metadata_file = newest_file(batch_folder, "lab_metadata_*.xlsx")
+    with open(samples_file, "r") as fh:
+        first_sample = next(iter(json.load(fh)), None)
+
+    def stage_output(stage, cli_args, pattern):
+        runs[stage].append(run_stage(stage, cli_args, stage_dir))
+        return newest_file(batch_folder, pattern)
+
+    lab_json = stage_output(
+        "read-lab-metadata",
+        ["read-lab-metadata", "-m", metadata_file, "-s", samples_file]
+        + ["-o", batch_folder],
+        "lab_metadata_*.json",
+    )
+    if lab_json is None:
+        return
+    validated_json = stage_output(
+        "validate",
+        ["validate", "-j", lab_json, "-s", SCHEMA_FILE, "-m", metadata_file]
+        + ["-r", dataset["registry"], "-o", batch_folder],
+        "validated_lab_metadata_*.json",
+    )
+    if validated_json is None:
+        return
+    stage_output(
+        "map",
+        ["map", "-p", SCHEMA_FILE, "-j", validated_json, "-d", "ENA"]
+        + ["-o", batch_folder],
+        "*ena*.json",
+    )
+    if first_sample not in analysis_folders:
+        return
+    bioinfo_json = stage_output(
+        "read-bioinfo-metadata",
+        ["read-bioinfo-metadata", "-j", validated_json]
+        + ["-i", analysis_folders[first_sample], "-o", batch_folder]
+        + ["-s", dataset["parameters"]["software"]],
+        "bioinfo_lab_metadata_*.json",
+    )
+    if bioinfo_json is None or server_url is None:
+        return
+    stage_output(
+        "update-db",
+        ["update-db", "-j", bioinfo_json, "-s", server_url, "-f"]
+        + ["-u", db_user or "", "-p", db_password or ""],
+        "*",
+    )
+
+
+def print_report(report, baseline=None):
+    """Print the resources used by each stage, and the ratio with respect to
+    the baseline report when given
+    """
+    columns = ["wall_time", "cpu_time", "peak_rss", "read_bytes", "write_bytes"]
+    print(
+        f"Commit {report['commit']} - {report['parameters']['total_samples']} samples"
+    )
+    header = f"{'stage':<24}{'runs':>6}{'failed':>8}"
+    width = 24 if baseline else 16
+    header += "".join(f"{x:>{width}}" for x in columns)
+    print(header)
+    for stage, stats in report["stages"].items():
+        line = f"{stage:<24}{stats['runs']:>6}{stats['failed']:>8}"
+        for column in columns:
+            value = stats[column]
+            text = f"{value:.2f}" if isinstance(value, float) else str(value)
+            base_stats = (baseline or {}).get("stages", {}).get(stage)
+            if base_stats and base_stats.get(column):
+                text += f" ({value / base_stats[column]:.2f}x)"
+            line += f"{text:>{width}}"
+        print(line)
+    base_samples = (baseline or {}).get("parameters", {}).get("total_samples")
+    if baseline and base_samples != report["parameters"]["total_samples"]:
+        print("Warning: baseline was run over a different number of samples")
+
+
+if __name__ == "__main__":
+    main()
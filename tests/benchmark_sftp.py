@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+"""Benchmark remote listing, transfer, rename and cleanup of the sftp client
+against a local in-process server, sequentially and with concurrency.
+
+Runs offline on any machine, e.g.:
+    python3 tests/benchmark_sftp.py --labs 4 --samples 20 --latency 0.02
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from relecov_tools.sftp_client import SftpRelecov
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from sftp_server import LocalSftpServer, populate_lab_folders  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--labs", type=int, default=2, help="Number of labs")
+    parser.add_argument("--batches", type=int, default=1, help="Batches per lab")
+    parser.add_argument("--samples", type=int, default=10, help="Samples per batch")
+    parser.add_argument("--reads", type=int, default=1000, help="Reads per FASTQ")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent workers")
+    parser.add_argument(
+        "--latency", type=float, default=0, help="Round trip time in seconds"
+    )
+    parser.add_argument(
+        "--bandwidth", type=float, default=None, help="Bytes per second per connection"
+    )
+    parser.add_argument(
+        "--drop_after", type=int, default=None, help="Drop connections after N bytes"
+    )
+    parser.add_argument("-o", "--output", type=str, help="Save results to json file")
+    args = parser.parse_args()
+
+    results = run_benchmarks(**vars(args))
+    print(f"{'step':<10}{'sequential (s)':>16}{'concurrent (s)':>16}{'speedup':>10}")
+    for step, times in results["steps"].items():
+        speedup = times["sequential"] / max(times["concurrent"], 1e-9)
+        print(
+            f"{step:<10}{times['sequential']:>16.3f}{times['concurrent']:>16.3f}{speedup:>10.2f}"
+        )
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(results, fh, indent=4)
+        print(f"Results saved to {args.output}")
+
+
+def run_benchmarks(
+    labs=2,
+    batches=1,
+    samples=10,
+    reads=1000,
+    workers=4,
+    latency=0,
+    bandwidth=None,
+    drop_after=None,
+    output=None,
+):
+    """Run every benchmark step over a fresh copy of the same synthetic dataset
+    in sequential and concurrent modes
+
+    Returns:
+        results (dict): parameters and seconds taken by each step in each mode
+    """
+    work_dir = tempfile.mkdtemp(prefix="relecov_sftp_benchmark_")
+    template = os.path.join(work_dir, "template")
+    folder_files = populate_lab_folders(
+        template, labs=labs, batches=batches, samples=samples, reads=reads
+    )
+    results = {
+        "parameters": {
+            "labs": labs,
+            "batches": batches,
+            "samples": samples,
+            "reads": reads,
+            "workers": workers,
+            "latency": latency,
+            "bandwidth": bandwidth,
+            "drop_after": drop_after,
+            "total_bytes": sum(
+                os.path.getsize(os.path.join(template, folder, file))
+                for folder, files in folder_files.items()
+                for file in files
+            ),
+        },
+        "steps": {},
+    }
+    try:
+        for mode in ["sequential", "concurrent"]:
+            root = os.path.join(work_dir, mode, "remote")
+            shutil.copytree(template, root)
+            local_dir = os.path.join(work_dir, mode, "local")
+            os.makedirs(local_dir)
+            with LocalSftpServer(root, latency, bandwidth, drop_after) as server:
+                conf_file = server.write_config(os.path.join(work_dir, "conf.json"))
+                relecov_sftp = SftpRelecov(conf_file, "benchmark", "benchmark")
+                relecov_sftp.open_connection()
+                step_times = run_steps(
+                    relecov_sftp, folder_files, local_dir, mode, workers
+                )
+                relecov_sftp.close_connection()
+            for step, seconds in step_times.items():
+                results["steps"].setdefault(step, {})[mode] = seconds
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def run_steps(relecov_sftp, folder_files, local_dir, mode, workers):
+    """Time listing, transfer, rename and cleanup of the remote folders
+
+    Returns:
+        step_times (dict(str:float)): seconds taken by each step
+    """
+    concurrent = mode == "concurrent"
+    step_times = {}
+
+    start = time.perf_counter()
+    if concurrent:
+        relecov_sftp.build_remote_tree(".")
+    else:
+        for folder in relecov_sftp.list_remote_folders(".", recursive=True):
+            relecov_sftp.get_file_list(folder)
+    step_times["listing"] = time.perf_counter() - start
+
+    remote_files = [
+        os.path.join(folder, file)
+        for folder, files in folder_files.items()
+        for file in files
+    ]
+
+    def fetch(remote_file):
+        local_file = os.path.join(local_dir, remote_file.replace("/", "_"))
+        return relecov_sftp.get_from_sftp_with_hash(remote_file, local_file)
+
+    start = time.perf_counter()
+    if concurrent:
+        relecov_sftp.open_channel_pool(workers)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(fetch, remote_files))
+        relecov_sftp.close_channel_pool()
+    else:
+        for remote_file in remote_files:
+            fetch(remote_file)
+    step_times["transfer"] = time.perf_counter() - start
+
+    # Move every file into a processing folder, as done with lab subfolders
+    renames = []
+    for folder, files in folder_files.items():
+        processing_folder = folder + "_tmp_processing"
+        relecov_sftp.make_dir(processing_folder)
+        renames.extend(
+            (os.path.join(folder, file), os.path.join(processing_folder, file))
+            for file in files
+        )
+    start = time.perf_counter()
+    if concurrent:
+        relecov_sftp.rename_files(renames)
+    else:
+        for old_name, new_name in renames:
+            relecov_sftp.rename_file(old_name, new_name)
+    step_times["rename"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    moved_files = [new_name for _, new_name in renames]
+    folders = list(folder_files) + [
+        folder + "_tmp_processing" for folder in folder_files
+    ]
+    if concurrent:
+        relecov_sftp.remove_files(moved_files)
+        relecov_sftp.remove_files(folders, directories=True)
+    else:
+        for moved_file in moved_files:
+            relecov_sftp.remove_file(moved_file)
+        for folder in folders:
+            relecov_sftp.remove_dir(folder)
+    step_times["cleanup"] = time.perf_counter() - start
+    return step_times
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,715 @@
+#!/usr/bin/env python
+"""Generate a synthetic RELECOV dataset at a configurable scale.
+
+Lab metadata follows relecov_schema.json and the lab template heading defined
+in configuration.json, and the analysis results follow the file patterns of
+conf/bioinfo_config.json, so every module can be run over the generated data
+without any production sample. Output layout:
+
+    <output>/remote/COD-synth-N/RELECOV/batch_NN/  metadata excel, FASTQ and md5sum files
+    <output>/analysis/COD-synth-N/                 viralrecon or irma results of the lab
+    <output>/unique_sampleid_registry.json         registry of previously validated samples
+    <output>/dataset.json                          parameters and content of the dataset
+
+Example:
+    python3 tests/generate_dataset.py -o /tmp/synthetic --labs 10 --batches 10 --samples 100
+"""
+import os
+import re
+import sys
+import gzip
+import random
+import argparse
+import hashlib
+from datetime import datetime, timedelta
+from openpyxl import Workbook
+from relecov_tools.config_json import ConfigJson
+import relecov_tools.utils
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from sftp_server import write_fastq_gz  # noqa: E402
+
+CONF_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "relecov_tools",
+    "conf",
+)
+SCHEMA_DIR = os.path.join(os.path.dirname(CONF_DIR), "schema")
+ONTOLOGY_REGEX = r" \[\w+:.*\]$"
+# Template fields that labs leave empty before the samples are submitted
+EMPTY_LABELS = [
+    "ENA Sample ID",
+    "GISAID Virus Name",
+    "GISAID id",
+    "Environmental Material",
+    "Environmental System",
+    "Host Age Months",
+]
+ORGANISMS = {
+    "viralrecon": "Severe acute respiratory syndrome coronavirus 2 [LOINC:LA31065-8]",
+    "irma": "Influenza virus [SNOMED:725894000]",
+}
+SARS_COV_2_LENGTH = 29903
+FLU_SEGMENTS = {
+    "PB2": 2341,
+    "PB1": 2341,
+    "PA": 2233,
+    "HA": 1778,
+    "NP": 1565,
+    "NA": 1413,
+    "MP": 1027,
+    "NS": 890,
+}
+SOFTWARE_VERSIONS = {
+    "viralrecon": [
+        ("NFCORE_VIRALRECON", "nf-core/viralrecon", "2.6.0"),
+        ("BCFTOOLS_CONSENSUS", "bcftools", "1.16"),
+        ("KRAKEN2_KRAKEN2", "kraken2", "2.1.2"),
+        ("BOWTIE2_ALIGN", "bowtie2", "2.4.4"),
+        ("FASTP", "fastp", "0.23.2"),
+        ("IVAR_VARIANTS", "ivar", "1.4"),
+        ("NEXTCLADE_RUN", "nextclade", "2.14.0"),
+    ],
+    "irma": [
+        ("IRMA", "irma", "1.2.0"),
+        ("FASTP", "fastp", "0.23.2"),
+        ("KRAKEN2_KRAKEN2", "kraken2", "2.1.2"),
+        ("NEXTCLADE_RUN", "nextclade", "2.14.0"),
+    ],
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-o", "--output", required=True, help="Output folder")
+    parser.add_argument("--labs", type=int, default=2, help="Number of labs")
+    parser.add_argument("--batches", type=int, default=1, help="Batches per lab")
+    parser.add_argument("--samples", type=int, default=10, help="Samples per batch")
+    parser.add_argument("--reads", type=int, default=100, help="Reads per FASTQ")
+    parser.add_argument("--read_length", type=int, default=150, help="Read length")
+    parser.add_argument(
+        "--software",
+        choices=list(ORGANISMS),
+        default="viralrecon",
+        help="Pipeline used to generate the analysis results",
+    )
+    parser.add_argument(
+        "--registry_size",
+        type=int,
+        default=100,
+        help="Samples already present in the ID registry",
+    )
+    parser.add_argument("--seed", type=int, default=1, help="Random seed")
+    args = parser.parse_args()
+
+    dataset = generate_dataset(**vars(args))
+    print(
+        f"Generated {dataset['total_samples']} samples in {len(dataset['batches'])} "
+        f"batches ({dataset['total_bytes']} bytes) in {args.output}"
+    )
+
+
+def generate_dataset(
+    output,
+    labs=2,
+    batches=1,
+    samples=10,
+    reads=100,
+    read_length=150,
+    software="viralrecon",
+    registry_size=100,
+    seed=1,
+):
+    """Generate lab folders, analysis results and ID registry for the given scale
+
+    Args:
+        output (str): folder where the dataset is created
+        labs (int): number of labs, named COD-synth-1, COD-synth-2...
+        batches (int): number of batches sent by each lab
+        samples (int): number of samples in each batch
+        reads (int): number of reads in each FASTQ file
+        read_length (int): length of each read
+        software (str): pipeline results to generate, viralrecon or irma
+        registry_size (int): samples registered in previous validations
+        seed (int): seed of the random generator
+
+    Returns:
+        dataset (dict): parameters, paths and batches of the generated dataset
+    """
+    rng = random.Random(seed)
+    template = MetadataTemplate(ORGANISMS[software])
+    remote_dir = os.path.join(output, "remote")
+    analysis_dir = os.path.join(output, "analysis")
+    base_date = datetime(2024, 1, 8)
+    dataset = {
+        "parameters": {
+            "labs": labs,
+            "batches": batches,
+            "samples": samples,
+            "reads": reads,
+            "read_length": read_length,
+            "software": software,
+            "registry_size": registry_size,
+            "seed": seed,
+        },
+        "remote_folder": os.path.abspath(remote_dir),
+        "analysis_folder": os.path.abspath(analysis_dir),
+        "registry": os.path.abspath(
+            os.path.join(output, "unique_sampleid_registry.json")
+        ),
+        "batches": [],
+    }
+    for lab_idx in range(1, labs + 1):
+        lab = f"COD-synth-{lab_idx}"
+        institution = template.institutions[lab_idx % len(template.institutions)]
+        analysis_folder = os.path.join(analysis_dir, lab)
+        lab_samples = []
+        for batch_idx in range(1, batches + 1):
+            batch = f"batch_{batch_idx:02d}"
+            batch_date = base_date + timedelta(days=7 * (batch_idx - 1))
+            remote_folder = os.path.join(remote_dir, lab, "RELECOV", batch)
+            os.makedirs(remote_folder, exist_ok=True)
+            sample_files = write_sample_fastqs(
+                remote_folder, lab_idx, batch_idx, samples, reads, read_length, rng
+            )
+            rows = template.sample_rows(institution, batch_date, sample_files, rng)
+            template.write_excel(
+                os.path.join(remote_folder, f"{lab}_metadata_lab.xlsx"), rows
+            )
+            lab_samples.extend(sample_files)
+            dataset["batches"].append(
+                {
+                    "lab": lab,
+                    "batch": batch,
+                    "remote_folder": os.path.join(lab, "RELECOV", batch),
+                    "analysis_folder": os.path.abspath(analysis_folder),
+                    "samples": list(sample_files),
+                }
+            )
+        # Batches of the same lab are downloaded together and analysed in one run
+        if software == "viralrecon":
+            write_viralrecon_results(
+                analysis_folder, lab_samples, batch_date, read_length, rng
+            )
+        else:
+            write_irma_results(
+                analysis_folder, lab_samples, batch_date, read_length, rng
+            )
+    write_registry(dataset["registry"], registry_size, labs, base_date, rng)
+    dataset["total_samples"] = labs * batches * samples
+    dataset["total_bytes"] = sum(
+        os.path.getsize(os.path.join(root, file))
+        for root, _, files in os.walk(output)
+        for file in files
+    )
+    relecov_tools.utils.write_json_to_file(
+        dataset, os.path.join(output, "dataset.json")
+    )
+    return dataset
+
+
+def write_sample_fastqs(folder, lab_idx, batch_idx, samples, reads, read_length, rng):
+    """Write paired FASTQ files and the md5sum file of a batch
+
+    Returns:
+        sample_files (dict(str:tuple(str, str))): R1 and R2 files of each sample
+    """
+    sample_files = {}
+    md5_lines = []
+    for sample_idx in range(1, samples + 1):
+        sample = f"SYN{lab_idx:03d}{batch_idx:03d}{sample_idx:05d}"
+        sample_files[sample] = (
+            f"{sample}_S{sample_idx}_L001_R1_001.fastq.gz",
+            f"{sample}_S{sample_idx}_L001_R2_001.fastq.gz",
+        )
+        for fastq in sample_files[sample]:
+            fastq_path = os.path.join(folder, fastq)
+            write_fastq_gz(fastq_path, reads, read_length, rng)
+            with open(fastq_path, "rb") as fh:
+                md5_lines.append(f"{hashlib.md5(fh.read()).hexdigest()}  {fastq}\n")
+    with open(os.path.join(folder, "md5sum.txt"), "w") as fh:
+        fh.writelines(md5_lines)
+    return sample_files
+
+
+class MetadataTemplate:
+    """Lab metadata excel template built from the schema examples and enums"""
+
+    def __init__(self, organism):
+        config_json = ConfigJson()
+        schema_file = config_json.get_topic_data("json_schemas", "relecov_schema")
+        schema = relecov_tools.utils.read_json_file(
+            os.path.join(SCHEMA_DIR, schema_file)
+        )
+        self.heading = config_json.get_topic_data(
+            "lab_metadata", "metadata_lab_heading"
+        )
+        self.processing = config_json.get_topic_data(
+            "sftp_handle", "metadata_processing"
+        )
+        label_prop = {
+            values.get("label"): prop for prop, values in schema["properties"].items()
+        }
+        self.properties = {
+            label: schema["properties"].get(label_prop.get(label), {})
+            for label in self.heading
+        }
+        self.required = {
+            label
+            for label in self.heading
+            if label_prop.get(label) in schema.get("required", [])
+        }
+        self.defaults = {
+            label: self.example_value(values)
+            for label, values in self.properties.items()
+            if label not in EMPTY_LABELS
+        }
+        self.defaults["Organism"] = organism
+        # Institutions with a known address, so that location fields are filled
+        addresses = relecov_tools.utils.read_json_file(
+            os.path.join(CONF_DIR, "laboratory_address.json")
+        )
+        collecting_enum = self.enum_labels(self.properties["Originating Laboratory"])
+        submitting_enum = self.enum_labels(self.properties["Submitting Institution"])
+        self.institutions = [
+            (name, address["submitting_institution"])
+            for name, address in sorted(addresses.items())
+            if name in collecting_enum
+            and address.get("submitting_institution") in submitting_enum
+        ]
+
+    @staticmethod
+    def enum_labels(values):
+        """Enum values of a property without their ontology term"""
+        return [re.sub(ONTOLOGY_REGEX, "", str(x)) for x in values.get("enum", [])]
+
+    def example_value(self, values):
+        """First example of the property that is accepted by its enum, as labs
+        fill the template without ontology terms
+        """
+        enum = self.enum_labels(values)
+        for example in values.get("examples", []):
+            example = str(example).strip()
+            if not enum or example in enum:
+                return example
+        return enum[0] if enum else None
+
+    def sample_rows(self, institution, batch_date, sample_files, rng):
+        """Fill one metadata row per sample with unique ids, dates and files
+
+        Args:
+            institution (tuple(str, str)): collecting and submitting institution
+            batch_date (datetime): date in which the batch was sequenced
+            sample_files (dict(str:tuple(str, str))): R1 and R2 files of each sample
+            rng (random.Random): random generator
+
+        Returns:
+            rows (list(dict)): values of each sample by template label
+        """
+        rows = []
+        for sample, (fastq_r1, fastq_r2) in sample_files.items():
+            collection_date = batch_date - timedelta(days=rng.randint(3, 20))
+            row = dict(self.defaults)
+            row.update(
+                {
+                    "Public Health sample id (SIVIRA)": f"SIV{sample}",
+                    "Sample ID given by originating laboratory": f"COL{sample}",
+                    "Sample ID given by the submitting laboratory": f"SUB{sample}",
+                    "Sample ID given in the microbiology lab": f"MIC{sample}",
+                    "Sample ID given if multiple rna-extraction or passages": sample,
+                    "Sample ID given for sequencing": sample,
+                    "Originating Laboratory": institution[0],
+                    "Submitting Institution": institution[1],
+                    "Sequencing Institution": institution[1],
+                    "Sample Collection Date": f"{collection_date:%Y-%m-%d}",
+                    "Sample Received Date": (
+                        f"{collection_date + timedelta(days=1):%Y-%m-%d}"
+                    ),
+                    "Sequencing Date": f"{batch_date:%Y-%m-%d}",
+                    "Host Age Years": rng.randint(1, 99),
+                    "Number Of Samples In Run": len(sample_files),
+                    "Runid": f"{sample[:9]}_{batch_date:%Y%m%d}",
+                    "Library Layout": "Paired-end",
+                    "Diagnostic Pcr Ct Value 1": str(rng.randint(15, 35)),
+                    "Diagnostic Pcr Ct Value-2": str(rng.randint(15, 35)),
+                    "Sequence file R1": fastq_r1,
+                    "Sequence file R2": fastq_r2,
+                }
+            )
+            rows.append(row)
+        return rows
+
+    def write_excel(self, file_path, rows):
+        """Write the metadata sheet with the same layout as the lab template:
+        requirement, example and description rows above the heading row
+        """
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.title = self.processing["excel_sheet"]
+        sheet.append(
+            ["REQUERIDO"] + ["Y" if x in self.required else "" for x in self.heading]
+        )
+        sheet.append(
+            ["EJEMPLOS"]
+            + [str(self.properties[x].get("examples", [""])[0]) for x in self.heading]
+        )
+        sheet.append(
+            ["DESCRIPCIÓN"]
+            + [self.properties[x].get("description", "") for x in self.heading]
+        )
+        sheet.append([self.processing["header_flag"]] + self.heading)
+        for row in rows:
+            sheet.append([None] + [row.get(label) for label in self.heading])
+        workbook.save(file_path)
+
+
+def random_sequence(length, rng):
+    return "".join(rng.choices("ACGT", k=length))
+
+
+def random_variants(sequence, count, rng):
+    """Select random SNVs over the given sequence
+
+    Returns:
+        variants (list(tuple(int, str, str))): 1-based position, ref and alt bases
+    """
+    variants = []
+    for pos in sorted(rng.sample(range(1, len(sequence) + 1), count)):
+        ref = sequence[pos - 1]
+        variants.append((pos, ref, rng.choice([x for x in "ACGT" if x != ref])))
+    return variants
+
+
+def apply_variants(sequence, variants):
+    bases = list(sequence)
+    for pos, _, alt in variants:
+        bases[pos - 1] = alt
+    return "".join(bases)
+
+
+def write_fasta(file_path, records):
+    """Write a fasta file wrapped at 60 bases from a list of (header, sequence)"""
+    with open(file_path, "w") as fh:
+        for header, sequence in records:
+            fh.write(f">{header}\n")
+            for idx in range(0, len(sequence), 60):
+                fh.write(sequence[idx : idx + 60] + "\n")
+
+
+def write_table(file_path, heading, rows, sep=","):
+    with open(file_path, "w") as fh:
+        fh.write(sep.join(heading) + "\n")
+        for row in rows:
+            fh.write(sep.join(str(row[field]) for field in heading) + "\n")
+
+
+def write_vcf(file_path, chrom_variants, sample):
+    """Write a minimal vcf, gzipped if the file name ends with .gz"""
+    opener = gzip.open if file_path.endswith(".gz") else open
+    with opener(file_path, "wt") as fh:
+        fh.write("##fileformat=VCFv4.2\n")
+        fh.write(f"#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t{sample}\n")
+        for chrom, variants in chrom_variants:
+            for pos, ref, alt in variants:
+                fh.write(f"{chrom}\t{pos}\t.\t{ref}\t{alt}\t.\tPASS\tDP=500\tGT\t1\n")
+
+
+def write_multiqc_report(file_path, versions):
+    """Write a multiqc report with the software versions table"""
+    rows = "\n".join(
+        f"<tr><td>{process}</td><td>{name}</td><td>{version}</td></tr>"
+        for process, name, version in versions
+    )
+    with open(file_path, "w") as fh:
+        fh.write(
+            "<html><body>\n"
+            '<div class="mqc-module-section" id="mqc-module-section-software_versions">\n'
+            '<table class="table">\n'
+            "<tr><th>Process Name</th><th>Software</th><th>Version</th></tr>\n"
+            f"{rows}\n</table>\n</div>\n</body></html>\n"
+        )
+
+
+def mapping_stats(sample, batch_date, read_length, rng):
+    """Common mapping metrics of viralrecon and irma summary tables"""
+    total_reads = rng.randint(20000, 2000000)
+    per_host = round(rng.uniform(0, 30), 2)
+    per_virus = round(rng.uniform(60, 100 - per_host), 2)
+    return {
+        "sample": sample,
+        "totalreads": total_reads,
+        "%readshost": per_host,
+        "%readsvirus": per_virus,
+        "%unmappedreads": round(100 - per_host - per_virus, 2),
+        "medianDPcoveragevirus": rng.randint(50, 5000),
+        "Coverage>10x(%)": round(rng.uniform(90, 100), 2),
+        "%Ns10x": round(rng.uniform(0, 10), 2),
+        "Variantsinconsensusx10": rng.randint(20, 90),
+        "MissenseVariants": rng.randint(10, 60),
+        "read_length": read_length,
+        "analysis_date": f"{batch_date + timedelta(days=2):%Y-%m-%d}",
+        "clade_assignment_date": f"{batch_date + timedelta(days=2):%Y-%m-%d}",
+        "clade_assignment_software_database_version": "2024-01-05T12:00:00Z",
+    }
+
+
+def write_viralrecon_results(folder, samples, batch_date, read_length, rng):
+    """Write a viralrecon output tree with the files in bioinfo_config.json"""
+    ivar_folder = os.path.join(folder, "variants", "ivar")
+    consensus_folder = os.path.join(ivar_folder, "consensus", "bcftools")
+    pangolin_folder = os.path.join(consensus_folder, "pangolin")
+    multiqc_folder = os.path.join(folder, "multiqc")
+    for sub_folder in [pangolin_folder, multiqc_folder]:
+        os.makedirs(sub_folder, exist_ok=True)
+    date_tag = f"{batch_date:%Y%m%d}"
+    reference = random_sequence(SARS_COV_2_LENGTH, rng)
+    lineages = ["JN.1", "BA.2.86", "XBB.1.5", "EG.5.1", "HV.1"]
+    mapping_rows, qc_rows, summary_rows, long_table_rows = [], [], [], []
+    for sample in samples:
+        lineage = rng.choice(lineages)
+        variants = random_variants(reference, rng.randint(20, 90), rng)
+        consensus = apply_variants(reference, variants)
+        n_count = rng.randint(0, 3000)
+        stats = mapping_stats(sample, batch_date, read_length, rng)
+        stats.update(
+            {
+                "run": f"run_{date_tag}",
+                "user": "synthetic",
+                "host": "Human",
+                "Virussequence": "NC_045512.2",
+                "clade_assignment": rng.choice(["24A", "23I", "23F"]),
+            }
+        )
+        mapping_rows.append(stats)
+        qc_rows.append(
+            {
+                "sample": sample,
+                "S-Gene_Ambiguous_Percentage": round(rng.uniform(0, 5), 2),
+                "S-Gene_Coverage_Percentage": round(rng.uniform(95, 100), 2),
+                "%LDMutations": round(rng.uniform(50, 100), 2),
+                "S-Gene_Frameshifts": rng.choice([0, 0, 0, 1]),
+                "Total_Unambiguous_Bases": SARS_COV_2_LENGTH - n_count,
+                "Total_Ns_count": n_count,
+            }
+        )
+        summary_rows.append(
+            {
+                "Sample": sample,
+                "# Input reads": stats["totalreads"],
+                "# Trimmed reads (fastp)": int(stats["totalreads"] * 0.95),
+                "% Non-host reads (Kraken 2)": round(100 - stats["%readshost"], 2),
+                "% Mapped reads": stats["%readsvirus"],
+                "Coverage median": stats["medianDPcoveragevirus"],
+                "% Coverage > 10x": stats["Coverage>10x(%)"],
+                "# SNPs": len(variants),
+                "# Missense variants": stats["MissenseVariants"],
+                "# Ns per 100kb consensus": round(n_count * 100000 / SARS_COV_2_LENGTH),
+                "Pangolin lineage": lineage,
+            }
+        )
+        for pos, ref, alt in variants:
+            dp = rng.randint(100, 3000)
+            alt_dp = int(dp * rng.uniform(0.75, 1))
+            long_table_rows.append(
+                {
+                    "SAMPLE": sample,
+                    "CHROM": "NC_045512.2",
+                    "POS": pos,
+                    "REF": ref,
+                    "ALT": alt,
+                    "FILTER": "PASS",
+                    "DP": dp,
+                    "REF_DP": dp - alt_dp,
+                    "ALT_DP": alt_dp,
+                    "AF": round(alt_dp / dp, 2),
+                    "GENE": rng.choice(["orf1ab", "S", "ORF3a", "M", "N"]),
+                    "EFFECT": "missense_variant",
+                    "HGVS_C": f"c.{pos}{ref}>{alt}",
+                    "HGVS_P": ".",
+                    "HGVS_P_1LETTER": ".",
+                    "CALLER": "ivar",
+                    "LINEAGE": lineage,
+                }
+            )
+        write_fasta(
+            os.path.join(consensus_folder, f"{sample}.consensus.fa"),
+            [(f"{sample} NC_045512.2", consensus)],
+        )
+        write_table(
+            os.path.join(pangolin_folder, f"{sample}.pangolin.csv"),
+            [
+                "taxon",
+                "lineage",
+                "conflict",
+                "scorpio_call",
+                "version",
+                "pangolin_version",
+                "scorpio_version",
+                "constellation_version",
+                "qc_status",
+                "lineage_assignment_date",
+                "lineage_assignment_database_version",
+            ],
+            [
+                {
+                    "taxon": f"{sample} NC_045512.2",
+                    "lineage": lineage,
+                    "conflict": 0.0,
+                    "scorpio_call": "Omicron (Unassigned)",
+                    "version": "PUSHER-v1.23",
+                    "pangolin_version": "4.3.1",
+                    "scorpio_version": "0.3.19",
+                    "constellation_version": "v0.1.12",
+                    "qc_status": "pass",
+                    "lineage_assignment_date": f"{batch_date + timedelta(days=2):%Y-%m-%d}",
+                    "lineage_assignment_database_version": "v1.23",
+                }
+            ],
+        )
+        write_vcf(
+            os.path.join(ivar_folder, f"{sample}.filtered.vcf.gz"),
+            [("NC_045512.2", variants)],
+            sample,
+        )
+    with open(os.path.join(folder, "samples_id.txt"), "w") as fh:
+        fh.write("\n".join(samples) + "\n")
+    # The configuration expects the sample name in the second column
+    mapping_heading = ["run", "sample"] + [
+        x for x in mapping_rows[0] if x not in ("run", "sample")
+    ]
+    write_table(
+        os.path.join(folder, f"mapping_illumina_{date_tag}.tab"),
+        mapping_heading,
+        mapping_rows,
+        sep="\t",
+    )
+    write_table(
+        os.path.join(folder, f"quality_control_report_{date_tag}.tsv"),
+        list(qc_rows[0]),
+        qc_rows,
+        sep="\t",
+    )
+    write_table(
+        os.path.join(ivar_folder, "summary_variants_metrics_mqc.csv"),
+        list(summary_rows[0]),
+        summary_rows,
+    )
+    write_table(
+        os.path.join(ivar_folder, "variants_long_table.csv"),
+        list(long_table_rows[0]),
+        long_table_rows,
+    )
+    write_multiqc_report(
+        os.path.join(multiqc_folder, "multiqc_report.html"),
+        SOFTWARE_VERSIONS["viralrecon"],
+    )
+
+
+def write_irma_results(folder, samples, batch_date, read_length, rng):
+    """Write an irma output tree with the files in bioinfo_config.json"""
+    consensus_folder = os.path.join(folder, "99-stats", "consensus_files")
+    vcf_folder = os.path.join(folder, "06-variant-calling", "vcf_files")
+    multiqc_folder = os.path.join(folder, "multiqc")
+    for sub_folder in [consensus_folder, vcf_folder, multiqc_folder]:
+        os.makedirs(sub_folder, exist_ok=True)
+    references = {x: random_sequence(y, rng) for x, y in FLU_SEGMENTS.items()}
+    summary_rows, long_table_rows = [], []
+    for sample in samples:
+        subtype = rng.choice(["H1N1", "H3N2"])
+        clade = rng.choice(["6B.1A.5a.2a", "3C.2a1b.2a.2a.3a.1"])
+        segment_variants = {
+            x: random_variants(y, rng.randint(2, 15), rng)
+            for x, y in references.items()
+        }
+        n_count = rng.randint(0, 500)
+        stats = mapping_stats(sample, batch_date, read_length, rng)
+        stats.update(
+            {
+                "qc_filtered_reads": int(stats["totalreads"] * 0.95),
+                "Total_Unambiguous_Bases": sum(FLU_SEGMENTS.values()) - n_count,
+                "Total_Ns_count": n_count,
+                "flu_type": "A",
+                "flu_subtype": subtype,
+                "clade": clade,
+            }
+        )
+        summary_rows.append(stats)
+        for segment, variants in segment_variants.items():
+            for pos, ref, alt in variants:
+                dp = rng.randint(100, 3000)
+                alt_dp = int(dp * rng.uniform(0.75, 1))
+                long_table_rows.append(
+                    {
+                        "SAMPLE": sample,
+                        "FLU_SUBTYPE": subtype,
+                        "CHROM": f"{sample}_{segment}",
+                        "POS": pos,
+                        "REF": ref,
+                        "ALT": alt,
+                        "FILTER": "PASS",
+                        "DP": dp,
+                        "REF_DP": dp - alt_dp,
+                        "ALT_DP": alt_dp,
+                        "AF": round(alt_dp / dp, 2),
+                        "GENE": segment,
+                        "EFFECT": "missense_variant",
+                        "HGVS_C": f"c.{pos}{ref}>{alt}",
+                        "HGVS_P": ".",
+                        "HGVS_P_1LETTER": ".",
+                        "CALLER": "irma",
+                        "CLADE": clade,
+                    }
+                )
+        write_fasta(
+            os.path.join(consensus_folder, f"{sample}.consensus.fa"),
+            [
+                (f"{sample}_{x}", apply_variants(references[x], y))
+                for x, y in segment_variants.items()
+            ],
+        )
+        write_vcf(
+            os.path.join(vcf_folder, f"{sample}.vcf"),
+            [(f"{sample}_{x}", y) for x, y in segment_variants.items()],
+            sample,
+        )
+    with open(os.path.join(folder, "samples_id.txt"), "w") as fh:
+        fh.write("\n".join(samples) + "\n")
+    write_table(
+        os.path.join(folder, f"summary_stats_{batch_date:%Y%m%d}.tab"),
+        list(summary_rows[0]),
+        summary_rows,
+        sep="\t",
+    )
+    write_table(
+        os.path.join(folder, "variants_long_table.csv"),
+        list(long_table_rows[0]),
+        long_table_rows,
+    )
+    write_table(
+        os.path.join(folder, "versions.csv"),
+        ["software_name", "software_version"],
+        [
+            {"software_name": name, "software_version": version}
+            for _, name, version in SOFTWARE_VERSIONS["irma"]
+        ],
+    )
+    write_multiqc_report(
+        os.path.join(multiqc_folder, "multiqc_report.html"), SOFTWARE_VERSIONS["irma"]
+    )
+
+
+def write_registry(file_path, size, labs, base_date, rng):
+    """Write an ID registry with samples validated before the generated ones"""
+    registry = {}
+    for idx in range(1, size + 1):
+        generated_at = base_date - timedelta(minutes=rng.randint(1, 525600))
+        registry[f"RLCV-{idx:09d}"] = {
+            "sequencing_sample_id": f"OLD{idx:09d}",
+            "lab_code": f"COD-synth-{rng.randint(1, max(labs, 1))}",
+            "generated_at": generated_at.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+    relecov_tools.utils.write_json_to_file(registry, file_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,409 @@
+#!/usr/bin/env python
+"""Local SFTP server used to test and benchmark the sftp modules offline.
+
+The server runs in the current process over a local directory and accepts any
+user and password. Network conditions can be emulated with latency, bandwidth
+caps and connection drops, and synthetic lab folders with metadata excel,
+md5sum and FASTQ files can be created in it with populate_lab_folders().
+
+Example:
+    with LocalSftpServer(root, latency=0.02) as server:
+        populate_lab_folders(root, labs=2, samples=10)
+        conf_file = server.write_config(os.path.join(tmp_dir, "sftp_conf.json"))
+        relecov_sftp = SftpRelecov(conf_file, "user", "password")
+"""
+import gzip
+import hashlib
+import json
+import os
+import queue
+import random
+import socket
+import threading
+import time
+import paramiko
+from openpyxl import Workbook
+from relecov_tools.config_json import ConfigJson
+
+
+class AnyUserServer(paramiko.ServerInterface):
+    """Accept any user and password and sftp subsystem requests"""
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+
+class LocalSftpHandle(paramiko.SFTPHandle):
+    def stat(self):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def chattr(self, attr):
+        return paramiko.SFTP_OK
+
+
+class LocalSftpInterface(paramiko.SFTPServerInterface):
+    """Serve the content of a local folder as the root of the sftp server"""
+
+    def __init__(self, server, root, *args, **kwargs):
+        self.root = root
+        super().__init__(server, *args, **kwargs)
+
+    def local_path(self, path):
+        return self.root + self.canonicalize(path)
+
+    def list_folder(self, path):
+        path = self.local_path(path)
+        try:
+            return [
+                paramiko.SFTPAttributes.from_stat(
+                    os.stat(os.path.join(path, name)), name
+                )
+                for name in os.listdir(path)
+            ]
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self.local_path(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        path = self.local_path(path)
+        try:
+            fd = os.open(path, flags, 0o644)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        if flags & os.O_WRONLY:
+            mode = "ab" if flags & os.O_APPEND else "wb"
+        elif flags & os.O_RDWR:
+            mode = "a+b" if flags & os.O_APPEND else "r+b"
+        else:
+            mode = "rb"
+        handle = LocalSftpHandle(flags)
+        handle.filename = path
+        handle.readfile = handle.writefile = os.fdopen(fd, mode)
+        return handle
+
+    def remove(self, path):
+        try:
+            os.remove(self.local_path(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        newpath = self.local_path(newpath)
+        if os.path.exists(newpath):
+            return paramiko.SFTP_FAILURE
+        try:
+            os.rename(self.local_path(oldpath), newpath)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def mkdir(self, path, attr):
+        try:
+            os.mkdir(self.local_path(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def rmdir(self, path):
+        try:
+            os.rmdir(self.local_path(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def chattr(self, path, attr):
+        return paramiko.SFTP_OK
+
+
+class LinkEmulator:
+    """Forward the data of a connection between two sockets emulating a network
+    link with latency, limited bandwidth and drops"""
+
+    def __init__(
+        self, client_sock, server_sock, latency=0, bandwidth=None, drop_after=None
+    ):
+        """
+        Args:
+            client_sock (socket): socket connected to the client
+            server_sock (socket): socket connected to the ssh transport
+            latency (float): round trip time added to the link, in seconds
+            bandwidth (float, optional): maximum bytes per second in each direction
+            drop_after (int, optional): close the connection after this many bytes
+        """
+        self.sockets = (client_sock, server_sock)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.drop_after = drop_after
+        self.transferred = 0
+        self.lock = threading.Lock()
+
+    def start(self):
+        client_sock, server_sock = self.sockets
+        for source, destination in [
+            (client_sock, server_sock),
+            (server_sock, client_sock),
+        ]:
+            pending = queue.Queue()
+            for target, args in [
+                (self.receive, (source, pending)),
+                (self.deliver, (destination, pending)),
+            ]:
+                threading.Thread(target=target, args=args, daemon=True).start()
+
+    def close(self):
+        for sock in self.sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+
+    def receive(self, source, pending):
+        """Read data as soon as it arrives and schedule its delivery"""
+        while True:
+            try:
+                data = source.recv(65536)
+            except OSError:
+                data = b""
+            pending.put((time.monotonic() + self.latency / 2, data))
+            if not data:
+                return
+
+    def deliver(self, destination, pending):
+        """Send the data once its delay is over, limited by the bandwidth"""
+        while True:
+            deliver_time, data = pending.get()
+            delay = deliver_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            if not data:
+                self.close()
+                return
+            if self.bandwidth:
+                time.sleep(len(data) / self.bandwidth)
+            with self.lock:
+                self.transferred += len(data)
+                dropped = self.drop_after and self.transferred > self.drop_after
+            if dropped:
+                self.close()
+                return
+            try:
+                destination.sendall(data)
+            except OSError:
+                self.close()
+                return
+
+
+class LocalSftpServer:
+    """SFTP server on localhost serving a local folder, with optional emulation
+    of network latency, bandwidth caps and connection drops"""
+
+    def __init__(self, root, latency=0, bandwidth=None, drop_after=None):
+        """
+        Args:
+            root (str): local folder served as the root of the sftp
+            latency (float): round trip time added to each connection, in seconds
+            bandwidth (float, optional): maximum bytes per second of each connection
+            drop_after (int, optional): drop each connection after this many bytes
+        """
+        self.root = os.path.realpath(root)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.drop_after = drop_after
+        self.host = "127.0.0.1"
+        self.port = None
+        self.host_key = None
+        self.listener = None
+        self.transports = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        """Start listening in a random port
+
+        Returns:
+            port (int): port of the server
+        """
+        os.makedirs(self.root, exist_ok=True)
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((self.host, 0))
+        self.listener.listen(64)
+        self.port = self.listener.getsockname()[1]
+        threading.Thread(target=self.accept_connections, daemon=True).start()
+        return self.port
+
+    def stop(self):
+        """Stop accepting connections and close the open ones"""
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+        for transport in self.transports:
+            transport.close()
+        self.transports = []
+
+    def accept_connections(self):
+        while self.listener is not None:
+            try:
+                client_sock, _ = self.listener.accept()
+            except OSError:
+                return
+            emulate = self.latency or self.bandwidth or self.drop_after
+            if emulate:
+                transport_sock, link_sock = socket.socketpair()
+                LinkEmulator(
+                    client_sock,
+                    link_sock,
+                    self.latency,
+                    self.bandwidth,
+                    self.drop_after,
+                ).start()
+            else:
+                transport_sock = client_sock
+            transport = paramiko.Transport(transport_sock)
+            transport.add_server_key(self.host_key)
+            transport.set_subsystem_handler(
+                "sftp", paramiko.SFTPServer, LocalSftpInterface, root=self.root
+            )
+            try:
+                transport.start_server(server=AnyUserServer())
+            except (paramiko.SSHException, EOFError, OSError):
+                continue
+            self.transports.append(transport)
+
+    def write_config(self, conf_path):
+        """Write a configuration file for SftpRelecov pointing to this server
+
+        Args:
+            conf_path (str): path of the json file
+
+        Returns:
+            conf_path (str): path of the json file
+        """
+        with open(conf_path, "w") as fh:
+            json.dump({"sftp_server": self.host, "sftp_port": self.port}, fh)
+        return conf_path
+
+
+def write_fastq_gz(file_path, reads, read_length, rng):
+    """Write a gzipped FASTQ file with random reads
+
+    Args:
+        file_path (str): path of the file
+        reads (int): number of reads
+        read_length (int): length of each read
+        rng (random.Random): random generator, seeded to get the same files
+    """
+    quality = "I" * read_length
+    with gzip.open(file_path, "wt", compresslevel=1) as fh:
+        for idx in range(reads):
+            sequence = "".join(rng.choices("ACGT", k=read_length))
+            fh.write(f"@read_{idx}\n{sequence}\n+\n{quality}\n")
+
+
+def write_metadata_xlsx(file_path, sample_files):
+    """Write a lab metadata excel with the header defined in configuration
+
+    Args:
+        file_path (str): path of the excel file
+        sample_files (dict(str:tuple(str, str))): R1 and R2 files of each sample
+    """
+    config_json = ConfigJson()
+    heading = config_json.get_topic_data("lab_metadata", "metadata_lab_heading")
+    processing = config_json.get_topic_data("sftp_handle", "metadata_processing")
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = processing["excel_sheet"]
+    sheet.append([processing["header_flag"]] + heading)
+    for sample, (fastq_r1, fastq_r2) in sample_files.items():
+        values = {
+            "Sample ID given for sequencing": sample,
+            "Library Layout": "Paired",
+            "Sequence file R1": fastq_r1,
+            "Sequence file R2": fastq_r2,
+        }
+        sheet.append([None] + [values.get(field) for field in heading])
+    workbook.save(file_path)
+
+
+def populate_lab_folders(
+    root,
+    labs=2,
+    batches=1,
+    samples=4,
+    reads=100,
+    read_length=150,
+    subfolder="RELECOV",
+    seed=1,
+):
+    """Create synthetic lab folders with a metadata excel, paired FASTQ files
+    and a md5sum file in each batch folder
+
+    Args:
+        root (str): local folder served by the sftp
+        labs (int): number of labs, named COD-bench-1, COD-bench-2...
+        batches (int): number of batch folders in each lab
+        samples (int): number of samples in each batch
+        reads (int): number of reads in each FASTQ file
+        read_length (int): length of each read
+        subfolder (str, optional): folder inside each lab holding the batches
+        seed (int): seed of the random generator
+
+    Returns:
+        folder_files (dict(str:list(str))): files created in each remote folder
+    """
+    rng = random.Random(seed)
+    folder_files = {}
+    for lab_idx in range(1, labs + 1):
+        lab = f"COD-bench-{lab_idx}"
+        for batch_idx in range(1, batches + 1):
+            remote_folder = os.path.join(lab, subfolder or "", f"batch_{batch_idx:02d}")
+            local_folder = os.path.join(root, remote_folder)
+            os.makedirs(local_folder, exist_ok=True)
+            sample_files = {}
+            md5_lines = []
+            for sample_idx in range(1, samples + 1):
+                sample = f"{lab}_B{batch_idx}_S{sample_idx}"
+                sample_files[sample] = (
+                    f"{sample}_R1.fastq.gz",
+                    f"{sample}_R2.fastq.gz",
+                )
+                for fastq in sample_files[sample]:
+                    fastq_path = os.path.join(local_folder, fastq)
+                    write_fastq_gz(fastq_path, reads, read_length, rng)
+                    with open(fastq_path, "rb") as fh:
+                        md5_lines.append(
+                            f"{hashlib.md5(fh.read()).hexdigest()}  {fastq}\n"
+                        )
+            write_metadata_xlsx(
+                os.path.join(local_folder, f"{lab}_metadata_lab.xlsx"), sample_files
+            )
+            with open(os.path.join(local_folder, "md5sum.txt"), "w") as fh:
+                fh.writelines(md5_lines)
+            folder_files[remote_folder] = sorted(os.listdir(local_folder))
+    return folder_files
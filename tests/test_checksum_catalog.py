@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""Tests for the checksum catalog used to reuse files of previous batches"""
+import json
+import os
+from relecov_tools.download_manager import ChecksumCatalog, DownloadManager
+
+
+def test_catalog_folder_is_created_on_first_use(tmp_path):
+    catalog_path = tmp_path / "storage" / "checksum_catalog.db"
+    catalog = ChecksumCatalog(str(catalog_path))
+    assert not catalog_path.parent.exists()
+    assert catalog.find_copy("md5", 10) is None
+    assert catalog_path.is_file()
+
+
+def test_cataloged_copy_is_found_until_modified(tmp_path):
+    catalog = ChecksumCatalog(str(tmp_path / "checksum_catalog.db"))
+    local_file = tmp_path / "sample.fastq.gz"
+    local_file.write_bytes(b"a" * 10)
+    catalog.add_file(str(local_file), "md5")
+    assert catalog.find_copy("md5", 10) == str(local_file)
+    assert catalog.find_copy("md5", 11) is None
+    assert catalog.find_copy("other_md5", 10) is None
+    reopened = ChecksumCatalog(catalog.catalog_path)
+    assert reopened.find_copy("md5", 10) == str(local_file)
+    local_file.write_bytes(b"b" * 10)
+    os.utime(local_file, ns=(0, 0))
+    assert catalog.find_copy("md5", 10) is None
+    # Stale entries are discarded
+    rows = catalog.connection.execute("SELECT * FROM catalog").fetchall()
+    assert rows == []
+
+
+def test_removed_copy_is_discarded(tmp_path):
+    catalog = ChecksumCatalog(str(tmp_path / "checksum_catalog.db"))
+    removed = tmp_path / "removed.fastq.gz"
+    kept = tmp_path / "kept.fastq.gz"
+    removed.write_bytes(b"a" * 10)
+    kept.write_bytes(b"a" * 10)
+    catalog.add_file(str(removed), "md5")
+    catalog.add_file(str(kept), "md5")
+    removed.unlink()
+    assert catalog.find_copy("md5", 10) == str(kept)
+
+
+def test_manager_does_not_need_existing_storage(tmp_path):
+    storage = tmp_path / "storage"
+    conf_file = tmp_path / "download_conf.json"
+    conf_file.write_text(
+        json.dumps(
+            {
+                "sftp_server": "localhost",
+                "sftp_port": 22,
+                "sftp_user": "user",
+                "sftp_passwd": "password",
+                "target_folders": None,
+                "platform_storage_folder": str(storage),
+            }
+        )
+    )
+    manager = DownloadManager(conf_file=str(conf_file), download_option="download_only")
+    catalog_path = storage / "checksum_catalog.db"
+    assert manager.catalog.catalog_path == str(catalog_path)
+    assert not catalog_path.exists()
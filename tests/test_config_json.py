@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""Tests for the configuration cached per process"""
+import json
+import pytest
+from relecov_tools.config_json import ConfigJson
+
+
+@pytest.fixture
+def config_files(tmp_path, monkeypatch):
+    json_file = tmp_path / "configuration.json"
+    json_file.write_text(
+        json.dumps(
+            {
+                "sftp_handle": {
+                    "transfer_workers": 4,
+                    "sftp_connection": {"sftp_server": "sftp.example.org"},
+                },
+                "json_schemas": {"relecov_schema": "relecov_schema.json"},
+            }
+        )
+    )
+    extra_config = tmp_path / "extra" / "extra_config.json"
+    monkeypatch.setattr(ConfigJson, "_extra_config_path", str(extra_config))
+    ConfigJson.clear_cache()
+    yield str(json_file), tmp_path
+    ConfigJson.clear_cache()
+
+
+def test_topic_keys_are_found_at_any_depth(config_files):
+    json_file, _ = config_files
+    config = ConfigJson(json_file)
+    assert config.get_topic_data("sftp_handle", "transfer_workers") == 4
+    assert config.get_topic_data("sftp_handle", "sftp_server") == "sftp.example.org"
+    assert config.get_topic_data("sftp_handle", "missing") is None
+    assert config.get_topic_data("missing_topic", "transfer_workers") is None
+
+
+def test_returned_values_are_copies(config_files):
+    json_file, _ = config_files
+    config = ConfigJson(json_file)
+    config.get_topic_data("sftp_handle", "sftp_connection")["sftp_server"] = "other"
+    config.get_configuration("sftp_handle")["transfer_workers"] = 1
+    other = ConfigJson(json_file)
+    assert other.get_topic_data("sftp_handle", "sftp_server") == "sftp.example.org"
+    assert other.get_topic_data("sftp_handle", "transfer_workers") == 4
+
+
+def test_cache_is_refreshed_after_including_extra_config(config_files):
+    json_file, tmp_path = config_files
+    cached = ConfigJson(json_file, extra_config=True)
+    assert cached.get_topic_data("sftp_handle", "transfer_workers") == 4
+    new_config = tmp_path / "new_config.json"
+    new_config.write_text(json.dumps({"sftp_handle": {"transfer_workers": 8}}))
+    ConfigJson(json_file, extra_config=True).include_extra_config(
+        str(new_config), config_name=None, force=True
+    )
+    assert (
+        ConfigJson(json_file, extra_config=True).get_topic_data(
+            "sftp_handle", "transfer_workers"
+        )
+        == 8
+    )
+    # Instances without extra config keep the default values
+    assert ConfigJson(json_file).get_topic_data("sftp_handle", "transfer_workers") == 4
+    cached.remove_extra_config(None)
+    assert (
+        ConfigJson(json_file, extra_config=True).get_topic_data(
+            "sftp_handle", "transfer_workers"
+        )
+        == 4
+    )
+
+
+def test_modified_configuration_file_is_read_again(config_files):
+    json_file, _ = config_files
+    assert ConfigJson(json_file).get_topic_data("sftp_handle", "transfer_workers") == 4
+    with open(json_file, "w") as fh:
+        json.dump({"sftp_handle": {"transfer_workers": 2, "extra_key": True}}, fh)
+    config = ConfigJson(json_file)
+    assert config.get_topic_data("sftp_handle", "transfer_workers") == 2
+    assert config.get_topic_data("sftp_handle", "extra_key") is True
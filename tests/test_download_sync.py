@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+"""Tests for incremental downloads with --sync against the local sftp server"""
+import glob
+import gzip
+import hashlib
+import json
+import os
+import pytest
+from relecov_tools.download_manager import DownloadManager
+from relecov_tools.sftp_client import SftpRelecov
+
+from sftp_server import LocalSftpServer, write_metadata_xlsx
+
+LAB = "COD-sync-1"
+
+
+def create_lab_folder(remote_root, samples=2):
+    """Remote batch with uncompressed FASTQ files, its metadata and md5sum"""
+    batch_folder = os.path.join(remote_root, LAB, "RELECOV", "batch_01")
+    os.makedirs(batch_folder)
+    sample_files = {}
+    md5_lines = []
+    for idx in range(1, samples + 1):
+        sample = f"{LAB}_S{idx}"
+        sample_files[sample] = (f"{sample}_R1.fastq", f"{sample}_R2.fastq")
+        for fastq in sample_files[sample]:
+            content = f"@read_{idx}\n{'ACGT' * 50}\n+\n{'I' * 200}\n".encode() * 50
+            with open(os.path.join(batch_folder, fastq), "wb") as fh:
+                fh.write(content)
+            md5_lines.append(f"{hashlib.md5(content).hexdigest()}  {fastq}\n")
+    write_metadata_xlsx(
+        os.path.join(batch_folder, f"{LAB}_metadata_lab.xlsx"), sample_files
+    )
+    with open(os.path.join(batch_folder, "md5sum.txt"), "w") as fh:
+        fh.writelines(md5_lines)
+    return sample_files
+
+
+@pytest.fixture
+def download_env(tmp_path):
+    remote_root = tmp_path / "remote"
+    local_dir = tmp_path / "local"
+    remote_root.mkdir()
+    local_dir.mkdir()
+    sample_files = create_lab_folder(str(remote_root))
+    with LocalSftpServer(str(remote_root)) as server:
+        conf_file = str(tmp_path / "download_conf.json")
+        # The same file is read as yaml by download and as json by the client
+        with open(conf_file, "w") as fh:
+            json.dump(
+                {
+                    "sftp_server": server.host,
+                    "sftp_port": server.port,
+                    "sftp_user": "user",
+                    "sftp_passwd": "password",
+                    "target_folders": None,
+                    "platform_storage_folder": str(local_dir),
+                },
+                fh,
+            )
+        yield conf_file, str(local_dir), sample_files
+
+
+def run_download(conf_file, local_dir, batch_id, sync=False):
+    manager = DownloadManager(
+        conf_file=conf_file,
+        download_option="download_only",
+        output_location=local_dir,
+        subfolder="RELECOV",
+        sync=sync,
+    )
+    # Runs in the same second would share the batch folder
+    manager.batch_id = batch_id
+    manager.execute_process()
+    return os.path.join(local_dir, LAB, batch_id)
+
+
+def test_compressed_copy_is_synced(download_env, monkeypatch):
+    conf_file, local_dir, sample_files = download_env
+    first_batch = run_download(conf_file, local_dir, "20240101000000")
+    fastq = sample_files[f"{LAB}_S1"][0]
+    first_copy = os.path.join(first_batch, fastq + ".gz")
+    assert os.path.isfile(first_copy)
+    assert not os.path.exists(os.path.join(first_batch, fastq))
+    journal_path = os.path.join(local_dir, "transfer_journals", LAB + ".jsonl")
+    assert not glob.glob(os.path.join(first_batch, "transfer_journal*"))
+
+    transfers = []
+    original_get = SftpRelecov.get_from_sftp_with_hash
+
+    def counting_get(self, file, *args, **kwargs):
+        transfers.append(file)
+        return original_get(self, file, *args, **kwargs)
+
+    monkeypatch.setattr(SftpRelecov, "get_from_sftp_with_hash", counting_get)
+    second_batch = run_download(conf_file, local_dir, "20240102000000", sync=True)
+    second_copy = os.path.join(second_batch, fastq + ".gz")
+    assert transfers == []
+    assert os.stat(second_copy).st_ino == os.stat(first_copy).st_ino
+    with gzip.open(second_copy, "rb") as fh:
+        assert fh.read().startswith(b"@read_1")
+    with open(journal_path, "r") as fh:
+        records = [json.loads(line) for line in fh]
+    final_paths = {
+        record["fields"].get("final_path")
+        for record in records
+        if record["file"] == fastq
+    }
+    assert second_copy in final_paths
+    samples_file = glob.glob(os.path.join(second_batch, "samples_data_*.json"))[0]
+    with open(samples_file, "r") as fh:
+        samples_data = json.load(fh)
+    assert samples_data[f"{LAB}_S1"]["sequence_file_R1"] == fastq + ".gz"
+
+
+def test_files_are_downloaded_again_without_sync(download_env, monkeypatch):
+    conf_file, local_dir, sample_files = download_env
+    run_download(conf_file, local_dir, "20240101000000")
+    transfers = []
+    original_get = SftpRelecov.get_from_sftp_with_hash
+
+    def counting_get(self, file, *args, **kwargs):
+        transfers.append(file)
+        return original_get(self, file, *args, **kwargs)
+
+    monkeypatch.setattr(SftpRelecov, "get_from_sftp_with_hash", counting_get)
+    run_download(conf_file, local_dir, "20240102000000")
+    assert len(transfers) == 2 * len(sample_files)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""Tests for the deletion of rows in the workbook of invalid samples"""
+import logging
+import openpyxl
+import pytest
+from openpyxl.styles import Font, PatternFill
+from openpyxl.worksheet.datavalidation import DataValidation
+import relecov_tools.utils
+from relecov_tools.json_validation import SchemaValidation
+
+TAG = "Sample ID given for sequencing"
+
+
+def build_workbook(path, n_rows=30, merged_note=True):
+    """Workbook with a title block, styled cells, merged cells, data validation
+    and a second sheet, similar to the metadata templates of the labs"""
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "METADATA_LAB"
+    ws["A1"] = "Metadata template"
+    ws["A1"].font = Font(bold=True, size=14)
+    ws.merge_cells("A1:D1")
+    ws.append([])
+    ws.append(["Laboratory", TAG, "Host age", "Collection date"])
+    validation = DataValidation(type="list", formula1='"Yes,No"')
+    ws.add_data_validation(validation)
+    validation.add("E4:E100")
+    for idx in range(1, n_rows + 1):
+        row = idx + 3
+        ws.append(["COD-1", f"sample_{idx}", idx * 2, f"2024-01-{idx % 28 + 1:02d}"])
+        if idx % 3 == 0:
+            ws.cell(row=row, column=2).fill = PatternFill("solid", fgColor="FFFF00")
+        if idx % 5 == 0:
+            ws.cell(row=row, column=7, value=f"note {idx}").font = Font(italic=True)
+    if merged_note:
+        # Not moved by openpyxl when rows are deleted, neither by delete_rows
+        ws.merge_cells("F10:G10")
+    wb.create_sheet("OVERVIEW")["A1"] = "Other sheet"
+    wb.save(path)
+    return path
+
+
+def sheet_content(ws):
+    """Values and styles of the cells with content or style, merged ranges
+    and data validations of the sheet"""
+    cells = {
+        cell.coordinate: (cell.value, tuple(cell._style))
+        for row in ws.iter_rows()
+        for cell in row
+        if cell.value is not None or cell.has_style
+    }
+    merged = sorted(str(rng) for rng in ws.merged_cells.ranges)
+    validations = sorted(str(dv.sqref) for dv in ws.data_validations.dataValidation)
+    return cells, merged, validations, ws.max_row
+
+
+@pytest.mark.parametrize(
+    "rows_to_delete",
+    [[5], [4, 5, 6], [4, 9, 10, 20, 33], list(range(4, 34, 2)), list(range(1, 34))],
+)
+def test_same_result_as_deleting_each_row(tmp_path, rows_to_delete):
+    path = build_workbook(str(tmp_path / "metadata.xlsx"))
+    expected_wb = openpyxl.load_workbook(path)
+    expected = expected_wb["METADATA_LAB"]
+    for row in sorted(rows_to_delete, reverse=True):
+        expected.delete_rows(row)
+    result_wb = openpyxl.load_workbook(path)
+    result = result_wb["METADATA_LAB"]
+    relecov_tools.utils.delete_excel_rows(result, rows_to_delete)
+    assert sheet_content(result) == sheet_content(expected)
+    assert result._current_row == expected._current_row
+    # Also once saved and loaded again
+    expected_wb.save(tmp_path / "expected.xlsx")
+    result_wb.save(tmp_path / "result.xlsx")
+    expected = openpyxl.load_workbook(tmp_path / "expected.xlsx")
+    result = openpyxl.load_workbook(tmp_path / "result.xlsx")
+    for sheet in ("METADATA_LAB", "OVERVIEW"):
+        assert sheet_content(result[sheet]) == sheet_content(expected[sheet])
+
+
+def test_invalid_workbook_keeps_header_and_invalid_samples(tmp_path):
+    metadata = build_workbook(
+        str(tmp_path / "metadata.xlsx"), n_rows=10, merged_note=False
+    )
+    wb = openpyxl.load_workbook(metadata)
+    ws = wb["METADATA_LAB"]
+    # Rows without sample ID between invalid samples
+    ws.insert_rows(8)
+    ws.cell(row=8, column=1, value="COD-1")
+    ws.insert_rows(10)
+    wb.save(metadata)
+    validation = SchemaValidation.__new__(SchemaValidation)
+    validation.log = logging.getLogger(__name__)
+    validation.sample_id_field = "sequencing_sample_id"
+    validation.excel_sheet = "METADATA_LAB"
+    invalid_json = [
+        {"sequencing_sample_id": sample}
+        for sample in ("sample_4", "sample_5", "sample_6", "sample_10")
+    ]
+    out_folder = str(tmp_path / "invalid")
+    validation.create_invalid_metadata(invalid_json, metadata, out_folder)
+    ws = openpyxl.load_workbook(tmp_path / "invalid" / "invalid_metadata.xlsx")[
+        "METADATA_LAB"
+    ]
+    rows = [[cell.value for cell in row[:2]] for row in ws.iter_rows()]
+    assert rows == [
+        ["Metadata template", None],
+        [None, None],
+        ["Laboratory", TAG],
+        ["COD-1", "sample_4"],
+        ["COD-1", "sample_5"],
+        ["COD-1", "sample_6"],
+        ["COD-1", "sample_10"],
+    ]
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""Tests for the persistent md5 cache and the parallel md5 calculation"""
+import hashlib
+import os
+import pytest
+from pathlib import Path
+import relecov_tools.utils
+from relecov_tools.utils import HashCache
+
+
+@pytest.fixture
+def hash_cache(tmp_path, monkeypatch):
+    cache = HashCache(str(tmp_path / "cache" / "hash_cache.db"))
+    monkeypatch.setattr(relecov_tools.utils, "_hash_cache", cache)
+    return cache
+
+
+def write_file(path, content):
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_stored_hash_is_returned(tmp_path, hash_cache):
+    file_name = write_file(tmp_path / "sample.fastq.gz", b"ACGT" * 100)
+    assert hash_cache.get(file_name) is None
+    hash_cache.store(file_name, "cached_md5")
+    assert hash_cache.get(file_name) == "cached_md5"
+    assert HashCache(hash_cache.cache_path).get(file_name) == "cached_md5"
+
+
+def test_modified_file_is_not_taken_from_cache(tmp_path, hash_cache):
+    file_name = write_file(tmp_path / "sample.fastq.gz", b"ACGT" * 100)
+    hash_cache.store(file_name, "cached_md5")
+    write_file(tmp_path / "sample.fastq.gz", b"ACGT" * 101)
+    assert hash_cache.get(file_name) is None
+
+
+def test_hash_is_not_stored_if_file_changed_while_hashed(tmp_path, hash_cache):
+    file_name = write_file(tmp_path / "sample.fastq.gz", b"ACGT" * 100)
+    file_key = HashCache.file_key(file_name)
+    write_file(tmp_path / "sample.fastq.gz", b"ACGT" * 101)
+    hash_cache.store(file_name, "stale_md5", file_key)
+    assert hash_cache.get(file_name) is None
+
+
+def test_disabled_cache_does_not_create_files(tmp_path):
+    file_name = write_file(tmp_path / "sample.fastq.gz", b"ACGT" * 100)
+    hash_cache = HashCache("")
+    assert hash_cache.connection is None
+    hash_cache.store(file_name, "cached_md5")
+    assert hash_cache.get(file_name) is None
+    assert os.listdir(tmp_path) == ["sample.fastq.gz"]
+
+
+def test_md5_batch_matches_hashlib(tmp_path, hash_cache):
+    contents = {
+        write_file(tmp_path / f"file_{idx}.fastq", os.urandom(idx * 70000)): idx
+        for idx in range(6)
+    }
+    expected = {
+        file_name: hashlib.md5(Path(file_name).read_bytes()).hexdigest()
+        for file_name in contents
+    }
+    assert relecov_tools.utils.calculate_md5_batch(contents, max_workers=3) == expected
+    # Second call is served from the cache without reading the files
+    read_bytes = [
+        relecov_tools.utils.calculate_md5(file_name, return_read_bytes=True)[1]
+        for file_name in contents
+    ]
+    assert read_bytes == [0] * len(contents)
+    assert relecov_tools.utils.calculate_md5_batch(contents) == expected
+
+
+def test_md5_batch_ignores_missing_files(tmp_path, hash_cache):
+    file_name = write_file(tmp_path / "sample.fastq", b"ACGT")
+    missing = str(tmp_path / "missing.fastq")
+    with pytest.raises(OSError):
+        relecov_tools.utils.calculate_md5_batch([file_name, missing])
+    md5_results = relecov_tools.utils.calculate_md5_batch(
+        [file_name, missing], ignore_errors=True
+    )
+    assert md5_results == {file_name: hashlib.md5(b"ACGT").hexdigest(), missing: None}
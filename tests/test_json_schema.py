@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+"""Tests for the compiled schema shared by the modules of a process"""
+import json
+import os
+import relecov_tools.json_schema
+from relecov_tools.config_json import ConfigJson
+
+SCHEMA_DIR = os.path.join(os.path.dirname(relecov_tools.__file__), "schema")
+
+
+def write_schema(path, title):
+    schema = {
+        "title": title,
+        "required": ["sample_id"],
+        "properties": {
+            "sample_id": {"label": "Sample ID", "type": "string"},
+            "sample_date": {"label": "Date", "type": "string", "format": "date"},
+        },
+    }
+    path.write_text(json.dumps(schema))
+    return str(path)
+
+
+def test_schema_is_compiled_once_per_process():
+    schema_file = os.path.join(
+        SCHEMA_DIR, ConfigJson().get_topic_data("json_schemas", "relecov_schema")
+    )
+    compiled = relecov_tools.json_schema.load_compiled_schema(schema_file)
+    assert relecov_tools.json_schema.load_compiled_schema(schema_file) is compiled
+    assert compiled.get_property(compiled.get_label("sequencing_date")) == (
+        "sequencing_date"
+    )
+
+
+def test_schema_copies_do_not_change_shared_schema(tmp_path):
+    schema_file = write_schema(tmp_path / "schema.json", "Test")
+    compiled = relecov_tools.json_schema.load_compiled_schema(schema_file)
+    schema_copy = compiled.get_schema()
+    schema_copy["properties"]["sample_id"]["label"] = "Changed"
+    del schema_copy["required"]
+    assert compiled.schema["properties"]["sample_id"]["label"] == "Sample ID"
+    assert compiled.schema["required"] == ["sample_id"]
+    assert compiled.date_fields == {"sample_date"}
+
+
+def test_modified_schema_is_compiled_again(tmp_path):
+    schema_path = tmp_path / "schema.json"
+    compiled = relecov_tools.json_schema.load_compiled_schema(
+        write_schema(schema_path, "First")
+    )
+    write_schema(schema_path, "Second version")
+    reloaded = relecov_tools.json_schema.load_compiled_schema(str(schema_path))
+    assert compiled.schema["title"] == "First"
+    assert reloaded.schema["title"] == "Second version"
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""Tests for the conversion of lab metadata columns to the schema types"""
+import os
+from datetime import datetime
+import pytest
+import relecov_tools.json_schema
+from relecov_tools.config_json import ConfigJson
+from relecov_tools.read_lab_metadata import RelecovMetadata
+
+
+@pytest.fixture(scope="module")
+def lab_metadata():
+    """RelecovMetadata with only the schema lookups used to convert columns"""
+    schema_file = os.path.join(
+        os.path.dirname(relecov_tools.json_schema.__file__),
+        "schema",
+        ConfigJson().get_topic_data("json_schemas", "relecov_schema"),
+    )
+    metadata = RelecovMetadata.__new__(RelecovMetadata)
+    metadata.relecov_schema = relecov_tools.json_schema.load_compiled_schema(
+        schema_file
+    )
+    metadata.label_prop_dict = metadata.relecov_schema.label_to_property
+    return metadata
+
+
+def test_date_column_values_are_kept_as_given(lab_metadata):
+    values = [
+        datetime(2024, 1, 8),
+        datetime(1970, 1, 1, 1, 0, 25, 569000),
+        "2024/02/03 10:00",
+        2021,
+        "garbage",
+        None,
+        "Not Provided [SNOMED:434941000124101]",
+        datetime(2024, 1, 8),
+    ]
+    schema_key, converted = lab_metadata.convert_metadata_column(
+        "Sequencing Date", values
+    )
+    assert schema_key == "sequencing_date"
+    assert converted == [
+        ("2024-01-08 00:00:00", None, None),
+        ("1970-01-01 01:00:25.569000", None, None),
+        ("2024/02/03 10:00", None, None),
+        ("2021", "year", None),
+        (None, "invalid_date", "Invalid date format in Sequencing Date: garbage"),
+        (None, "not_provided", None),
+        (None, "not_provided", None),
+        ("2024-01-08 00:00:00", None, None),
+    ]
+
+
+def test_non_date_columns_are_cast_to_schema_type(lab_metadata):
+    schema_key, converted = lab_metadata.convert_metadata_column(
+        "Host Age Years", [45, 45.0, "45", "abc", datetime(2024, 1, 8)]
+    )
+    assert schema_key == "host_age_years"
+    assert converted[:4] == [
+        (45, None, None),
+        (45, None, None),
+        (45, None, None),
+        ("abc", None, None),
+    ]
+    assert converted[4] == (
+        "2024-01-08 00:00:00",
+        "date_as_number",
+        "Non-date field Host Age Years provided as date. Parsed as int",
+    )
+
+
+def test_equal_values_of_different_types_are_not_mixed(lab_metadata):
+    _, converted = lab_metadata.convert_metadata_column(
+        "Sample ID given for sequencing", [1, 1.0, True, "1"]
+    )
+    assert [value for value, _, _ in converted] == ["1", "1.0", "True", "1"]
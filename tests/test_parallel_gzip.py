@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+"""Tests for the block-parallel gzip writer"""
+import gzip
+import io
+import os
+import zlib
+import pytest
+import relecov_tools.utils
+
+
+@pytest.mark.parametrize(
+    "size, blocksize, threads",
+    [(0, 1024, 2), (1000, 1024, 2), (100000, 1024, 4), (300000, 65536, 1)],
+)
+def test_output_is_a_single_valid_member(size, blocksize, threads):
+    # Repeated content so blocks depend on the dictionary of the previous one
+    content = (os.urandom(500) * (size // 500 + 1))[:size]
+    out_fh = io.BytesIO()
+    isize = relecov_tools.utils.write_parallel_gzip(
+        io.BytesIO(content), out_fh, threads=threads, blocksize=blocksize
+    )
+    compressed = out_fh.getvalue()
+    assert isize == size
+    assert gzip.decompress(compressed) == content
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    assert decompressor.decompress(compressed) == content
+    assert decompressor.eof and decompressor.unused_data == b""
+    if size > 10000:
+        assert len(compressed) < size / 2
+
+
+def test_compressed_file_keeps_original_name(tmp_path):
+    fastq = tmp_path / "sample_R1.fastq"
+    content = b"@read\nACGT\n+\nIIII\n" * 100000
+    fastq.write_bytes(content)
+    assert relecov_tools.utils.compress_file(str(fastq), threads=3)
+    compressed = (tmp_path / "sample_R1.fastq.gz").read_bytes()
+    assert compressed[3] & 0x08
+    assert compressed[10:].startswith(b"sample_R1.fastq\x00")
+    with gzip.open(tmp_path / "sample_R1.fastq.gz", "rb") as fh:
+        assert fh.read() == content
+    assert not relecov_tools.utils.compress_file(str(tmp_path / "missing.fastq"))
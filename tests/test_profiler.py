@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+"""Tests for the resources reported for each step by the stage profiler"""
+import sys
+import pytest
+from relecov_tools.profiler import StageProfiler
+
+MB = 1048576
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="Needs /proc")
+def test_rss_growth_is_measured_per_stage():
+    profiler = StageProfiler("test")
+    kept = []
+    with profiler.stage("allocate"):
+        kept.append(bytearray(64 * MB))
+    with profiler.stage("small"):
+        kept.append(bytearray(1024))
+    summary = profiler.summary()
+    stages = summary["stages"]
+    assert stages["allocate"]["max_rss_delta"] >= 32 * MB
+    # A later step does not inherit the memory of the previous one
+    assert stages["small"]["max_rss_delta"] < 32 * MB
+    assert "peak_rss" not in stages["small"]
+    assert summary["total"]["peak_rss"] >= 64 * MB
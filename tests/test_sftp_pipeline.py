@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""Tests for remote operations sent as pipelined sftp requests"""
+import pytest
+from relecov_tools.sftp_client import SftpRelecov
+
+from sftp_server import LocalSftpServer
+
+
+@pytest.fixture(params=[True, False], ids=["pipelined", "sequential"])
+def sftp_session(request, tmp_path, monkeypatch):
+    """Session using pipelined requests and one emulating a paramiko version
+    without the private methods needed for them
+    """
+    if not request.param:
+        monkeypatch.setattr(SftpRelecov, "pipeline_methods", ("_missing_method",))
+    root = tmp_path / "remote"
+    for folder in ("lab_1", "lab_2", "lab_2/batch", "empty"):
+        (root / folder).mkdir(parents=True)
+    for file_name in ("lab_1/a.fastq.gz", "lab_1/b.fastq.gz", "lab_2/c.fastq.gz"):
+        (root / file_name).write_bytes(b"ACGT" * 10)
+    with LocalSftpServer(str(root)) as server:
+        conf_file = server.write_config(str(tmp_path / "sftp_conf.json"))
+        relecov_sftp = SftpRelecov(conf_file, "user", "password")
+        relecov_sftp.open_connection()
+        yield root, relecov_sftp
+        relecov_sftp.close_connection()
+
+
+def test_folders_are_listed(sftp_session):
+    _, relecov_sftp = sftp_session
+    listings = relecov_sftp.listdir_attr_many(["lab_1", "lab_2", "empty"])
+    names = {
+        folder: sorted(attr.filename for attr in attrs)
+        for folder, attrs in listings.items()
+    }
+    assert names == {
+        "lab_1": ["a.fastq.gz", "b.fastq.gz"],
+        "lab_2": ["batch", "c.fastq.gz"],
+        "empty": [],
+    }
+    assert {attr.st_size for attr in listings["lab_1"]} == {40}
+
+
+def test_missing_folder_is_not_listed(sftp_session):
+    _, relecov_sftp = sftp_session
+    with pytest.raises(IOError):
+        relecov_sftp.listdir_attr_many(["lab_1", "missing"])
+
+
+def test_files_are_renamed_and_removed(sftp_session):
+    root, relecov_sftp = sftp_session
+    errors = relecov_sftp.rename_files(
+        [
+            ("lab_1/a.fastq.gz", "lab_2/a.fastq.gz"),
+            ("lab_1/missing.fastq.gz", "lab_2/missing.fastq.gz"),
+        ]
+    )
+    assert list(errors) == ["lab_1/missing.fastq.gz"]
+    assert (root / "lab_2" / "a.fastq.gz").is_file()
+    assert not (root / "lab_1" / "a.fastq.gz").exists()
+
+    errors = relecov_sftp.remove_files(["lab_1/b.fastq.gz", "lab_1/missing.fastq.gz"])
+    assert list(errors) == ["lab_1/missing.fastq.gz"]
+    assert not (root / "lab_1" / "b.fastq.gz").exists()
+    errors = relecov_sftp.remove_files(["lab_1", "empty"], directories=True)
+    assert errors == {}
+    assert sorted(path.name for path in root.iterdir()) == ["lab_2"]
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""Tests for the reuse of sftp sessions between folders"""
+import pytest
+from relecov_tools.sftp_client import SftpRelecov
+
+from sftp_server import LocalSftpServer
+
+
+@pytest.fixture
+def sftp_conf(tmp_path):
+    root = tmp_path / "remote"
+    root.mkdir()
+    with LocalSftpServer(str(root)) as server:
+        yield server.write_config(str(tmp_path / "sftp_conf.json"))
+
+
+def test_open_session_is_reused(sftp_conf):
+    relecov_sftp = SftpRelecov(sftp_conf, "user", "password")
+    assert not relecov_sftp.is_connected()
+    assert relecov_sftp.ensure_connection()
+    transport = relecov_sftp.client.get_transport()
+    generation = relecov_sftp.connection_generation
+    assert relecov_sftp.ensure_connection()
+    assert relecov_sftp.client.get_transport() is transport
+    assert relecov_sftp.connection_generation == generation
+    relecov_sftp.close_connection()
+
+
+def test_lost_session_is_reopened(sftp_conf):
+    relecov_sftp = SftpRelecov(sftp_conf, "user", "password")
+    relecov_sftp.open_connection()
+    generation = relecov_sftp.connection_generation
+    relecov_sftp.client.get_transport().close()
+    assert not relecov_sftp.is_connected()
+    assert relecov_sftp.ensure_connection()
+    assert relecov_sftp.is_connected()
+    assert relecov_sftp.connection_generation == generation + 1
+    assert relecov_sftp.list_remote_folders(".") is not None
+    relecov_sftp.close_connection()
+
+
+def test_pooled_sessions_are_opened_once(sftp_conf):
+    relecov_sftp = SftpRelecov(sftp_conf, "user", "password")
+    session = relecov_sftp.new_session()
+    session.open_connection()
+    transport = session.client.get_transport()
+    for _ in range(3):
+        session.ensure_connection()
+    assert session.client.get_transport() is transport
+    assert session.connection_generation == 1
+    session.close_connection()
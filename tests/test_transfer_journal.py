@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+"""Tests for the transfer journal used to resume and sync downloads"""
+import json
+import os
+import types
+import pytest
+from relecov_tools.sftp_client import SftpRelecov, TransferJournal
+
+from sftp_server import LocalSftpServer
+
+
+def remote_attr(size, mtime=1000):
+    return types.SimpleNamespace(st_size=size, st_mtime=mtime)
+
+
+def read_records(journal_path):
+    with open(journal_path, "r") as fh:
+        return [json.loads(line) for line in fh]
+
+
+def test_updates_are_appended(tmp_path):
+    journal_path = str(tmp_path / "journals" / "COD-1.jsonl")
+    local_file = str(tmp_path / "batch" / "sample_R1.fastq.gz")
+    journal = TransferJournal(journal_path)
+    journal.resume_offset(local_file, "/remote/sample_R1.fastq.gz", remote_attr(300))
+    with open(journal_path, "rb") as fh:
+        first_line = fh.readline()
+    for committed in (100, 200, 300):
+        journal.update_entry(local_file, committed=committed)
+    records = read_records(journal_path)
+    assert len(records) == 4
+    with open(journal_path, "rb") as fh:
+        assert fh.readline() == first_line
+    assert journal.get_entry(local_file)["committed"] == 300
+
+
+def test_entries_are_replayed(tmp_path):
+    journal_path = str(tmp_path / "COD-1.jsonl")
+    kept = str(tmp_path / "batch" / "kept.fastq.gz")
+    removed = str(tmp_path / "batch" / "removed.fastq.gz")
+    journal = TransferJournal(journal_path)
+    journal.resume_offset(kept, "/remote/kept.fastq.gz", remote_attr(10))
+    journal.update_entry(kept, committed=5)
+    journal.resume_offset(removed, "/remote/removed.fastq.gz", remote_attr(10))
+    journal.remove_entry(removed)
+    reloaded = TransferJournal(journal_path)
+    assert reloaded.entries == journal.entries
+    assert reloaded.get_entry(kept)["committed"] == 5
+    assert reloaded.get_entry(removed) is None
+
+
+def test_cut_line_is_discarded_and_compacted(tmp_path):
+    journal_path = str(tmp_path / "COD-1.jsonl")
+    local_file = str(tmp_path / "batch" / "sample.fastq.gz")
+    journal = TransferJournal(journal_path)
+    journal.resume_offset(local_file, "/remote/sample.fastq.gz", remote_attr(10))
+    with open(journal_path, "a") as fh:
+        fh.write('{"file": "sample.fastq.gz", "op": "upd')
+    reloaded = TransferJournal(journal_path)
+    assert reloaded.get_entry(local_file)["committed"] == 0
+    assert len(read_records(journal_path)) == 1
+
+
+def test_journal_is_compacted_when_reopened(tmp_path):
+    journal_path = str(tmp_path / "COD-1.jsonl")
+    local_file = str(tmp_path / "batch" / "sample.fastq.gz")
+    journal = TransferJournal(journal_path)
+    journal.resume_offset(local_file, "/remote/sample.fastq.gz", remote_attr(100))
+    for committed in range(1, 11):
+        journal.update_entry(local_file, committed=committed)
+    reloaded = TransferJournal(journal_path)
+    assert len(read_records(journal_path)) == 1
+    assert reloaded.get_entry(local_file) == journal.get_entry(local_file)
+
+
+def test_partial_file_from_previous_run_is_resumed(tmp_path):
+    journal_path = str(tmp_path / "journals" / "COD-1.jsonl")
+    old_file = tmp_path / "COD-1" / "20240101000000" / "sample.fastq.gz"
+    new_file = tmp_path / "COD-1" / "20240102000000" / "sample.fastq.gz"
+    old_file.parent.mkdir(parents=True)
+    new_file.parent.mkdir(parents=True)
+    old_file.write_bytes(b"a" * 60)
+    journal = TransferJournal(journal_path)
+    journal.resume_offset(str(old_file), "/remote/sample.fastq.gz", remote_attr(100))
+    journal.update_entry(str(old_file), committed=50)
+
+    next_run = TransferJournal(journal_path)
+    offset = next_run.resume_offset(
+        str(new_file), "/remote/sample.fastq.gz", remote_attr(100)
+    )
+    assert offset == 50
+    assert new_file.read_bytes() == b"a" * 60
+    assert not old_file.exists()
+    assert next_run.get_entry(str(new_file))["local_path"] == str(new_file)
+
+
+def test_partial_file_is_not_resumed_if_remote_changed(tmp_path):
+    journal_path = str(tmp_path / "COD-1.jsonl")
+    old_file = tmp_path / "old" / "sample.fastq.gz"
+    new_file = tmp_path / "new" / "sample.fastq.gz"
+    old_file.parent.mkdir()
+    new_file.parent.mkdir()
+    old_file.write_bytes(b"a" * 60)
+    journal = TransferJournal(journal_path)
+    journal.resume_offset(str(old_file), "/remote/sample.fastq.gz", remote_attr(100))
+    journal.update_entry(str(old_file), committed=50)
+    offset = journal.resume_offset(
+        str(new_file), "/remote/sample.fastq.gz", remote_attr(100, mtime=2000)
+    )
+    assert offset == 0
+    assert old_file.exists()
+
+
+def test_completed_copy_is_synced_until_modified(tmp_path):
+    journal = TransferJournal(str(tmp_path / "COD-1.jsonl"))
+    local_file = tmp_path / "sample.fastq.gz"
+    local_file.write_bytes(b"a" * 10)
+    journal.resume_offset(str(local_file), "/remote/sample.fastq.gz", remote_attr(10))
+    journal.mark_complete(str(local_file), "md5")
+    assert journal.is_complete(str(local_file), remote_attr(10))
+    assert not journal.is_complete(str(local_file), remote_attr(11))
+    assert not journal.is_complete(str(tmp_path / "other" / "sample.fastq.gz"))
+    local_file.write_bytes(b"a" * 12)
+    assert not journal.is_complete(str(local_file))
+
+
+@pytest.fixture
+def sftp_server(tmp_path):
+    root = tmp_path / "remote"
+    root.mkdir()
+    with LocalSftpServer(str(root)) as server:
+        conf_file = server.write_config(str(tmp_path / "sftp_conf.json"))
+        relecov_sftp = SftpRelecov(conf_file, "user", "password")
+        relecov_sftp.open_connection()
+        yield root, relecov_sftp
+        relecov_sftp.close_connection()
+
+
+def test_download_resumes_partial_file_of_previous_run(tmp_path, sftp_server):
+    root, relecov_sftp = sftp_server
+    content = os.urandom(300000)
+    (root / "sample.fastq.gz").write_bytes(content)
+    remote_stat = os.stat(root / "sample.fastq.gz")
+    journal_path = str(tmp_path / "journals" / "COD-1.jsonl")
+    old_file = tmp_path / "COD-1" / "run1" / "sample.fastq.gz"
+    new_file = tmp_path / "COD-1" / "run2" / "sample.fastq.gz"
+    old_file.parent.mkdir(parents=True)
+    new_file.parent.mkdir(parents=True)
+    # Interrupted download: first bytes written and committed, rest missing
+    old_file.write_bytes(content[:100000])
+    journal = TransferJournal(journal_path)
+    journal.resume_offset(
+        str(old_file),
+        "/sample.fastq.gz",
+        remote_attr(remote_stat.st_size, int(remote_stat.st_mtime)),
+    )
+    journal.update_entry(str(old_file), committed=100000)
+
+    transfer_info = relecov_sftp.get_from_sftp_with_hash(
+        "/sample.fastq.gz", str(new_file), journal=TransferJournal(journal_path)
+    )
+    assert transfer_info["size"] == len(content)
+    assert new_file.read_bytes() == content
+    assert not old_file.exists()
+    assert TransferJournal(journal_path).is_complete(str(new_file))
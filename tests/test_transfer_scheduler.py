@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""Tests for the planning of transfers and the disk admission of downloads"""
+import collections
+import threading
+import time
+from relecov_tools.download_manager import DiskAdmission, TransferScheduler
+
+MB = 1048576
+DiskUsage = collections.namedtuple("DiskUsage", ["total", "used", "free"])
+
+
+def test_folders_are_planned_round_robin_across_labs():
+    scheduler = TransferScheduler(4, 2, stream_speed=1)
+    folder_sizes = {
+        "lab_a/batch_1": {"a1.fastq.gz": 10 * MB, "a2.fastq.gz": 30 * MB},
+        "lab_a/batch_2": {"a3.fastq.gz": 50 * MB},
+        "lab_b/batch_1": {"b1.fastq.gz": 5 * MB},
+        "lab_c/batch_1": {"c1.fastq.gz": 20 * MB},
+    }
+    folder_order, lab_plans = scheduler.plan(folder_sizes)
+    assert folder_order == [
+        "lab_a/batch_2",
+        "lab_c/batch_1",
+        "lab_b/batch_1",
+        "lab_a/batch_1",
+    ]
+    assert lab_plans["lab_a"]["total_bytes"] == 90 * MB
+    assert lab_plans["lab_b"]["position"] == 3
+    assert scheduler.order_files("lab_a/batch_1", ["a1.fastq.gz", "a2.fastq.gz"]) == [
+        "a2.fastq.gz",
+        "a1.fastq.gz",
+    ]
+
+
+def test_deferred_labs_are_planned_first():
+    scheduler = TransferScheduler(4, 2, stream_speed=1)
+    folder_sizes = {
+        "lab_a/batch_1": {"a1.fastq.gz": 50 * MB},
+        "lab_b/batch_1": {"b1.fastq.gz": 5 * MB},
+    }
+    folder_order, _ = scheduler.plan(folder_sizes, priority_labs=["lab_b"])
+    assert folder_order == ["lab_b/batch_1", "lab_a/batch_1"]
+
+
+def test_simulation_respects_transfer_limits():
+    scheduler = TransferScheduler(2, 1, stream_speed=1)
+    finish_seconds = scheduler.simulate(
+        [("lab_a", 10 * MB), ("lab_a", 10 * MB), ("lab_b", 5 * MB)]
+    )
+    # One transfer per lab at once: lab_a files are sequential
+    assert finish_seconds == {"lab_a": 20.0, "lab_b": 5.0}
+
+
+def test_transfer_slots_limit_concurrency():
+    scheduler = TransferScheduler(3, 2, stream_speed=1)
+    running = collections.Counter()
+    peaks = collections.Counter()
+    lock = threading.Lock()
+
+    def transfer(folder):
+        with scheduler.transfer_slot(folder):
+            lab = scheduler.get_lab(folder)
+            with lock:
+                running[lab] += 1
+                running["total"] += 1
+                peaks[lab] = max(peaks[lab], running[lab])
+                peaks["total"] = max(peaks["total"], running["total"])
+            time.sleep(0.02)
+            with lock:
+                running[lab] -= 1
+                running["total"] -= 1
+
+    threads = [
+        threading.Thread(target=transfer, args=(f"lab_{lab}/batch",))
+        for lab in "aaaaabbbbb"
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peaks["lab_a"] <= 2 and peaks["lab_b"] <= 2
+    assert peaks["total"] == 3
+
+
+def fake_disk(monkeypatch, total, used):
+    monkeypatch.setattr(
+        "relecov_tools.download_manager.shutil.disk_usage",
+        lambda path: DiskUsage(total, used, total - used),
+    )
+
+
+def test_required_bytes_include_compression_headroom(tmp_path):
+    admission = DiskAdmission(str(tmp_path), 0.9, 0.5)
+    required = admission.required_bytes(
+        {"a.fastq.gz": 100, "b.bam": 100, "c.fastq": 100}
+    )
+    assert required == 350
+
+
+def test_folder_that_never_fits_is_deferred(tmp_path, monkeypatch):
+    fake_disk(monkeypatch, total=1000, used=500)
+    admission = DiskAdmission(str(tmp_path), 0.9, 0.5)
+    assert not admission.admit("lab_a/batch_1", 401)
+    assert admission.admit("lab_a/batch_1", 400)
+    assert admission.reserved == {"lab_a/batch_1": 400}
+
+
+def test_admission_waits_for_reserved_space(tmp_path, monkeypatch):
+    fake_disk(monkeypatch, total=1000, used=0)
+    admission = DiskAdmission(str(tmp_path), 0.9, 0.5)
+    assert admission.admit("lab_a/batch_1", 600)
+    admitted = []
+    waiting = threading.Thread(
+        target=lambda: admitted.append(admission.admit("lab_b/batch_1", 600))
+    )
+    waiting.start()
+    time.sleep(0.05)
+    # Reservations of concurrent folders cannot overcommit the disk
+    assert admitted == []
+    admission.release("lab_a/batch_1")
+    waiting.join(timeout=5)
+    assert admitted == [True]
+    assert admission.reserved == {"lab_b/batch_1": 600}
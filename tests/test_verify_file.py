@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""Tests for the single pass verification of downloaded files"""
+import gzip
+import hashlib
+import pytest
+import relecov_tools.utils
+from relecov_tools.utils import HashCache, verify_file, verify_files
+
+
+@pytest.fixture(autouse=True)
+def no_hash_cache(monkeypatch):
+    monkeypatch.setattr(relecov_tools.utils, "_hash_cache", HashCache(""))
+
+
+def fastq_content(reads, length=150):
+    records = [
+        f"@read_{idx}\n{'ACGT' * (length // 4)}\n+\n{'I' * (length // 4 * 4)}\n"
+        for idx in range(reads)
+    ]
+    return "".join(records).encode()
+
+
+def test_plain_fastq_is_hashed_and_counted(tmp_path):
+    # Larger than one read chunk so records are split between chunks
+    content = fastq_content(120000)
+    fastq = tmp_path / "sample_R1.fastq"
+    fastq.write_bytes(content)
+    results = verify_file(str(fastq), fastq_stats=True)
+    assert results == {
+        "md5": hashlib.md5(content).hexdigest(),
+        "gzip_valid": None,
+        "reads": 120000,
+        "bases": 120000 * 148,
+    }
+
+
+def test_gzip_members_are_validated(tmp_path):
+    content = fastq_content(1000)
+    fastq_gz = tmp_path / "sample_R1.fastq.gz"
+    # Concatenated members as written by parallel compressors
+    fastq_gz.write_bytes(gzip.compress(content[:5000]) + gzip.compress(content[5000:]))
+    results = verify_file(str(fastq_gz), fastq_stats=True)
+    assert results["gzip_valid"] is True
+    assert results["md5"] == hashlib.md5(fastq_gz.read_bytes()).hexdigest()
+    assert (results["reads"], results["bases"]) == (1000, 1000 * 148)
+
+
+def test_truncated_and_corrupted_gzip_are_invalid(tmp_path):
+    compressed = gzip.compress(fastq_content(1000))
+    truncated = tmp_path / "truncated.fastq.gz"
+    truncated.write_bytes(compressed[: len(compressed) // 2])
+    corrupted = tmp_path / "corrupted.fastq.gz"
+    corrupted.write_bytes(compressed[:-8] + b"\x00" * 8)
+    for gz_file in (truncated, corrupted):
+        results = verify_file(str(gz_file), fastq_stats=True)
+        assert results["gzip_valid"] is False
+        assert results["reads"] is None
+
+
+def test_checks_can_be_skipped(tmp_path):
+    fastq_gz = tmp_path / "sample_R1.fastq.gz"
+    fastq_gz.write_bytes(gzip.compress(fastq_content(10)))
+    results = verify_file(str(fastq_gz), md5=False, gzip_check=False)
+    assert results == {"md5": None, "gzip_valid": None, "reads": None, "bases": None}
+
+
+def test_files_are_verified_with_their_options(tmp_path):
+    fastq = tmp_path / "sample_R1.fastq"
+    fastq.write_bytes(fastq_content(10))
+    metadata = tmp_path / "metadata_lab.xlsx"
+    metadata.write_bytes(b"PK\x03\x04")
+    results = verify_files(
+        [str(fastq), str(metadata)],
+        max_workers=2,
+        file_options={str(fastq): {"fastq_stats": True}},
+    )
+    assert results[str(fastq)]["reads"] == 10
+    assert results[str(metadata)]["reads"] is None
+    assert results[str(metadata)]["md5"] == hashlib.md5(b"PK\x03\x04").hexdigest()